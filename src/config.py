@@ -3,6 +3,7 @@ import os
 # --- 配置与常量定义 ---
 CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".heal_jimaku_gui")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+LLM_CACHE_DB_FILE = os.path.join(CONFIG_DIR, "llm_cache.sqlite3") # LLM响应缓存数据库
 DEEPSEEK_MODEL = "deepseek-chat"
 
 # SRT 生成常量
@@ -23,6 +24,35 @@ ELLIPSIS_PUNCTUATION = {'...', '......', '‥'}
 COMMA_PUNCTUATION = {',', '、', '，'}
 ALL_SPLIT_PUNCTUATION = FINAL_PUNCTUATION | ELLIPSIS_PUNCTUATION | COMMA_PUNCTUATION
 
+# --- 分割方式 ---
+USER_SEGMENTATION_MODE_KEY = "user_segmentation_mode"
+SEGMENTATION_MODES = {
+    "llm": "LLM 智能分割",
+    "rules": "本地规则分割 (离线)", # core.rule_segmenter，无需API，适合批量出草稿
+    "llm_offsets": "LLM 断点索引 (免对齐)", # core.boundary_offsets，模型只返回断点词编号
+}
+DEFAULT_SEGMENTATION_MODE = "llm"
+
+# 本地规则分割器: 附加情景括号、各语言的引号、句首语气词
+RULE_SEGMENTER_BRACKET_PAIRS = {"(": ")", "（": "）"}
+RULE_SEGMENTER_QUOTE_PAIRS = {
+    "ja": {"「": "」", "『": "』"},
+    "zh": {"“": "”", "‘": "’", "「": "」", "『": "』", "【": "】"},
+    "en": {"\"": "\"", "“": "”"},
+}
+# 句首语气词: 只有后面紧跟停顿 (日/中为 、，, 或拖长的 ー/…，英语为逗号) 时才单独成段，
+# あの/その/这个/那个 等指示词常与后文构成完整短语，不列入
+RULE_SEGMENTER_FILLERS = {
+    "ja": ["あのー", "えーと", "ええと", "えっと", "えー", "ええ", "えへへ", "うーん", "うん", "まあ", "まぁ", "なんか", "ほら", "はい", "いや", "おお", "へえ", "ふーん"],
+    "zh": ["嗯", "呃", "啊", "哦", "噢", "唉", "哎", "就是说", "然后呢"],
+    "en": ["um", "uh", "er", "erm", "hmm", "well", "so", "oh", "ah", "like", "you know", "i mean", "okay", "ok"],
+}
+RULE_SEGMENTER_MIN_ELLIPSIS_SEGMENT_CHARS = {"ja": 15, "zh": 15, "en": 40} # 片段短于此长度时不在省略号处断开
+
+# --- 提示词语言检测 (core.language_resolver) ---
+LANGUAGE_DETECT_SAMPLE_CHARS = 2000 # 长文本只取这么多字符的样本做检测
+LANGUAGE_DETECT_CACHE_SIZE = 256 # 按文本哈希缓存的检测结果数
+
 # 用于在 config.json 中存储用户自定义值的键名
 USER_MIN_DURATION_TARGET_KEY = "user_min_duration_target"
 USER_MAX_DURATION_KEY = "user_max_duration"
@@ -46,6 +76,17 @@ DEFAULT_FREE_TRANSCRIPTION_LANGUAGE = "auto"
 DEFAULT_FREE_TRANSCRIPTION_NUM_SPEAKERS = 0
 DEFAULT_FREE_TRANSCRIPTION_TAG_AUDIO_EVENTS = True
 
+# 保存的转录JSON默认为紧凑格式，开启后缩进输出便于人工查看
+USER_FREE_TRANSCRIPTION_PRETTY_JSON_KEY = "user_free_transcription_pretty_json"
+DEFAULT_FREE_TRANSCRIPTION_PRETTY_JSON = False
+
+# --- JSON 解析诊断的配置项键名和默认值 ---
+USER_PARSER_STRICT_MODE_KEY = "user_parser_strict_mode"
+USER_PARSER_MAX_ERROR_RATE_KEY = "user_parser_max_error_rate"
+
+DEFAULT_PARSER_STRICT_MODE = False # 严格模式: 跳过的词条比例超过阈值时中止解析
+DEFAULT_PARSER_MAX_ERROR_RATE = 0.05 # 严格模式允许的最大跳过比例
+
 # --- LLM 相关新增配置 ---
 DEFAULT_LLM_TEMPERATURE = 0.2 # LLM默认温度
 
@@ -55,6 +96,122 @@ DEFAULT_LLM_MODEL_NAME = DEEPSEEK_MODEL
 DEFAULT_LLM_API_KEY = ""
 DEFAULT_LLM_REMEMBER_API_KEY = True
 
+# --- LLM 任务选项 (随任务传给 llm_api.LlmJobOptions) ---
+USER_LLM_MAX_CONCURRENCY_KEY = "user_llm_max_concurrency"
+USER_LLM_BYPASS_CACHE_KEY = "user_llm_bypass_cache"
+USER_LLM_REQUESTS_PER_MINUTE_KEY = "user_llm_requests_per_minute"
+USER_LLM_TOKENS_PER_MINUTE_KEY = "user_llm_tokens_per_minute"
+USER_LLM_STREAM_KEY = "user_llm_stream"
+USER_LLM_PIPELINE_ALIGNMENT_KEY = "user_llm_pipeline_alignment"
+USER_LLM_CONTEXT_WINDOW_KEY = "user_llm_context_window"
+USER_LLM_MAX_OUTPUT_TOKENS_KEY = "user_llm_max_output_tokens"
+USER_LLM_SUMMARY_POLICY_KEY = "user_llm_summary_policy"
+USER_LLM_SUMMARY_MODEL_KEY = "user_llm_summary_model"
+USER_LLM_ENDPOINT_POOL_KEY = "user_llm_endpoint_pool"
+USER_LLM_ROUTING_POLICY_KEY = "user_llm_routing_policy"
+USER_LLM_ADAPTIVE_CONCURRENCY_KEY = "user_llm_adaptive_concurrency"
+USER_LLM_MIN_CONCURRENCY_KEY = "user_llm_min_concurrency"
+USER_LLM_WRITE_TELEMETRY_KEY = "user_llm_write_telemetry"
+
+DEFAULT_LLM_MAX_CONCURRENCY = 4 # 同时在途的分块请求数
+LLM_MAX_CONCURRENCY_LIMIT = 16 # 设置界面允许的最大并发数
+DEFAULT_LLM_BYPASS_CACHE = False # 为True时不读取缓存，强制重新请求 (新结果仍会写入缓存)
+DEFAULT_LLM_REQUESTS_PER_MINUTE = 0 # 每分钟请求数上限，0 表示不限制
+DEFAULT_LLM_TOKENS_PER_MINUTE = 0 # 每分钟 token 数上限，0 表示不限制
+DEFAULT_LLM_STREAM = False # 为True时以 SSE 流式接收响应 (仅 OpenAI 兼容接口)
+DEFAULT_LLM_PIPELINE_ALIGNMENT = False # 为True时在后续文本块仍在请求时对齐已返回的块
+DEFAULT_LLM_CONTEXT_WINDOW = 65536 # 模型上下文窗口 (token)，deepseek-chat 为 64K
+DEFAULT_LLM_MAX_OUTPUT_TOKENS = 4096 # 单次响应的输出上限 (token)，未指定 max_tokens 时 deepseek-chat 默认 4K
+DEFAULT_LLM_SUMMARY_POLICY = "serial" # 摘要与分割的调度策略，见 LLM_SUMMARY_POLICIES
+DEFAULT_LLM_SUMMARY_MODEL = "" # small_model 策略使用的摘要模型，留空则使用分割模型
+# 端点池: 在 config.json 中填写的端点列表，非空时文本块请求在这些端点之间分发 (代替单一的API地址)。
+# 每项形如 {"name": "备用", "base_url": "https://api.example.com", "model": "...", "api_key": "sk-...", "weight": 1, "max_concurrency": 4}，
+# 除 base_url 外均可省略，未填写的模型与 API Key 沿用主设置。
+DEFAULT_LLM_ENDPOINT_POOL = []
+DEFAULT_LLM_ROUTING_POLICY = "least_outstanding" # 端点池的分发策略，见 LLM_ROUTING_POLICIES
+DEFAULT_LLM_ADAPTIVE_CONCURRENCY = False # 为True时按 AIMD 自动调整并发，并发请求数作为上限
+DEFAULT_LLM_MIN_CONCURRENCY = 1 # 自适应并发的下限
+DEFAULT_LLM_WRITE_TELEMETRY = False # 为True时在SRT旁写出本次任务的LLM请求统计 (.llm_telemetry.json)
+
+# 摘要与分割的调度策略 -> 设置界面显示名称
+LLM_SUMMARY_POLICIES = {
+    "serial": "先摘要后分割", # 等摘要完成后再发送所有文本块
+    "overlap": "摘要与分割重叠", # 首批文本块不带摘要，与摘要请求同时发送
+    "skip_single_chunk": "单块时跳过摘要", # 只有一个文本块时不请求摘要
+    "small_model": "小模型摘要", # 用更快的摘要模型，其余同 serial
+}
+
+LLM_ROUTING_POLICIES = {
+    "least_outstanding": "最少在途请求", # 按 在途数/权重 选择最空闲的端点
+    "latency_weighted": "延迟加权", # 按 延迟滑动平均 × (在途数+1) / 权重 选择
+}
+LLM_ENDPOINT_EJECT_AFTER_FAILURES = 3 # 端点连续失败达到此次数后暂停分发
+LLM_ENDPOINT_EJECT_SECONDS = 60 # 暂停分发的秒数
+LLM_AIMD_DECREASE_FACTOR = 0.5 # 遇到 429、超时或延迟升高时并发上限乘以此系数
+LLM_AIMD_LATENCY_WINDOW = 8 # 每积累这么多个成功请求计算一次 p95 延迟
+LLM_AIMD_LATENCY_RISE_RATIO = 2.0 # 窗口 p95 超过基线的此倍数时视为延迟升高
+
+# 所有任务选项的默认值，主窗口据此读写 config.json 并传给工作线程
+LLM_JOB_OPTION_DEFAULTS = {
+    USER_LLM_MAX_CONCURRENCY_KEY: DEFAULT_LLM_MAX_CONCURRENCY,
+    USER_LLM_BYPASS_CACHE_KEY: DEFAULT_LLM_BYPASS_CACHE,
+    USER_LLM_REQUESTS_PER_MINUTE_KEY: DEFAULT_LLM_REQUESTS_PER_MINUTE,
+    USER_LLM_TOKENS_PER_MINUTE_KEY: DEFAULT_LLM_TOKENS_PER_MINUTE,
+    USER_LLM_STREAM_KEY: DEFAULT_LLM_STREAM,
+    USER_LLM_PIPELINE_ALIGNMENT_KEY: DEFAULT_LLM_PIPELINE_ALIGNMENT,
+    USER_LLM_CONTEXT_WINDOW_KEY: DEFAULT_LLM_CONTEXT_WINDOW,
+    USER_LLM_MAX_OUTPUT_TOKENS_KEY: DEFAULT_LLM_MAX_OUTPUT_TOKENS,
+    USER_LLM_SUMMARY_POLICY_KEY: DEFAULT_LLM_SUMMARY_POLICY,
+    USER_LLM_SUMMARY_MODEL_KEY: DEFAULT_LLM_SUMMARY_MODEL,
+    USER_SEGMENTATION_MODE_KEY: DEFAULT_SEGMENTATION_MODE,
+    USER_LLM_ENDPOINT_POOL_KEY: DEFAULT_LLM_ENDPOINT_POOL,
+    USER_LLM_ROUTING_POLICY_KEY: DEFAULT_LLM_ROUTING_POLICY,
+    USER_LLM_ADAPTIVE_CONCURRENCY_KEY: DEFAULT_LLM_ADAPTIVE_CONCURRENCY,
+    USER_LLM_MIN_CONCURRENCY_KEY: DEFAULT_LLM_MIN_CONCURRENCY,
+    USER_LLM_WRITE_TELEMETRY_KEY: DEFAULT_LLM_WRITE_TELEMETRY,
+}
+
+# LLM请求重试: 每类错误的重试次数预算与指数退避参数
+LLM_RETRY_BUDGETS = {
+    "timeout": 2, # 请求超时
+    "rate_limit": 5, # 429 限流
+    "server_error": 3, # 5xx / 408
+    "connection": 3, # 连接中断
+}
+LLM_RETRY_BASE_DELAY_S = 1.0 # 首次重试的基础等待时间
+LLM_RETRY_MAX_DELAY_S = 30.0 # 指数退避的等待上限
+LLM_RETRY_MAX_RETRY_AFTER_S = 120.0 # 服务器 Retry-After 的最长遵循时间
+
+# HTTP 超时分为建立连接与读取两部分: 主机不可达时很快失败，而读超时仍按请求类型设置得较长
+LLM_CONNECT_TIMEOUT_S = 10.0
+
+# LLM响应缓存的容量与有效期
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024 # 超出后按最近最少使用淘汰
+LLM_CACHE_MAX_AGE_DAYS = 30 # 超过该天数的条目视为过期
+
+# 按 token 预算分块: 分割结果约为原文加换行，需同时放得进输出上限与上下文窗口
+LLM_SEGMENT_OUTPUT_EXPANSION = 1.15 # 输出 token 数相对输入文本块的膨胀系数
+LLM_CHUNK_OUTPUT_SAFETY = 0.8 # 只使用输出上限的这一比例，为估算误差留余量
+LLM_MIN_CHUNK_TOKENS = 200 # 文本块的最小 token 预算
+LLM_TRUNCATION_MAX_SPLIT_DEPTH = 3 # 输出被截断时将文本块对半拆分重试的最大层数
+
+# 长文本摘要: 超过直接摘要上限时分组并行摘要再合并 (map-reduce)
+LLM_SUMMARY_DIRECT_MAX_TOKENS = 16000 # 单次直接摘要的文本上限 (token)
+LLM_SUMMARY_CONTEXT_FRACTION = 0.5 # 直接摘要最多占用可用上下文的比例
+LLM_SUMMARY_RESERVED_TOKENS = 1024 # 分块时为摘要预留的 token 数 (分块先于摘要完成)
+LLM_SUMMARY_MAX_LEVELS = 4 # 分组摘要最多合并的层数，超过后不再继续合并
+
+# 分割结果完整性校验: 输出与输入的字符差异超过阈值时重新请求该块
+LLM_INTEGRITY_MAX_MISMATCH_RATIO = 0.02 # 允许的差异字符占比
+LLM_INTEGRITY_MAX_RETRIES = 2 # 每个块因校验失败重新请求的最多次数
+
+# 断点索引模式: 模型返回的编号列表无效时重新请求的次数，仍无效则整个任务退回文本模式
+LLM_BOUNDARY_OFFSET_MAX_RETRIES = 1
+
+# 跨文件请求打包: 多个短转录装进同一个分割请求 (core.request_packing)
+LLM_PACK_MAX_TEXTS = 20 # 每个包最多容纳的文本数
+LLM_PACK_MAX_TEXT_RATIO = 0.5 # 超过块预算此比例的文本不打包，按普通流程单独分割
+
 # 新增：用于摘要任务的系统提示词 (各语言)
 # 这些提示词要求LLM生成简洁、概括性的摘要
 DEEPSEEK_SYSTEM_PROMPT_SUMMARY_JA = """以下のテキスト全体の内容を理解し、主要なトピックや出来事を網羅した200字程度の簡潔な要約を作成してください。この要約は、後続のテキスト分割タスクで文脈を理解するために使用されます。具体的な詳細や会話の逐語的な内容は含めず、全体の流れがわかるようにしてください。"""
@@ -389,4 +546,38 @@ Before any segmentation, preprocess the 【Current Text Block】:
    * *Note:* For consecutive ellipses, like `...` (three dots), treat them as a single ellipsis mark and decide on segmentation based on Rule 6's semantic coherence.
 
 8. **Ensure Integrity:** The concatenated output fragments must be identical to the original input text (after preprocessing).
-"""
\ No newline at end of file
+"""
+
+
+# --- 断点索引模式的系统提示词 (各语言通用) ---
+# 文本块以 "[编号]词" 的形式发送，模型只返回新片段起始词的编号，不复述原文
+DEEPSEEK_SYSTEM_PROMPT_BOUNDARY_OFFSETS = """**【重要：您的任务是为【当前词序列】确定分割位置。您会得到一份【全文摘要】以帮助理解上下文。请仅输出一个JSON整数数组，不要输出任何其他文字或代码块标记。】**
+
+您是一位专业的字幕断句员，擅长根据标点和上下文把转录文本分割成自然的句子或语义单元。
+
+**输入结构：**
+1.  【全文摘要】（可能没有，仅供理解背景）
+2.  【当前词序列】：每个词前带有方括号编号，例如 `[12]今日は[13]いい[14]天気[15]ですね。[16]（笑い）`。编号不一定从0开始，也不一定连续。
+
+**输出要求：**
+输出每个新片段**第一个词的编号**组成的JSON数组，按从小到大排列，例如 `[16, 23, 40]`。
+* 【当前词序列】的第一个词总是开始第一个片段，不要输出它的编号。
+* 只能使用输入中出现过的编号。整个序列只需一个片段时输出 `[]`。
+
+**分割规则 (按顺序优先应用)：**
+1.  括号 `()` 或 `（）` 内的附加情景描述（如 `(笑い声)`、`（掌声）`、`(laughs)`）单独成为一个片段。紧随其后的句末标点归入前一个片段。
+2.  引号 `「」`、`『』`、`“”`、`""` 内的完整引用单独成为一个片段（连同引号）。
+3.  句首的语气词（如 `あの`、`えっと`、`嗯`、`那个`、`Um`、`Well`）后面能独立成句时，语气词单独成为一个片段。
+4.  在 `。`、`？`、`！`、`.`、`?`、`!` 等句末标点之后分割；省略号 `…` 只在前文已构成完整意群时分割。
+5.  没有标点的长句按语义停顿（从句、并列成分）分割，避免单个片段过长。
+"""
+
+
+# --- 跨文件打包请求追加在分割提示词之后的说明 (各语言通用) ---
+LLM_PACKED_PROMPT_SUFFIX = """
+
+**【多文本打包】**
+本次【当前文本块】由多段互相独立的文本组成，每段以单独一行的标记 `<<<编号>>>` 开头（例如 `<<<3>>>`）。
+* 各段分别按上述规则分割，片段不得跨越标记，也不要在段与段之间建立上下文联系。
+* 输出时先原样输出每段的标记行，再逐行输出该段的分割结果；按输入顺序输出所有段，不得遗漏或合并任何一段。
+"""
@@ -0,0 +1,80 @@
+import re
+from typing import List, Optional, Tuple
+
+from utils import json_utils
+from core.data_models import TimestampedWord
+from core.token_estimator import estimate_text_tokens
+
+# --- 断点索引输出模式 ---
+# 文本块以带稳定编号的词序列 "[编号]词" 发送，模型只返回新片段起始词的编号 (JSON 数组)。
+# 编号就是 ParsedTranscription.words 的下标，SrtProcessor 可直接切片取得每个片段的词与时间戳，
+# 无需模糊对齐；输出只有一串数字，也不存在复述原文时增删字符的问题。
+
+_CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$")
+_FINAL_MARKS = tuple("。．.！!？?」』)）")
+
+
+def format_indexed_words(words: List[TimestampedWord], start: int, end: int) -> str:
+    """把 words[start:end] 中的非空白词格式化为 "[编号]词" 序列。空白词 (间隔符) 不发送，但保留其编号位置。"""
+    return "".join(f"[{index}]{words[index].text.strip()}" for index in range(start, end) if words[index].text.strip())
+
+
+def split_word_ranges(words: List[TimestampedWord], max_tokens: int, language: Optional[str] = None) -> List[Tuple[int, int]]:
+    """
+    按估算的 token 数 (含编号开销) 把词序列切成 [起, 止) 区间，每块不超过 max_tokens。
+    块尾尽量落在以句末标点结尾的词之后，只在最后 20% 的范围内回退查找。
+    """
+    ranges: List[Tuple[int, int]] = []
+    total = len(words)
+    start = 0
+    while start < total:
+        used = 0
+        end = start
+        last_sentence_end = -1
+        while end < total:
+            word_text = words[end].text.strip()
+            word_tokens = estimate_text_tokens(f"[{end}]{word_text}", language) if word_text else 0
+            if used + word_tokens > max_tokens and end > start:
+                break
+            used += word_tokens
+            end += 1
+            if word_text.endswith(_FINAL_MARKS) and used >= max_tokens * 0.8:
+                last_sentence_end = end
+        if end < total and last_sentence_end > start:
+            end = last_sentence_end
+        if any(words[index].text.strip() for index in range(start, end)):
+            ranges.append((start, end))
+        elif ranges:
+            ranges[-1] = (ranges[-1][0], end) # 只含空白词的尾块并入前一块
+        start = end
+    return ranges
+
+
+def parse_break_offsets(content: Optional[str], words: List[TimestampedWord], start: int, end: int) -> Optional[List[int]]:
+    """
+    解析并校验模型返回的断点编号。必须是严格递增的整数数组，且每个编号都指向 (start, end) 内的非空白词；
+    任何一项不满足都返回 None，由调用方重新请求或退回文本模式。
+    """
+    if content is None:
+        return None
+    cleaned = _CODE_FENCE_PATTERN.sub("", content.strip())
+    try:
+        offsets = json_utils.loads(cleaned)
+    except json_utils.JSONDecodeError:
+        return None
+    if not isinstance(offsets, list):
+        return None
+    previous = start
+    for offset in offsets:
+        if isinstance(offset, bool) or not isinstance(offset, int):
+            return None
+        if offset <= previous or offset >= end or not words[offset].text.strip():
+            return None
+        previous = offset
+    return offsets
+
+
+def word_ranges_from_breaks(start: int, end: int, breaks: List[int]) -> List[Tuple[int, int]]:
+    """把一个块内的断点编号转换为各片段的 [起, 止) 区间。"""
+    bounds = [start] + list(breaks) + [end]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Any, Sequence
+
+from core.data_models import ParsedTranscription, CompactTranscription
+from core.transcription_parser import TranscriptionParser
+from core.language_resolver import normalize_language_code
+from utils import json_utils
+import config as app_config
+
+# --- 批量解析与规范化 ---
+# 解析与规范化都是纯CPU工作，放入进程池可绕开GIL，吞吐量随核心数近似线性增长。
+
+COMPACT_CACHE_SUFFIX = ".compact.json"
+
+
+@dataclass
+class BulkLoadResult:
+    """单个文件的批量加载结果。失败时 error 不为空，不影响同批其他文件。"""
+    path: str # 输入文件路径
+    transcription: Optional[CompactTranscription] = None # 紧凑转录结果 (写缓存文件时为None)
+    cache_path: Optional[str] = None # 紧凑缓存文件路径 (指定 cache_dir 时)
+    detected_format: Optional[str] = None # 实际使用的来源格式
+    error: Optional[str] = None # 错误信息
+    messages: List[str] = field(default_factory=list) # 解析过程中收集的日志
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class _MessageCollector:
+    """模拟 signals_forwarder 的 log_message.emit 接口，在子进程中收集日志。"""
+    def __init__(self):
+        self.messages: List[str] = []
+        self.log_message = self
+
+    def emit(self, message: str):
+        self.messages.append(message)
+
+
+def normalize_transcription(parsed: ParsedTranscription) -> ParsedTranscription:
+    """按开始时间排序词列表、修正倒置的结束时间、补全完整文本并规范语言代码。"""
+    words = parsed.words
+    if any(words[i].start_time > words[i + 1].start_time for i in range(len(words) - 1)):
+        words = sorted(words, key=lambda word: word.start_time) # 稳定排序，同一时刻保持原顺序
+    for word in words:
+        if word.end_time < word.start_time:
+            word.end_time = word.start_time
+    full_text = parsed.full_text
+    if not full_text and words:
+        full_text = " ".join(word.text for word in words if word.text is not None)
+    return ParsedTranscription(words=words, full_text=full_text, language_code=normalize_language_code(parsed.language_code))
+
+
+def _compact_cache_path(cache_dir: str, input_path: str) -> str:
+    """缓存文件名带输入文件绝对路径的短哈希，不同目录下的同名文件不会互相覆盖。"""
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(cache_dir, f"{base_name}.{path_hash}{COMPACT_CACHE_SUFFIX}")
+
+
+def _source_signature(input_path: str) -> Dict[str, Any]:
+    """输入文件的绝对路径、修改时间与大小，写入缓存文件用于判断缓存是否仍对应当前的源文件。"""
+    stat = os.stat(input_path)
+    return {"path": os.path.abspath(input_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _is_cache_valid(cache_data: Dict[str, Any], input_path: str) -> bool:
+    source = cache_data.get("source")
+    if not isinstance(source, dict):
+        return False
+    try:
+        signature = _source_signature(input_path)
+    except OSError:
+        return False
+    return all(source.get(key) == value for key, value in signature.items())
+
+
+def _read_valid_cache(cache_path: str, input_path: str) -> Optional[Dict[str, Any]]:
+    """读取与源文件一致的缓存内容；缓存不存在、损坏或已过期时返回None。"""
+    try:
+        cache_data = json_utils.load_file(cache_path)
+    except (OSError, json_utils.JSONDecodeError):
+        return None
+    return cache_data if isinstance(cache_data, dict) and _is_cache_valid(cache_data, input_path) else None
+
+
+def _load_single_file(task: tuple) -> BulkLoadResult:
+    """子进程入口: 解析并规范化单个文件。必须是模块级函数才能被 pickle。"""
+    path, source_format, parser_options, cache_dir = task
+    collector = _MessageCollector()
+    result = BulkLoadResult(path=path, messages=collector.messages)
+    try:
+        if cache_dir:
+            cached = _read_valid_cache(_compact_cache_path(cache_dir, path), path)
+            if cached is not None: # 源文件未变，沿用上次写出的缓存
+                result.cache_path = _compact_cache_path(cache_dir, path)
+                result.detected_format = cached["source"].get("format")
+                collector.emit(f"使用紧凑缓存: {result.cache_path}")
+                return result
+        parser = TranscriptionParser(
+            signals_forwarder=collector,
+            strict_mode=bool(parser_options.get(app_config.USER_PARSER_STRICT_MODE_KEY, app_config.DEFAULT_PARSER_STRICT_MODE)),
+            max_error_rate=float(parser_options.get(app_config.USER_PARSER_MAX_ERROR_RATE_KEY, app_config.DEFAULT_PARSER_MAX_ERROR_RATE))
+        )
+        effective_format = source_format
+        if effective_format == "auto":
+            effective_format = parser.sniff_file_format(path) or "auto" # 文件头不足以识别时交给完整结构检测
+        raw_data = json_utils.load_file(path)
+        parsed = parser.parse(raw_data, effective_format)
+        if parsed is None:
+            result.error = "JSON 解析失败"
+            return result
+        result.detected_format = parser.last_diagnostics.source_format if parser.last_diagnostics else effective_format
+        compact = CompactTranscription.from_parsed(normalize_transcription(parsed))
+        if cache_dir:
+            cache_path = _compact_cache_path(cache_dir, path)
+            cache_data = compact.to_dict()
+            cache_data["source"] = {**_source_signature(path), "format": result.detected_format}
+            json_utils.dump_file(cache_data, cache_path)
+            result.cache_path = cache_path
+        else:
+            result.transcription = compact
+    except FileNotFoundError:
+        result.error = "文件不存在"
+    except json_utils.JSONDecodeError as e:
+        result.error = f"JSON 格式错误: {e}"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+        collector.emit(traceback.format_exc())
+    return result
+
+
+def bulk_load_transcriptions(paths: Sequence[str],
+                             source_format: str = "auto",
+                             max_workers: Optional[int] = None,
+                             cache_dir: Optional[str] = None,
+                             parser_options: Optional[Dict[str, Any]] = None) -> List[BulkLoadResult]:
+    """
+    在进程池中并行解析并规范化多个转录JSON文件。
+    :param paths: 输入文件路径列表。
+    :param source_format: 来源格式，默认 "auto" 对每个文件单独识别。
+    :param max_workers: 进程数，默认使用全部CPU核心。
+    :param cache_dir: 指定时将紧凑结果写为缓存文件并只返回路径，避免大对象回传主进程。
+    :param parser_options: 传给 TranscriptionParser 的严格模式选项。
+    :return: 与输入顺序一致的结果列表；单个文件失败只记录在对应结果中。
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    tasks = [(path, source_format, dict(parser_options or {}), cache_dir) for path in paths]
+
+    worker_count = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if worker_count <= 1:
+        return [_load_single_file(task) for task in tasks]
+
+    # 按批分发减少进程间通信次数；map 按输入顺序返回结果
+    chunksize = max(1, len(tasks) // (worker_count * 4))
+    results: List[BulkLoadResult] = []
+    try:
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            for result in executor.map(_load_single_file, tasks, chunksize=chunksize):
+                results.append(result)
+    except BrokenProcessPool as e:
+        # 子进程异常退出时，未完成的文件逐个标记为失败，已得到的结果保留
+        for path in paths[len(results):]:
+            results.append(BulkLoadResult(path=path, error=f"进程池异常终止: {e}"))
+    return results
+
+
+def load_compact_cache(cache_path: str, source_path: Optional[str] = None) -> CompactTranscription:
+    """
+    读取 bulk_load_transcriptions 写出的紧凑缓存文件。
+    指定 source_path 时校验缓存记录的源文件路径、修改时间与大小，不一致时抛出 ValueError。
+    """
+    cache_data = json_utils.load_file(cache_path)
+    if source_path is not None and not _is_cache_valid(cache_data, source_path):
+        raise ValueError(f"紧凑缓存 {cache_path} 与源文件 {source_path} 不一致 (源文件已修改或不是同一文件)")
+    return CompactTranscription.from_dict(cache_data)
@@ -0,0 +1,53 @@
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import List
+
+import config as app_config
+
+# --- LLM 分割结果的完整性校验 ---
+# 提示词要求分割不增删任何字符 (只去除空格)。在对齐之前逐块比较输出与输入，
+# 丢字或编造的内容在这里就能发现并只重新请求该块，而不是等到 SrtProcessor 对齐失败。
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_for_comparison(text: str) -> str:
+    """NFKC 规范化 (统一全角/半角) 后去除所有空白。"""
+    return _WHITESPACE_PATTERN.sub("", unicodedata.normalize("NFKC", text or ""))
+
+
+@dataclass
+class ChunkIntegrityReport:
+    """单个文本块的校验结果。按字符计数比较，标点在相邻片段间移动不计为差异。"""
+    input_chars: int # 规范化后的输入字符数
+    output_chars: int # 规范化后的输出字符数
+    dropped_chars: int # 输入中有而输出中缺少的字符数
+    invented_chars: int # 输出中多出的字符数
+
+    @property
+    def mismatch_ratio(self) -> float:
+        if self.input_chars == 0:
+            return 0.0 if self.output_chars == 0 else 1.0
+        return (self.dropped_chars + self.invented_chars) / self.input_chars
+
+    def is_acceptable(self, max_mismatch_ratio: float = app_config.LLM_INTEGRITY_MAX_MISMATCH_RATIO) -> bool:
+        return self.mismatch_ratio <= max_mismatch_ratio
+
+    def describe(self) -> str:
+        return f"缺失 {self.dropped_chars} 字、多出 {self.invented_chars} 字，差异率 {self.mismatch_ratio:.1%}"
+
+
+def check_chunk_integrity(chunk_text: str, segments: List[str]) -> ChunkIntegrityReport:
+    """比较一个文本块与其分割结果拼接后的字符构成。"""
+    normalized_input = normalize_for_comparison(chunk_text)
+    normalized_output = normalize_for_comparison("".join(segments))
+    input_counts = Counter(normalized_input)
+    output_counts = Counter(normalized_output)
+    return ChunkIntegrityReport(
+        input_chars=len(normalized_input),
+        output_chars=len(normalized_output),
+        dropped_chars=sum((input_counts - output_counts).values()),
+        invented_chars=sum((output_counts - input_counts).values()),
+    )
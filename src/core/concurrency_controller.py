@@ -0,0 +1,129 @@
+import time
+import threading
+from typing import Optional, List, Tuple, Callable
+
+import requests
+
+import config as app_config
+
+# --- 自适应并发 (AIMD) ---
+# 在 [下限, 上限] 之间自动调整同时在途的文本块请求数:
+# 每个成功请求把并发上限加 1/当前上限 (约每一轮请求加 1)，
+# 遇到 429、超时或最近一批请求的 p95 延迟明显高于基线时乘以 LLM_AIMD_DECREASE_FACTOR。
+# 同一拥塞事件会让多个在途请求同时失败，只有在上次下调之后发出的请求才能再次触发下调。
+
+WAIT_SLICE_S = 0.1 # 并发已满时检查取消状态的间隔
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_THROTTLED = "throttled"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_ERROR = "error" # 其他错误，不影响并发上限
+
+OUTCOME_DESCRIPTIONS = {
+    OUTCOME_THROTTLED: "限流 (429)",
+    OUTCOME_TIMEOUT: "请求超时",
+}
+
+
+def classify_request_outcome(error: Optional[BaseException]) -> str:
+    """把一次请求的结果归入 OUTCOME_* 类别；error 为None表示成功。"""
+    if error is None:
+        return OUTCOME_SUCCESS
+    if isinstance(error, requests.exceptions.Timeout):
+        return OUTCOME_TIMEOUT
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None and error.response.status_code == 429:
+        return OUTCOME_THROTTLED
+    return OUTCOME_ERROR
+
+
+def _p95(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class AimdConcurrencyController:
+    """线程安全的 AIMD 并发闸门。acquire/release 包住每一次实际发送 (重试的退避等待不占用并发)。"""
+
+    def __init__(self, min_limit: int, max_limit: int, initial_limit: Optional[int] = None,
+                 decrease_factor: float = app_config.LLM_AIMD_DECREASE_FACTOR,
+                 latency_window: int = app_config.LLM_AIMD_LATENCY_WINDOW,
+                 latency_rise_ratio: float = app_config.LLM_AIMD_LATENCY_RISE_RATIO):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        if initial_limit is None:
+            initial_limit = (self.min_limit + self.max_limit + 1) // 2
+        self._limit = float(max(self.min_limit, min(initial_limit, self.max_limit)))
+        self.decrease_factor = decrease_factor
+        self.latency_window = max(2, latency_window)
+        self.latency_rise_ratio = latency_rise_ratio
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._window: List[float] = [] # 当前延迟窗口内的成功请求延迟
+        self._baseline_p95: Optional[float] = None # 各窗口 p95 的最小值
+        self._last_decrease_at = float("-inf")
+        self._started_at = time.monotonic()
+        self._history: List[Tuple[float, int, str]] = [(0.0, self.limit, "初始")] # (任务内秒数, 并发上限, 原因)
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, is_running: Callable[[], bool] = lambda: True) -> Optional[float]:
+        """阻塞直到在途请求数低于当前上限，返回发送时刻 (传给 release)；任务取消时返回None。"""
+        while True:
+            with self._lock:
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+                    return time.monotonic()
+            if not is_running():
+                return None
+            time.sleep(WAIT_SLICE_S)
+
+    def release(self, sent_at: float, outcome: str) -> Optional[str]:
+        """记录一次请求的结果并调整并发上限；上限发生变化时返回日志消息。"""
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            previous = self.limit
+            reason = None
+            if outcome in OUTCOME_DESCRIPTIONS:
+                if sent_at >= self._last_decrease_at:
+                    reason = OUTCOME_DESCRIPTIONS[outcome]
+            elif outcome == OUTCOME_SUCCESS:
+                self._window.append(now - sent_at)
+                reason = self._check_latency(sent_at)
+                if reason is None:
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            if reason is not None:
+                self._limit = float(max(self.min_limit, int(self._limit * self.decrease_factor)))
+                self._last_decrease_at = now
+                self._window = [] # 下调后的延迟重新统计
+            if self.limit == previous:
+                return None
+            self._history.append((now - self._started_at, self.limit, reason or "成功递增"))
+            if reason is None:
+                return f"并发上限 {previous} -> {self.limit}。"
+            return f"{reason}，并发上限 {previous} -> {self.limit}。"
+
+    def _check_latency(self, sent_at: float) -> Optional[str]:
+        """延迟窗口满后比较其 p95 与基线，明显升高时返回下调原因。调用方须持有 self._lock。"""
+        if len(self._window) < self.latency_window:
+            return None
+        window_p95 = _p95(self._window)
+        self._window = []
+        if self._baseline_p95 is None or window_p95 < self._baseline_p95:
+            self._baseline_p95 = window_p95
+            return None
+        if window_p95 > self._baseline_p95 * self.latency_rise_ratio and sent_at >= self._last_decrease_at:
+            return f"p95 延迟升至 {window_p95:.2f} 秒 (基线 {self._baseline_p95:.2f} 秒)"
+        return None
+
+    def summary(self) -> str:
+        """本次任务的并发区间、峰值与调整历史。"""
+        with self._lock:
+            history = " -> ".join(f"{limit}@{elapsed:.1f}s" for elapsed, limit, _ in self._history)
+            decreases = sum(1 for _, _, reason in self._history[1:] if reason != "成功递增")
+            return (f"区间 [{self.min_limit}, {self.max_limit}]，最终 {self.limit}，实际峰值在途 {self._peak_in_flight}，"
+                    f"下调 {decreases} 次；历史: {history}")
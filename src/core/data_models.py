@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 import re
 
 # --- 统一的数据结构 ---
@@ -11,6 +11,29 @@ class TimestampedWord:
     end_time: float # 结束时间 (秒)
     speaker_id: Optional[str] = None # 发言人ID (可选)
 
+# 中日韩文字与全角符号: 相邻两侧都不属于这些字符时，词之间需要补一个空格
+_CJK_CHAR_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+_NO_SPACE_BEFORE = set(",.!?;:%)]}'\"")
+
+
+def join_word_texts(words: List[TimestampedWord]) -> str:
+    """
+    拼接词文本。ElevenLabs 的词列表自带空格词条，Deepgram / AssemblyAI 英文词之间没有，
+    因此只在两侧都不是空白、不是中日文字符时补一个空格。
+    """
+    parts: List[str] = []
+    previous = ""
+    for word in words:
+        text = word.text
+        if not text:
+            continue
+        if previous and not previous[-1].isspace() and not text[0].isspace() and text[0] not in _NO_SPACE_BEFORE \
+                and not _CJK_CHAR_PATTERN.match(previous[-1]) and not _CJK_CHAR_PATTERN.match(text[0]):
+            parts.append(" ")
+        parts.append(text)
+        previous = text
+    return "".join(parts)
+
 @dataclass
 class ParsedTranscription:
     """表示解析后的ASR转录结果。"""
@@ -18,6 +41,80 @@ class ParsedTranscription:
     full_text: Optional[str] = None # 完整文本 (可选)
     language_code: Optional[str] = None # 语言代码 (可选)
 
+@dataclass
+class CompactTranscription:
+    """以并列数组保存的转录结果，对象数远少于逐词的 TimestampedWord 列表，便于跨进程传递和缓存。"""
+    texts: List[str] = field(default_factory=list) # 词文本
+    start_times: List[float] = field(default_factory=list) # 开始时间 (秒)
+    end_times: List[float] = field(default_factory=list) # 结束时间 (秒)
+    speaker_ids: List[Optional[str]] = field(default_factory=list) # 发言人ID
+    full_text: Optional[str] = None # 完整文本 (可选)
+    language_code: Optional[str] = None # 语言代码 (可选)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def from_parsed(cls, parsed: ParsedTranscription) -> "CompactTranscription":
+        words = parsed.words
+        return cls(
+            texts=[word.text for word in words],
+            start_times=[word.start_time for word in words],
+            end_times=[word.end_time for word in words],
+            speaker_ids=[word.speaker_id for word in words],
+            full_text=parsed.full_text,
+            language_code=parsed.language_code,
+        )
+
+    def to_parsed(self) -> ParsedTranscription:
+        words = [TimestampedWord(text, start, end, speaker)
+                 for text, start, end, speaker in zip(self.texts, self.start_times, self.end_times, self.speaker_ids)]
+        return ParsedTranscription(words=words, full_text=self.full_text, language_code=self.language_code)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "texts": self.texts, "start_times": self.start_times, "end_times": self.end_times,
+            "speaker_ids": self.speaker_ids, "full_text": self.full_text, "language_code": self.language_code,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompactTranscription":
+        texts = list(data.get("texts", []))
+        return cls(
+            texts=texts,
+            start_times=list(data.get("start_times", [])),
+            end_times=list(data.get("end_times", [])),
+            speaker_ids=list(data.get("speaker_ids", [None] * len(texts))),
+            full_text=data.get("full_text"),
+            language_code=data.get("language_code"),
+        )
+
+@dataclass
+class ParseDiagnostics:
+    """汇总一次解析中被跳过的词条，代替逐条输出日志。"""
+    source_format: str # 解析所用的来源格式
+    total_words: int = 0 # 词条总数
+    skipped_by_reason: Dict[str, int] = field(default_factory=dict) # 按原因统计的跳过数
+    samples: List[str] = field(default_factory=list) # 少量被跳过词条的示例
+
+    @property
+    def skipped_words(self) -> int:
+        return sum(self.skipped_by_reason.values())
+
+    @property
+    def error_rate(self) -> float:
+        return self.skipped_words / self.total_words if self.total_words else 0.0
+
+    def summary(self) -> str:
+        """生成单条汇总日志文本。"""
+        if not self.skipped_words:
+            return f"词条检查: 共 {self.total_words} 个，全部有效。"
+        reasons = ", ".join(f"{reason}: {count}" for reason, count in sorted(self.skipped_by_reason.items(), key=lambda item: -item[1]))
+        lines = [f"词条检查: 共 {self.total_words} 个，跳过 {self.skipped_words} 个 ({self.error_rate:.1%})。原因统计: {reasons}"]
+        for sample in self.samples:
+            lines.append(f"  示例: {sample}")
+        return "\n".join(lines)
+
 # --- 字幕条目类 ---
 class SubtitleEntry:
     """表示一条SRT字幕。"""
@@ -1,5 +1,4 @@
 import requests
-import json
 import os
 import time
 import random
@@ -8,11 +7,16 @@ from typing import Optional, Any, Dict, List, Tuple
 
 from mutagen import File as MutagenFile
 
+from utils import json_utils
+from core.http_cancel import CancellableHTTPAdapter
+
 ELEVENLABS_STT_API_URL = "https://api.elevenlabs.io/v1/speech-to-text"
 ELEVENLABS_STT_PARAMS = {
     "allow_unauthenticated": "1"
 }
 DEFAULT_STT_MODEL_ID = "scribe_v1"
+ELEVENLABS_CONNECT_TIMEOUT_S = 15 # 建立连接的超时
+ELEVENLABS_READ_TIMEOUT_S = 600 # 上传后等待转录结果的超时 (10分钟)
 DEFAULT_USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
@@ -76,6 +80,7 @@ DEFAULT_ACCEPT_LANGUAGES = [
 class ElevenLabsSTTClient:
     def __init__(self, signals_forwarder: Optional[Any] = None):
         self._signals = signals_forwarder
+        self._active_adapter: Optional[CancellableHTTPAdapter] = None # 正在进行的转录请求所用的适配器
         # _is_free_tier flag is removed as we assume free tier for now
 
     def _log(self, message: str):
@@ -91,6 +96,12 @@ class ElevenLabsSTTClient:
             return self._signals.parent().is_running
         return True # Fallback if signals or parent structure is not as expected
 
+    def stop_current_task(self):
+        """立即中断正在进行的上传或等待 (由工作线程的 stop() 调用)，不必等到10分钟的读超时。"""
+        adapter = self._active_adapter
+        if adapter is not None and adapter.abort_all():
+            self._log("已中断正在进行的转录请求。")
+
     def get_audio_info(self, audio_file_path: str) -> Tuple[Optional[float], Optional[float]]:
         duration_seconds: Optional[float] = None
         file_size_mb: Optional[float] = None
@@ -178,6 +189,12 @@ class ElevenLabsSTTClient:
         # If diarize is True (which it always is now) and num_speakers is auto (0 or None),
         # we don't send num_speakers for API's auto detection.
 
+        # 每次转录使用独立的会话，stop_current_task() 可以关闭它的连接
+        session = requests.Session()
+        adapter = CancellableHTTPAdapter(max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._active_adapter = adapter
         try:
             with open(audio_file_path, 'rb') as f_audio:
                 file_extension = os.path.splitext(audio_file_path)[1].lower()
@@ -197,13 +214,13 @@ class ElevenLabsSTTClient:
                 self._log(f"  API Payload (不含文件): {payload_data}")
                 
                 start_time = time.perf_counter()
-                response = requests.post(
+                response = session.post(
                     ELEVENLABS_STT_API_URL,
                     params=ELEVENLABS_STT_PARAMS,
                     headers=headers,
                     data=payload_data,
                     files=files_data,
-                    timeout=600 
+                    timeout=(ELEVENLABS_CONNECT_TIMEOUT_S, ELEVENLABS_READ_TIMEOUT_S)
                 )
                 end_time = time.perf_counter()
                 api_call_duration = end_time - start_time
@@ -214,24 +231,30 @@ class ElevenLabsSTTClient:
                     return None
 
                 response.raise_for_status()
-                response_json = response.json()
+                response_json = json_utils.loads(response.content)
                 self._log("成功从ElevenLabs API获取并解析JSON响应。")
                 return response_json
 
-        except requests.exceptions.Timeout:
-            self._log(f"错误: ElevenLabs API 请求超时 (10分钟)。")
-            return None # Ensure None is returned
         except requests.exceptions.RequestException as e:
+            if not self._is_worker_running(): # stop_current_task() 关闭了连接
+                self._log("转录请求已随任务停止而中断。")
+                return None
+            if isinstance(e, requests.exceptions.ConnectTimeout):
+                self._log(f"错误: 连接 ElevenLabs API 超时 ({ELEVENLABS_CONNECT_TIMEOUT_S}秒)。")
+                return None
+            if isinstance(e, requests.exceptions.Timeout):
+                self._log(f"错误: ElevenLabs API 请求超时 (10分钟)。")
+                return None # Ensure None is returned
             self._log(f"错误: ElevenLabs API 请求过程中发生网络或HTTP错误: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 self._log(f"  服务器响应状态码: {e.response.status_code}")
                 try:
-                    error_content = e.response.json()
+                    error_content = json_utils.loads(e.response.content)
                     self._log(f"  服务器错误详情: {error_content}")
-                except json.JSONDecodeError:
+                except json_utils.JSONDecodeError:
                     self._log(f"  服务器响应内容 (非JSON): {e.response.text}")
             return None # Ensure None is returned
-        except json.JSONDecodeError:
+        except json_utils.JSONDecodeError:
             self._log("错误：无法解析 ElevenLabs API 返回的JSON响应。")
             if 'response' in locals() and hasattr(response, 'text'):
                  self._log(f"  原始响应文本: {response.text[:500]}...")
@@ -241,6 +264,9 @@ class ElevenLabsSTTClient:
             import traceback
             self._log(traceback.format_exc())
             return None # Ensure None is returned
+        finally:
+            self._active_adapter = None
+            session.close()
 
         # Fallback, should ideally be caught by specific exceptions above
         return None
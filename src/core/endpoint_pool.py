@@ -0,0 +1,156 @@
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, List, Callable, TypeVar, Tuple
+
+import requests
+
+import config as app_config
+from core.llm_retry import RetryCancelled
+
+# --- 多端点负载均衡 ---
+# 把文本块请求分发到多个 OpenAI 兼容端点 (各自的地址、模型、Key、权重与并发上限)。
+# 每次发送 (包括重试) 都重新选择端点，因此某个端点出错后重试会自然落到其他端点上；
+# 连续失败达到阈值的端点被暂时剔除，冷却期结束后重新参与分发。
+
+WAIT_SLICE_S = 0.1 # 所有端点都满载时检查取消状态的间隔
+LATENCY_EWMA_ALPHA = 0.3 # 延迟滑动平均中新样本的权重
+
+T = TypeVar("T")
+
+
+@dataclass
+class LlmEndpoint:
+    """端点池中的一个端点及其本次任务内的统计。"""
+    name: str # 日志中显示的名称
+    target_url: str # 完整的 chat/completions 地址
+    model: str
+    api_key: str
+    weight: float = 1.0 # 相对权重，越大分到的请求越多
+    max_concurrency: int = app_config.DEFAULT_LLM_MAX_CONCURRENCY # 同时在途的请求上限
+    outstanding: int = 0 # 当前在途的请求数
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0 # 被剔除的次数
+    ejected_until: float = 0.0 # 剔除到期的 monotonic 时间
+    latency_ewma: Optional[float] = None # 成功请求延迟的滑动平均 (秒)
+    latencies: List[float] = field(default_factory=list)
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def has_capacity(self) -> bool:
+        return self.outstanding < self.max_concurrency
+
+
+class EndpointPool:
+    """线程安全的端点池。routing_policy 为 LLM_ROUTING_POLICIES 中的键。"""
+
+    def __init__(self, endpoints: List[LlmEndpoint], routing_policy: str = app_config.DEFAULT_LLM_ROUTING_POLICY,
+                 eject_after_failures: int = app_config.LLM_ENDPOINT_EJECT_AFTER_FAILURES,
+                 eject_seconds: float = app_config.LLM_ENDPOINT_EJECT_SECONDS):
+        if not endpoints:
+            raise ValueError("端点池至少需要一个端点")
+        self.endpoints = endpoints
+        self.routing_policy = routing_policy if routing_policy in app_config.LLM_ROUTING_POLICIES else app_config.DEFAULT_LLM_ROUTING_POLICY
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def total_concurrency(self) -> int:
+        return sum(endpoint.max_concurrency for endpoint in self.endpoints)
+
+    def cache_identity(self) -> Tuple[str, str]:
+        """
+        响应缓存键中代替 (地址, 模型) 的池标识。发送前无法知道由哪个端点处理，因此按整个池计键:
+        池内任一端点的响应都视为该池的结果，池的成员 (地址与模型) 变化后旧缓存不再命中，
+        也不会与单端点模式下某个模型的缓存混用。
+        """
+        members = sorted(f"{endpoint.target_url}#{endpoint.model}" for endpoint in self.endpoints)
+        return "endpoint-pool:" + "|".join(members), "endpoint-pool"
+
+    def _score(self, endpoint: LlmEndpoint) -> float:
+        """分数越低越优先。"""
+        if self.routing_policy == "latency_weighted":
+            # 尚无延迟样本的端点按已知端点的最小延迟估计，使其尽快得到试探
+            known = [e.latency_ewma for e in self.endpoints if e.latency_ewma is not None]
+            latency = endpoint.latency_ewma if endpoint.latency_ewma is not None else (min(known) if known else 1.0)
+            return latency * (endpoint.outstanding + 1) / endpoint.weight
+        return (endpoint.outstanding + 1) / endpoint.weight # least_outstanding
+
+    def _select(self, now: float) -> Optional[LlmEndpoint]:
+        """选择一个有空闲并发的端点；未被剔除的端点都已满载时返回None。调用方须持有 self._lock。"""
+        healthy = [e for e in self.endpoints if not e.is_ejected(now)]
+        # 全部端点都被剔除时不再等待冷却，选最早恢复的端点继续尝试
+        candidates = healthy or [min(self.endpoints, key=lambda e: e.ejected_until)]
+        available = [e for e in candidates if e.has_capacity()]
+        return min(available, key=self._score) if available else None
+
+    def acquire(self, is_running: Callable[[], bool] = lambda: True) -> Optional[LlmEndpoint]:
+        """阻塞直到某个端点有空闲并发，返回该端点并计入在途数；任务取消时返回None。"""
+        while True:
+            with self._lock:
+                endpoint = self._select(time.monotonic())
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    return endpoint
+            if not is_running():
+                return None
+            time.sleep(WAIT_SLICE_S)
+
+    def release(self, endpoint: LlmEndpoint, latency_s: float, failed: bool) -> Optional[str]:
+        """记录一次请求的结果；端点因本次失败被剔除时返回日志消息。"""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if not failed:
+                endpoint.successes += 1
+                endpoint.consecutive_failures = 0
+                endpoint.latencies.append(latency_s)
+                endpoint.latency_ewma = latency_s if endpoint.latency_ewma is None else \
+                    LATENCY_EWMA_ALPHA * latency_s + (1 - LATENCY_EWMA_ALPHA) * endpoint.latency_ewma
+                return None
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures < self.eject_after_failures:
+                return None
+            endpoint.consecutive_failures = 0
+            endpoint.ejections += 1
+            endpoint.ejected_until = time.monotonic() + self.eject_seconds
+            return f"端点 {endpoint.name} 连续失败 {self.eject_after_failures} 次，暂停分发 {self.eject_seconds:.0f} 秒。"
+
+    def call(self, send: Callable[[LlmEndpoint], T], is_running: Callable[[], bool],
+             log: Callable[[str], None]) -> T:
+        """选择端点执行 send(endpoint)。请求类异常计为该端点的失败并重新抛出，交给重试策略处理。"""
+        endpoint = self.acquire(is_running)
+        if endpoint is None:
+            raise RetryCancelled("等待可用端点时任务已取消")
+        started_at = time.monotonic()
+        try:
+            result = send(endpoint)
+        except requests.exceptions.RequestException:
+            message = self.release(endpoint, time.monotonic() - started_at, failed=True)
+            if message: log(message)
+            raise
+        except BaseException:
+            with self._lock: # 取消等与端点无关的原因，只归还在途数，不计入统计
+                endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            raise
+        self.release(endpoint, time.monotonic() - started_at, failed=False)
+        return result
+
+    def stats_lines(self) -> List[str]:
+        """每个端点一行统计: 请求数、失败数、剔除次数与延迟 (平均/p95)。"""
+        lines = []
+        with self._lock:
+            for endpoint in self.endpoints:
+                total = endpoint.successes + endpoint.failures
+                latency_note = "无成功请求"
+                if endpoint.latencies:
+                    ordered = sorted(endpoint.latencies)
+                    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                    latency_note = f"延迟平均 {sum(ordered) / len(ordered):.2f} 秒，p95 {p95:.2f} 秒"
+                lines.append(f"{endpoint.name} (模型 {endpoint.model}，权重 {endpoint.weight:g}，并发 {endpoint.max_concurrency}): "
+                             f"请求 {total} 次，失败 {endpoint.failures} 次，剔除 {endpoint.ejections} 次，{latency_note}")
+        return lines
@@ -0,0 +1,65 @@
+import socket
+import threading
+import weakref
+from typing import Any
+
+from requests.adapters import HTTPAdapter
+
+# --- 可立即取消的 HTTP 连接 ---
+# requests 在等待响应头或读取响应体时会一直阻塞到读超时 (LLM 为180秒，ElevenLabs 上传为600秒)，
+# 仅设置 is_running = False 无法让它提前返回。CancellableHTTPAdapter 记录经由它建立的每个连接，
+# abort_all() 从其他线程直接 shutdown 这些套接字，阻塞中的读写立即以连接错误返回。
+# 连接池中被关闭的空闲连接在下次取用时会被 urllib3 识别为已断开并自动重连。
+
+
+class CancellableHTTPAdapter(HTTPAdapter):
+    """记录所有连接 (包括经代理建立的连接) 的 HTTPAdapter，abort_all() 可从任意线程中断它们。"""
+
+    def __init__(self, *args, **kwargs):
+        self._connections: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        super().__init__(*args, **kwargs) # 会调用 init_poolmanager，须先初始化连接记录
+
+    def _track(self, connection: Any):
+        with self._connections_lock:
+            self._connections.add(connection)
+
+    def _patch_manager(self, manager: Any) -> Any:
+        """把连接池管理器的连接池类替换为会登记连接的子类。"""
+        if getattr(manager, "_cancellable_patched", False):
+            return manager
+        adapter = self
+
+        def _tracking_pool_class(pool_cls):
+            class TrackingConnection(pool_cls.ConnectionCls):
+                def connect(self):
+                    adapter._track(self)
+                    return super().connect()
+            return type(f"Tracking{pool_cls.__name__}", (pool_cls,), {"ConnectionCls": TrackingConnection})
+
+        manager.pool_classes_by_scheme = {scheme: _tracking_pool_class(pool_cls) for scheme, pool_cls in manager.pool_classes_by_scheme.items()}
+        manager._cancellable_patched = True
+        return manager
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._patch_manager(self.poolmanager)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        return self._patch_manager(super().proxy_manager_for(*args, **kwargs))
+
+    def abort_all(self) -> int:
+        """关闭所有已建立连接的套接字，返回实际关闭的数量。"""
+        with self._connections_lock:
+            connections = list(self._connections)
+        aborted = 0
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                aborted += 1
+            except OSError: # 已被对端或本地关闭
+                pass
+        return aborted
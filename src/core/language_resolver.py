@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Callable
+
+import config as app_config
+from core.rule_segmenter import guess_language
+
+# --- 提示词语言解析 ---
+# 按 指定语言 -> ASR 返回的 language_code -> 文本检测 的顺序确定分割提示词的语言。
+# 文本检测只取有限长度的样本 (开头、中间、结尾各一段)，langdetect 在第一次需要检测时才导入，
+# 检测结果按文本哈希缓存，同一转录在一次任务中被多次解析 (摘要、分割、断点索引) 时只检测一次。
+
+PROMPT_LANGUAGES = ("zh", "ja", "en") # 有对应提示词的语言
+
+# ASR 返回的语言代码写法不统一，规范化为两字母代码
+_LANGUAGE_ALIASES = {
+    "jpn": "ja", "japanese": "ja",
+    "zho": "zh", "chi": "zh", "cmn": "zh", "chinese": "zh", "mandarin": "zh",
+    "eng": "en", "english": "en",
+}
+
+_SAMPLE_WINDOWS = 3 # 长文本取样的段数
+
+
+def normalize_language_code(language_code: Optional[str]) -> Optional[str]:
+    """将 'ja-JP'、'jpn'、'Japanese' 等写法统一为两字母小写代码。"""
+    if not language_code or not isinstance(language_code, str):
+        return None
+    code = language_code.strip().lower().replace("_", "-")
+    if not code:
+        return None
+    primary = code.split("-", 1)[0]
+    return _LANGUAGE_ALIASES.get(primary, primary)
+
+
+def map_asr_language_code(language_code: Optional[str]) -> Optional[str]:
+    """把 ASR 语言代码映射为提示词语言；不是中/日/英时返回None。"""
+    code = normalize_language_code(language_code)
+    return code if code in PROMPT_LANGUAGES else None
+
+
+def sample_text(text: str, max_chars: int = app_config.LANGUAGE_DETECT_SAMPLE_CHARS) -> str:
+    """不超过 max_chars 的文本原样返回，否则取开头、中间、结尾等距的几段拼接。"""
+    if len(text) <= max_chars:
+        return text
+    window = max_chars // _SAMPLE_WINDOWS
+    step = (len(text) - window) // (_SAMPLE_WINDOWS - 1)
+    return "\n".join(text[i * step:i * step + window] for i in range(_SAMPLE_WINDOWS))
+
+
+@dataclass
+class LanguageResolution:
+    """一次语言解析的结果。language 为None表示无法判断 (使用默认提示词)。"""
+    language: Optional[str]
+    source: str # 日志中显示的来源说明
+
+
+class LanguageResolver:
+    """线程安全的提示词语言解析器，检测结果按文本哈希做 LRU 缓存。"""
+
+    def __init__(self, cache_size: int = app_config.LANGUAGE_DETECT_CACHE_SIZE,
+                 sample_chars: int = app_config.LANGUAGE_DETECT_SAMPLE_CHARS):
+        self.cache_size = cache_size
+        self.sample_chars = sample_chars
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._detect: Optional[Callable[[str], str]] = None
+        self._detector_loaded = False
+
+    def _get_detector(self) -> Optional[Callable[[str], str]]:
+        """第一次调用时导入 langdetect；未安装时返回None，改用按文字种类的粗略判断。"""
+        with self._lock:
+            if not self._detector_loaded:
+                self._detector_loaded = True
+                try:
+                    from langdetect import detect, DetectorFactory
+                    DetectorFactory.seed = 0 # 固定随机种子，同一文本每次检测结果相同
+                    self._detect = detect
+                except ImportError:
+                    self._detect = None
+            return self._detect
+
+    def _detect_language(self, sample: str) -> Optional[str]:
+        detect = self._get_detector()
+        if detect is None:
+            return guess_language(sample)
+        try:
+            return map_asr_language_code(detect(sample))
+        except Exception: # langdetect 对无可识别字符的文本抛出 LangDetectException
+            return None
+
+    def resolve(self, text: str, target_language: Optional[str] = None,
+                asr_language_code: Optional[str] = None) -> LanguageResolution:
+        """依次使用指定语言、ASR 语言代码与文本检测确定提示词语言。"""
+        if target_language in PROMPT_LANGUAGES:
+            return LanguageResolution(target_language, "指定")
+        asr_language = map_asr_language_code(asr_language_code)
+        if asr_language:
+            return LanguageResolution(asr_language, f"ASR 语言代码 '{asr_language_code}'")
+        if not text or not text.strip():
+            return LanguageResolution(None, "文本为空")
+        text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if text_hash in self._cache:
+                self._cache.move_to_end(text_hash)
+                return LanguageResolution(self._cache[text_hash], "检测 (缓存)")
+        started_at = time.perf_counter()
+        sample = sample_text(text, self.sample_chars)
+        language = self._detect_language(sample)
+        with self._lock:
+            self._cache[text_hash] = language
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        return LanguageResolution(language, f"检测 {len(sample)}/{len(text)} 字符样本，耗时 {elapsed_ms:.1f} 毫秒")
+
+
+_shared_resolver: Optional[LanguageResolver] = None
+_shared_resolver_lock = threading.Lock()
+
+
+def get_language_resolver() -> LanguageResolver:
+    """获取进程内共享的 LanguageResolver。"""
+    global _shared_resolver
+    with _shared_resolver_lock:
+        if _shared_resolver is None:
+            _shared_resolver = LanguageResolver()
+        return _shared_resolver
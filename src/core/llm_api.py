@@ -1,18 +1,217 @@
 import os
+import threading
 import requests
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Callable, Iterator
 import traceback
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
 
 import config as app_config # 使用别名
-
-from langdetect import detect, LangDetectException
+from utils import json_utils
+from core.llm_cache import LlmResponseCache, get_llm_response_cache, format_cache_stats
+from core.llm_retry import RetryPolicy, RetryCancelled, call_with_retry
+from core.rate_limiter import get_llm_rate_limiter
+from core.chunk_validator import check_chunk_integrity
+from core.endpoint_pool import EndpointPool, LlmEndpoint
+from core.http_cancel import CancellableHTTPAdapter
+from core.concurrency_controller import AimdConcurrencyController, classify_request_outcome
+from core.request_packing import format_packed_texts, pack_texts, split_packed_response
+from core.boundary_offsets import format_indexed_words, split_word_ranges, parse_break_offsets, word_ranges_from_breaks
+from core.data_models import TimestampedWord, join_word_texts
+from core.language_resolver import get_language_resolver
+from core.llm_telemetry import LlmTelemetry, LlmRequestEvent, get_active_telemetry, request_scope
+from core.token_estimator import estimate_payload_tokens, estimate_text_tokens, find_token_budget_end, usage_total_tokens, usage_prompt_cache_tokens, usage_prompt_completion_tokens
 
 DEFAULT_SYSTEM_PROMPT_FOR_SEGMENTATION = app_config.DEEPSEEK_SYSTEM_PROMPT_EN
 DEFAULT_SYSTEM_PROMPT_FOR_SUMMARY = app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_EN
 
-MAX_CHARS_PER_CHUNK = 2800
+CANCEL_POLL_INTERVAL_S = 0.2 # 等待并发请求时检查取消状态的间隔
+
+
+HTTP_POOL_CONNECTIONS = 4 # 缓存连接池的主机数 (通常只有一个API主机)
+
+
+class LlmHttpClient:
+    """
+    线程安全的共享HTTP客户端。持有带连接池的 requests.Session，
+    同一主机的后续请求复用已建立的 TCP+TLS 连接，避免每个块都重新握手。
+    停止任务时 abort_in_flight() 关闭所有连接，正在等待响应的请求立即返回。
+    """
+    def __init__(self, pool_maxsize: int = app_config.LLM_MAX_CONCURRENCY_LIMIT, pool_connections: int = HTTP_POOL_CONNECTIONS):
+        self._session = requests.Session()
+        self._session.headers["Connection"] = "keep-alive"
+        # 连接池容量不小于最大并发数，否则并发请求结束后多余的连接会被丢弃而无法复用
+        self._adapter = CancellableHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self._request_count = 0
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        with self._lock:
+            self._request_count += 1
+        return self._session.post(url, **kwargs)
+
+    def _opened_connection_count(self) -> int:
+        """汇总 urllib3 各连接池累计新建的连接数。"""
+        total = 0
+        pools = getattr(getattr(self._adapter, "poolmanager", None), "pools", None)
+        if pools is None:
+            return 0
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            total += getattr(pool, "num_connections", 0) if pool is not None else 0
+        return total
+
+    def connection_stats(self) -> Dict[str, int]:
+        """返回累计请求数、新建连接数与复用连接的请求数。"""
+        with self._lock:
+            request_count = self._request_count
+        opened = self._opened_connection_count()
+        return {"requests": request_count, "connections": opened, "reused": max(0, request_count - opened)}
+
+    def abort_in_flight(self) -> int:
+        """关闭所有连接的套接字，返回被关闭的连接数。"""
+        return self._adapter.abort_all()
+
+    def close(self):
+        self._session.close()
+
+
+_shared_http_client: Optional[LlmHttpClient] = None
+_shared_http_client_lock = threading.Lock()
+
+
+def get_llm_http_client() -> LlmHttpClient:
+    """获取进程内共享的 LlmHttpClient，首次调用时创建，之后在所有块和任务间复用。"""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None:
+            _shared_http_client = LlmHttpClient()
+        return _shared_http_client
+
+
+def abort_llm_requests() -> int:
+    """中断所有正在进行的 LLM 请求 (停止任务时调用)，返回被关闭的连接数；共享客户端尚未创建时返回0。"""
+    with _shared_http_client_lock:
+        client = _shared_http_client
+    return client.abort_in_flight() if client is not None else 0
+
+
+class PromptTokenUsage:
+    """线程安全的提示词 token 统计: 累计收到的响应数、报告了缓存命中的响应数、提示词 token 数与其中命中前缀缓存的部分。"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"responses": 0, "reported": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def record(self, data: Dict[str, Any]):
+        cache_tokens = usage_prompt_cache_tokens(data)
+        with self._lock:
+            self._stats["responses"] += 1
+            if cache_tokens is not None:
+                self._stats["reported"] += 1
+                self._stats["cached_tokens"] += cache_tokens[0]
+                self._stats["prompt_tokens"] += cache_tokens[1]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+
+_prompt_token_usage = PromptTokenUsage()
+
+
+def get_prompt_token_usage() -> PromptTokenUsage:
+    """进程内共享的提示词 token 统计，任务开始和结束时各取一次快照求差。"""
+    return _prompt_token_usage
+
+
+def _format_prompt_cache_usage(before: Dict[str, int], after: Dict[str, int]) -> str:
+    responses = after["responses"] - before["responses"]
+    reported = after["reported"] - before["reported"]
+    if responses == 0:
+        return "本次没有实际发送的请求。"
+    if reported == 0:
+        return f"{responses} 个响应的 usage 中均未包含缓存命中信息 (服务商可能不支持前缀缓存)。"
+    prompt_tokens = after["prompt_tokens"] - before["prompt_tokens"]
+    cached_tokens = after["cached_tokens"] - before["cached_tokens"]
+    hit_ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+    return (f"{reported}/{responses} 个响应报告了缓存命中: 提示词 {prompt_tokens} token，"
+            f"命中前缀缓存 {cached_tokens} token ({hit_ratio:.1%})，未命中 {prompt_tokens - cached_tokens} token。")
+
+
+def _chunk_user_content(summary: Optional[str], body_label: str, body: str) -> str:
+    """
+    组装文本块请求的用户消息。服务商的前缀缓存按请求开头逐字节匹配，因此稳定的部分放在最前:
+    系统提示词 (单独的 system 消息) 之后紧跟整个任务内不变的【全文摘要】，每块不同的内容放在最后。
+    """
+    prefix = f"【全文摘要】:\n{summary}\n\n" if summary else ""
+    return f"{prefix}{body_label}:\n{body}"
+
+
+def _format_connection_reuse(before: Dict[str, int], after: Dict[str, int]) -> str:
+    requests_sent = after["requests"] - before["requests"]
+    opened = after["connections"] - before["connections"]
+    reused = max(0, requests_sent - opened)
+    return f"本次共发送 {requests_sent} 个请求，新建 {opened} 个连接，复用连接 {reused} 次。"
+
+
+@dataclass
+class LlmJobOptions:
+    """单次分割任务的调度选项，由 config.json 中的任务选项键构造。"""
+    max_concurrency: int = app_config.DEFAULT_LLM_MAX_CONCURRENCY # 同时在途的分块请求数
+    bypass_cache: bool = app_config.DEFAULT_LLM_BYPASS_CACHE # 不读取响应缓存
+    retry_policy: RetryPolicy = field(default_factory=RetryPolicy) # 暂时性错误的重试策略
+    requests_per_minute: int = app_config.DEFAULT_LLM_REQUESTS_PER_MINUTE # RPM 上限，0 为不限
+    tokens_per_minute: int = app_config.DEFAULT_LLM_TOKENS_PER_MINUTE # TPM 上限，0 为不限
+    stream: bool = app_config.DEFAULT_LLM_STREAM # 以 SSE 流式接收响应
+    pipeline_alignment: bool = app_config.DEFAULT_LLM_PIPELINE_ALIGNMENT # 对齐与后续块的请求并行进行
+    context_window: int = app_config.DEFAULT_LLM_CONTEXT_WINDOW # 模型上下文窗口 (token)
+    max_output_tokens: int = app_config.DEFAULT_LLM_MAX_OUTPUT_TOKENS # 单次响应的输出上限 (token)
+    summary_policy: str = app_config.DEFAULT_LLM_SUMMARY_POLICY # 摘要与分割的调度策略
+    summary_model: str = app_config.DEFAULT_LLM_SUMMARY_MODEL # small_model 策略的摘要模型
+    endpoint_pool: List[Dict[str, Any]] = field(default_factory=list) # 端点池配置，空列表表示只用主设置的端点
+    routing_policy: str = app_config.DEFAULT_LLM_ROUTING_POLICY # 端点池的分发策略
+    adaptive_concurrency: bool = app_config.DEFAULT_LLM_ADAPTIVE_CONCURRENCY # 按 AIMD 自动调整并发，max_concurrency 为上限
+    min_concurrency: int = app_config.DEFAULT_LLM_MIN_CONCURRENCY # 自适应并发的下限
+    write_telemetry: bool = app_config.DEFAULT_LLM_WRITE_TELEMETRY # 在SRT旁写出请求统计JSON
+
+    @classmethod
+    def from_config(cls, config_dict: Optional[Dict[str, Any]]) -> "LlmJobOptions":
+        config_dict = config_dict or {}
+
+        def _int_option(key: str, default: int) -> int:
+            try:
+                return int(config_dict.get(key, default))
+            except (TypeError, ValueError):
+                return default
+
+        max_concurrency = _int_option(app_config.USER_LLM_MAX_CONCURRENCY_KEY, app_config.DEFAULT_LLM_MAX_CONCURRENCY)
+        summary_policy = config_dict.get(app_config.USER_LLM_SUMMARY_POLICY_KEY, app_config.DEFAULT_LLM_SUMMARY_POLICY)
+        if summary_policy not in app_config.LLM_SUMMARY_POLICIES: summary_policy = app_config.DEFAULT_LLM_SUMMARY_POLICY
+        endpoint_pool = config_dict.get(app_config.USER_LLM_ENDPOINT_POOL_KEY, app_config.DEFAULT_LLM_ENDPOINT_POOL)
+        endpoint_pool = [entry for entry in endpoint_pool if isinstance(entry, dict) and entry.get("base_url")] if isinstance(endpoint_pool, list) else []
+        routing_policy = config_dict.get(app_config.USER_LLM_ROUTING_POLICY_KEY, app_config.DEFAULT_LLM_ROUTING_POLICY)
+        if routing_policy not in app_config.LLM_ROUTING_POLICIES: routing_policy = app_config.DEFAULT_LLM_ROUTING_POLICY
+        return cls(
+            max_concurrency=max(1, min(max_concurrency, app_config.LLM_MAX_CONCURRENCY_LIMIT)),
+            bypass_cache=bool(config_dict.get(app_config.USER_LLM_BYPASS_CACHE_KEY, app_config.DEFAULT_LLM_BYPASS_CACHE)),
+            requests_per_minute=max(0, _int_option(app_config.USER_LLM_REQUESTS_PER_MINUTE_KEY, app_config.DEFAULT_LLM_REQUESTS_PER_MINUTE)),
+            tokens_per_minute=max(0, _int_option(app_config.USER_LLM_TOKENS_PER_MINUTE_KEY, app_config.DEFAULT_LLM_TOKENS_PER_MINUTE)),
+            stream=bool(config_dict.get(app_config.USER_LLM_STREAM_KEY, app_config.DEFAULT_LLM_STREAM)),
+            pipeline_alignment=bool(config_dict.get(app_config.USER_LLM_PIPELINE_ALIGNMENT_KEY, app_config.DEFAULT_LLM_PIPELINE_ALIGNMENT)),
+            context_window=max(app_config.LLM_MIN_CHUNK_TOKENS, _int_option(app_config.USER_LLM_CONTEXT_WINDOW_KEY, app_config.DEFAULT_LLM_CONTEXT_WINDOW)),
+            max_output_tokens=max(app_config.LLM_MIN_CHUNK_TOKENS, _int_option(app_config.USER_LLM_MAX_OUTPUT_TOKENS_KEY, app_config.DEFAULT_LLM_MAX_OUTPUT_TOKENS)),
+            summary_policy=summary_policy,
+            summary_model=str(config_dict.get(app_config.USER_LLM_SUMMARY_MODEL_KEY, app_config.DEFAULT_LLM_SUMMARY_MODEL) or "").strip(),
+            endpoint_pool=endpoint_pool,
+            routing_policy=routing_policy,
+            adaptive_concurrency=bool(config_dict.get(app_config.USER_LLM_ADAPTIVE_CONCURRENCY_KEY, app_config.DEFAULT_LLM_ADAPTIVE_CONCURRENCY)),
+            min_concurrency=max(1, min(_int_option(app_config.USER_LLM_MIN_CONCURRENCY_KEY, app_config.DEFAULT_LLM_MIN_CONCURRENCY), app_config.LLM_MAX_CONCURRENCY_LIMIT)),
+            write_telemetry=bool(config_dict.get(app_config.USER_LLM_WRITE_TELEMETRY_KEY, app_config.DEFAULT_LLM_WRITE_TELEMETRY)),
+        )
 
 
 def _parse_api_url_and_model(
@@ -61,7 +260,241 @@ def _log_api_message(message: str, signals_forwarder: Optional[Any], prefix: str
     else:
         print(f"{prefix} {message}")
 
-def _split_text_into_chunks(text: str, max_chars: int, signals_forwarder: Optional[Any]) -> List[str]:
+def _is_job_running(signals_forwarder: Optional[Any]) -> bool:
+    """通过 signals_forwarder.parent().is_running 查询任务是否仍在运行。"""
+    if signals_forwarder and hasattr(signals_forwarder, 'parent') and hasattr(signals_forwarder.parent(), 'is_running'):
+        return signals_forwarder.parent().is_running
+    return True
+
+def _build_endpoint_pool(job_options: "LlmJobOptions", api_key: str, custom_model_name: Optional[str]) -> Optional[EndpointPool]:
+    """由任务选项中的端点池配置构造 EndpointPool；未配置时返回None。未填写的模型与 API Key 沿用主设置。"""
+    if not job_options.endpoint_pool: return None
+    endpoints: List[LlmEndpoint] = []
+    for index, entry in enumerate(job_options.endpoint_pool):
+        target_url, model = _parse_api_url_and_model(entry.get("base_url"), entry.get("model") or custom_model_name)
+        try:
+            weight = max(0.01, float(entry.get("weight", 1)))
+            max_concurrency = max(1, min(int(entry.get("max_concurrency", job_options.max_concurrency)), app_config.LLM_MAX_CONCURRENCY_LIMIT))
+        except (TypeError, ValueError):
+            weight, max_concurrency = 1.0, job_options.max_concurrency
+        endpoints.append(LlmEndpoint(
+            name=str(entry.get("name") or f"#{index + 1} {target_url}"), target_url=target_url, model=model,
+            api_key=str(entry.get("api_key") or api_key), weight=weight, max_concurrency=max_concurrency
+        ))
+    return EndpointPool(endpoints, job_options.routing_policy)
+
+def _call_with_retry_traced(kind: str, send: Callable[[], Any], policy: RetryPolicy, is_running: Callable[[], bool],
+                            log: Callable[[str], None], label: str) -> Any:
+    """call_with_retry 的遥测版本: 其间每次实际发送都以 kind/label 记入当前任务的遥测，并按顺序编号尝试次数。"""
+    with request_scope(kind, label):
+        return call_with_retry(send, policy, is_running, log, label)
+
+def _build_concurrency_controller(job_options: "LlmJobOptions", max_workers: int,
+                                  log: Callable[[str], None]) -> Optional[AimdConcurrencyController]:
+    """开启自适应并发且允许多于1个并发时，构造以 max_workers 为上限的 AIMD 控制器；否则返回None。"""
+    if not job_options.adaptive_concurrency or max_workers <= 1: return None
+    controller = AimdConcurrencyController(min(job_options.min_concurrency, max_workers), max_workers)
+    log(f"自适应并发: 区间 [{controller.min_limit}, {controller.max_limit}]，初始 {controller.limit}。")
+    return controller
+
+def _send_chunk_request(endpoint_pool: Optional[EndpointPool], target_url: str, api_key: str, payload: Dict[str, Any],
+                        timeout: float, is_running: Callable[[], bool], log: Callable[[str], None],
+                        on_line: Optional[Callable[[str], None]] = None,
+                        concurrency: Optional[AimdConcurrencyController] = None) -> Dict[str, Any]:
+    """
+    发送一次文本块请求: 配置了端点池时由其选择端点 (替换请求中的模型与 Key)，否则发往主设置的端点。
+    指定 concurrency 时先等待自适应并发的空位，并把本次请求的结果反馈给控制器。
+    """
+    if concurrency is not None:
+        sent_at = concurrency.acquire(is_running)
+        if sent_at is None: raise RetryCancelled("等待并发空位时任务已取消")
+        error: Optional[BaseException] = None
+        try:
+            return _send_chunk_request(endpoint_pool, target_url, api_key, payload, timeout, is_running, log, on_line)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            message = concurrency.release(sent_at, classify_request_outcome(error))
+            if message: log(f"自适应并发: {message}")
+    if endpoint_pool is None:
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        return _post_chat_completion(target_url, headers, payload, timeout, is_running, on_line)
+
+    def _send_to(endpoint: LlmEndpoint) -> Dict[str, Any]:
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {endpoint.api_key}"}
+        return _post_chat_completion(endpoint.target_url, headers, {**payload, "model": endpoint.model}, timeout, is_running, on_line)
+    return endpoint_pool.call(_send_to, is_running, log)
+
+def _cache_target(endpoint_pool: Optional[EndpointPool], target_url: str, effective_model: str) -> tuple[str, str]:
+    """文本块请求的缓存键所用的 (地址, 模型)；端点池模式下为与具体端点无关的池标识，见 EndpointPool.cache_identity。"""
+    return endpoint_pool.cache_identity() if endpoint_pool is not None else (target_url, effective_model)
+
+def _iter_sse_lines(response: requests.Response, state: Dict[str, Any],
+                    is_running: Callable[[], bool] = lambda: True) -> Iterator[str]:
+    """
+    解析 OpenAI 兼容接口的 SSE 响应，每当增量内容中出现换行就产出一行完整文本。
+    完整内容、结束原因、usage 及流中的错误事件写入 state。任务取消时抛出 RetryCancelled。
+    """
+    content_parts: List[str] = []
+    pending = ""
+    state["content"] = ""
+    # chunk_size=None: 按服务器发送的分块即时读取，而不是凑满固定字节数
+    for raw_line in response.iter_lines(chunk_size=None):
+        if not is_running():
+            raise RetryCancelled("流式接收期间任务已取消")
+        if not raw_line:
+            continue
+        line = raw_line.decode("utf-8", errors="replace") if isinstance(raw_line, bytes) else raw_line
+        if not line.startswith("data:"):
+            continue # 注释行 (": keep-alive") 以及 event:/id: 字段
+        event_data = line[5:].strip()
+        if event_data == "[DONE]":
+            break
+        event = json_utils.loads(event_data)
+        if not isinstance(event, dict):
+            continue
+        if event.get("error"):
+            state["error"] = event["error"]
+            break
+        if isinstance(event.get("usage"), dict):
+            state["usage"] = event["usage"]
+        for choice in event.get("choices") or []:
+            delta_text = (choice.get("delta") or {}).get("content")
+            if delta_text:
+                content_parts.append(delta_text)
+                state["content"] = "".join(content_parts)
+                pending += delta_text
+                while "\n" in pending:
+                    complete_line, pending = pending.split("\n", 1)
+                    yield complete_line
+            if choice.get("finish_reason"):
+                state["finish_reason"] = choice["finish_reason"]
+    if pending:
+        yield pending
+
+def _post_chat_completion(target_url: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: float,
+                          is_running: Callable[[], bool] = lambda: True,
+                          on_line: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    发送一次 chat/completions 请求并解析JSON响应；HTTP错误以异常形式抛出，交给重试策略判断。
+    发送前从共享限流器取得 RPM/TPM 额度，收到响应后用 usage 修正 token 预估。
+    payload 含 "stream": True 时以 SSE 接收，每收到一行完整文本调用 on_line，
+    最后组装成与非流式响应相同结构的字典返回。
+    """
+    rate_limiter = get_llm_rate_limiter()
+    estimated_tokens = estimate_payload_tokens(payload)
+    if not rate_limiter.acquire(estimated_tokens, is_running):
+        raise RetryCancelled("等待速率限制额度时任务已取消")
+    streaming = bool(payload.get("stream"))
+    if streaming and "stream_options" not in payload:
+        payload = {**payload, "stream_options": {"include_usage": True}} # 让流的最后一个事件带上 usage
+    telemetry = get_active_telemetry()
+    event = telemetry.begin_event(target_url, str(payload.get("model", "")), streaming) if telemetry else None
+    sent_at = time.perf_counter()
+    try:
+        response = get_llm_http_client().post(target_url, headers=headers, data=json_utils.dumps_bytes(payload),
+                                              timeout=(app_config.LLM_CONNECT_TIMEOUT_S, timeout), stream=streaming)
+    except Exception as e:
+        _finish_request_event(telemetry, event, sent_at, error=e)
+        if not is_running(): raise RetryCancelled("请求被中断，任务已取消") from e # abort_llm_requests 关闭了连接
+        raise
+    try:
+        response.raise_for_status()
+        if not streaming or "text/event-stream" not in response.headers.get("Content-Type", ""):
+            data = json_utils.loads(response.content) # 未开启流式，或服务器忽略了 stream 参数
+        else:
+            state: Dict[str, Any] = {}
+            for line in _iter_sse_lines(response, state, is_running):
+                if on_line is not None: on_line(line)
+            if state.get("error") and not state["content"]:
+                data = {"error": state["error"]}
+            else:
+                data = {"choices": [{"message": {"role": "assistant", "content": state["content"]}, "finish_reason": state.get("finish_reason", "unknown")}]}
+                if state.get("usage"): data["usage"] = state["usage"]
+    except BaseException as e:
+        _finish_request_event(telemetry, event, sent_at, response=response, error=e)
+        if isinstance(e, requests.exceptions.RequestException) and not is_running(): raise RetryCancelled("接收响应时任务已取消") from e
+        raise
+    finally:
+        response.close()
+    _finish_request_event(telemetry, event, sent_at, response=response, data=data)
+    rate_limiter.reconcile(estimated_tokens, usage_total_tokens(data))
+    get_prompt_token_usage().record(data)
+    return data
+
+def _finish_request_event(telemetry: Optional[LlmTelemetry], event: Optional[LlmRequestEvent], sent_at: float,
+                          response: Optional[requests.Response] = None, data: Optional[Dict[str, Any]] = None,
+                          error: Optional[BaseException] = None):
+    """补全一次请求的遥测事件 (状态码、耗时、token 与结束原因) 并记入当前任务。"""
+    if telemetry is None or event is None: return
+    event.latency_s = round(time.perf_counter() - sent_at, 3)
+    if response is not None:
+        event.status = response.status_code
+        event.ttfb_s = round(response.elapsed.total_seconds(), 3) # requests 的 elapsed 截止到响应头解析完成
+    if error is not None: event.error = type(error).__name__
+    if data is not None:
+        content, finish_reason = _extract_completion_content(data)
+        if content is None: event.error = "ApiError" # 200 响应但内容是错误信息
+        else:
+            event.finish_reason = finish_reason
+            event.output_chars = len(content)
+            if event.latency_s > 0: event.chars_per_second = round(len(content) / event.latency_s, 1)
+        event.prompt_tokens, event.completion_tokens = usage_prompt_completion_tokens(data)
+        cache_tokens = usage_prompt_cache_tokens(data)
+        if cache_tokens is not None: event.cached_tokens = cache_tokens[0]
+    telemetry.record(event)
+
+def _describe_request_error(e: requests.exceptions.RequestException) -> str:
+    """提取 OpenAI / Gemini 风格错误响应中的类型、代码与消息。"""
+    if e.response is None:
+        return f": {str(e)}"
+    try:
+        err_json_data = json_utils.loads(e.response.content); err_info_openai = err_json_data.get('error', {}); err_info_gemini = err_json_data if "message" in err_json_data and "code" in err_json_data else {}
+        message = err_info_openai.get('message', err_info_gemini.get('message', e.response.text)); err_type = err_info_openai.get('type', err_info_gemini.get('status', 'UnknownType')); err_code = err_info_openai.get('code', err_info_gemini.get('code', 'UnknownCode'))
+        return f": [{err_type}/{err_code}] {message}"
+    except (json_utils.JSONDecodeError, AttributeError): return f": {e.response.text[:200]}"
+
+def _extract_completion_content(data: Dict[str, Any]) -> tuple[Optional[str], str]:
+    """从 OpenAI 兼容 (choices) 或 Gemini (candidates) 格式的响应中取出文本内容与结束原因。"""
+    content = None; finish_reason = "unknown"
+    if "choices" in data and data["choices"] and isinstance(data["choices"], list) and len(data["choices"]) > 0 and \
+       isinstance(data["choices"][0], dict) and data["choices"][0].get("message", {}).get("content") is not None:
+        choice = data["choices"][0]; content = choice.get("message", {}).get("content"); finish_reason = choice.get("finish_reason", "unknown")
+    elif data.get("candidates") and isinstance(data["candidates"], list) and len(data["candidates"]) > 0 and \
+         isinstance(data["candidates"][0], dict) and \
+         data["candidates"][0].get("content", {}).get("parts", [{}]) and \
+         isinstance(data["candidates"][0].get("content").get("parts"), list) and \
+         len(data["candidates"][0].get("content").get("parts")) > 0 and \
+         isinstance(data["candidates"][0].get("content").get("parts")[0], dict) and \
+         data["candidates"][0].get("content").get("parts")[0].get("text") is not None:
+        content = data["candidates"][0].get("content").get("parts")[0].get("text"); finish_reason = data["candidates"][0].get("finishReason", "unknown")
+    return content, finish_reason
+
+def _segmentation_prompt_for_language(language: Optional[str]) -> str:
+    if language == 'ja': return app_config.DEEPSEEK_SYSTEM_PROMPT_JA
+    elif language == 'zh': return app_config.DEEPSEEK_SYSTEM_PROMPT_ZH
+    elif language == 'en': return app_config.DEEPSEEK_SYSTEM_PROMPT_EN
+    return DEFAULT_SYSTEM_PROMPT_FOR_SEGMENTATION
+
+def _summary_prompt_for_language(language: Optional[str]) -> str:
+    if language == 'ja': return app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_JA
+    elif language == 'zh': return app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_ZH
+    elif language == 'en': return app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_EN
+    return DEFAULT_SYSTEM_PROMPT_FOR_SUMMARY
+
+def _chunk_token_budget(job_options: "LlmJobOptions", system_prompt: str, summary_tokens: int) -> int:
+    """
+    计算每个文本块的 token 预算: 分割结果 (约为原文的 LLM_SEGMENT_OUTPUT_EXPANSION 倍) 须放得进输出上限，
+    且 系统提示词 + 摘要 + 文本块 + 输出上限 不超过上下文窗口。
+    """
+    output_limited = int(job_options.max_output_tokens * app_config.LLM_CHUNK_OUTPUT_SAFETY / app_config.LLM_SEGMENT_OUTPUT_EXPANSION)
+    prompt_tokens = estimate_text_tokens(system_prompt) + summary_tokens + 64 # 64: 消息开销与块标题
+    context_limited = job_options.context_window - prompt_tokens - job_options.max_output_tokens
+    return max(app_config.LLM_MIN_CHUNK_TOKENS, min(output_limited, context_limited))
+
+def _split_text_into_chunks(text: str, max_tokens: int, signals_forwarder: Optional[Any], language: Optional[str] = None) -> List[str]:
+    """按估算的 token 数切分文本，每块不超过 max_tokens，并尽量在段落、换行、句末或空格处断开。"""
     def _log_splitter(message: str):
         _log_api_message(message, signals_forwarder, prefix="[LLM API - Splitter]")
 
@@ -69,7 +502,8 @@ def _split_text_into_chunks(text: str, max_chars: int, signals_forwarder: Option
     current_pos = 0; text_len = len(text)
     if not text.strip(): _log_splitter("输入文本为空或仅包含空白，不进行分割。"); return []
     while current_pos < text_len:
-        end_pos = min(current_pos + max_chars, text_len); actual_chunk_end = end_pos
+        end_pos = find_token_budget_end(text, current_pos, max_tokens, language); actual_chunk_end = end_pos
+        max_chars = end_pos - current_pos
         if end_pos < text_len:
             para_break = text.rfind('\n\n', current_pos, end_pos)
             if para_break != -1 and para_break > current_pos: actual_chunk_end = para_break + 2
@@ -100,70 +534,168 @@ def _get_summary(
     custom_api_base_url_str: Optional[str],
     custom_model_name: Optional[str],
     custom_temperature: Optional[float],
-    signals_forwarder: Optional[Any] = None
+    signals_forwarder: Optional[Any] = None,
+    job_options: Optional["LlmJobOptions"] = None,
+    language: Optional[str] = None
 ) -> Optional[str]:
+    """
+    获取全文摘要。文本能宽松地放进单次请求时直接摘要；否则按组并行摘要 (map)，
+    再把各组摘要合并摘要 (reduce)，合并结果仍过长时逐层继续。最终结果按整篇转录缓存。
+    """
+    job_options = job_options or LlmJobOptions()
+
     def _log_summary_api(message: str):
         _log_api_message(message, signals_forwarder, prefix="[LLM API - Summary]")
 
+    def is_running() -> bool:
+        return _is_job_running(signals_forwarder)
+
     target_url, effective_model = _parse_api_url_and_model(
         custom_api_base_url_str, custom_model_name,
         app_config.DEFAULT_LLM_API_BASE_URL, app_config.DEFAULT_LLM_MODEL_NAME
     )
     effective_summary_temperature = custom_temperature if custom_temperature is not None else 0.5
+    summary_temperature_in_payload = effective_summary_temperature if custom_temperature is not None else None
+    response_cache = get_llm_response_cache(signals_forwarder)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
 
+    def _request_summary(text: str, label: str, check_cache: bool = True) -> tuple[Optional[str], bool]:
+        """发送一次摘要请求，返回 (摘要, 是否被截断)。失败或取消时摘要为None。"""
+        payload = {"model": effective_model, "messages": [{"role": "system", "content": system_prompt_summary}, {"role": "user", "content": text}]}
+        if custom_temperature is not None: payload["temperature"] = effective_summary_temperature
+        if job_options.stream: payload["stream"] = True
+
+        cache_key = LlmResponseCache.make_key(target_url, effective_model, payload.get("temperature"), system_prompt_summary, text)
+        if check_cache and not job_options.bypass_cache:
+            cached_summary = response_cache.get(cache_key)
+            if cached_summary is not None:
+                _log_summary_api(f"{label}命中缓存，跳过API请求。")
+                return cached_summary.strip(), False
+        if not is_running(): return None, False
+
+        request_started_at = time.perf_counter()
+        first_line_latency: List[float] = []
+
+        def _on_summary_line(line: str):
+            if not first_line_latency: first_line_latency.append(time.perf_counter() - request_started_at)
+
+        try:
+            data = _call_with_retry_traced("summary",
+                lambda: _post_chat_completion(target_url, headers, payload, 180, is_running, _on_summary_line),
+                job_options.retry_policy, is_running, _log_summary_api, label
+            )
+            if first_line_latency: _log_summary_api(f"流式响应: {label}首行在请求发出后 {first_line_latency[0]:.2f} 秒到达。")
+            content, finish_reason = _extract_completion_content(data)
+
+            if content is not None:
+                _log_summary_api(f"{label}成功。完成原因: {finish_reason}")
+                truncated = finish_reason == "MAX_TOKENS" or finish_reason == "length"
+                if truncated:
+                    _log_summary_api(f"警告: {label}的输出可能因达到API的默认max_tokens限制而被截断。")
+                else:
+                    response_cache.put(cache_key, content) # 被截断的输出不写入缓存
+                return content.strip(), truncated
+            else: 
+                _log_summary_api(f"错误: LLM API 对{label}的响应中内容为空或格式不符。完成原因: {finish_reason}, 响应数据: {str(data)[:500]}")
+        except RetryCancelled as e: _log_summary_api(f"{label}已取消: {e}。")
+        except requests.exceptions.Timeout: _log_summary_api(f"错误: LLM API 对{label}超时 (180秒)。URL: {target_url}")
+        except requests.exceptions.RequestException as e: 
+            status_code = e.response.status_code if e.response is not None else 'N/A'
+            _log_summary_api(f"错误: LLM API 对{label}失败 (状态码: {status_code}) URL: {target_url}: {e}")
+        except Exception as e: _log_summary_api(f"错误: 处理 LLM API 对{label}的响应时发生未知错误 (URL: {target_url}): {e}"); _log_summary_api(traceback.format_exc())
+        return None, False
+
+    transcript_cache_key = LlmResponseCache.make_key(target_url, effective_model, summary_temperature_in_payload, system_prompt_summary, full_text)
+    if not job_options.bypass_cache:
+        cached_summary = response_cache.get(transcript_cache_key)
+        if cached_summary is not None:
+            _log_summary_api("摘要命中缓存，跳过API请求。")
+            return cached_summary.strip()
+
+    # 直接摘要的上限: 不超过上下文窗口扣除提示词与输出后的一定比例，也不超过固定上限，避免单次请求耗时过长
+    direct_limit = max(app_config.LLM_MIN_CHUNK_TOKENS, min(
+        app_config.LLM_SUMMARY_DIRECT_MAX_TOKENS,
+        int((job_options.context_window - job_options.max_output_tokens - estimate_text_tokens(system_prompt_summary)) * app_config.LLM_SUMMARY_CONTEXT_FRACTION)
+    ))
+    text_tokens = estimate_text_tokens(full_text, language)
     _log_summary_api(f"向 LLM API 请求文本摘要 (URL: {target_url}, 模型: {effective_model}, 温度: {effective_summary_temperature})...")
-    
-    payload = {"model": effective_model, "messages": [{"role": "system", "content": system_prompt_summary}, {"role": "user", "content": full_text}]}
-    if custom_temperature is not None: payload["temperature"] = effective_summary_temperature
-    
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
-    try:
-        response = requests.post(target_url, headers=headers, json=payload, timeout=180)
-        response.raise_for_status(); data = response.json()
-        content = None; finish_reason = "unknown"
-        if "choices" in data and data["choices"] and isinstance(data["choices"], list) and len(data["choices"]) > 0 and \
-           isinstance(data["choices"][0], dict) and data["choices"][0].get("message", {}).get("content") is not None:
-            choice = data["choices"][0]; content = choice.get("message", {}).get("content"); finish_reason = choice.get("finish_reason", "unknown")
-        elif data.get("candidates") and isinstance(data["candidates"], list) and len(data["candidates"]) > 0 and \
-             isinstance(data["candidates"][0], dict) and \
-             data["candidates"][0].get("content", {}).get("parts", [{}]) and \
-             isinstance(data["candidates"][0].get("content").get("parts"), list) and \
-             len(data["candidates"][0].get("content").get("parts")) > 0 and \
-             isinstance(data["candidates"][0].get("content").get("parts")[0], dict) and \
-             data["candidates"][0].get("content").get("parts")[0].get("text") is not None:
-            content = data["candidates"][0].get("content").get("parts")[0].get("text"); finish_reason = data["candidates"][0].get("finishReason", "unknown")
-
-        if content is not None:
-            _log_summary_api(f"摘要获取成功。完成原因: {finish_reason}")
-            if finish_reason == "MAX_TOKENS" or finish_reason == "length": 
-                _log_summary_api(f"警告: 摘要输出可能因达到API的默认max_tokens限制而被截断。")
-            return content.strip()
-        else: 
-            error_info = data.get('error', {}); 
-            if not error_info and data.get("code") and data.get("message"): error_info = data
-            error_msg = error_info.get('message', str(data))
-            _log_summary_api(f"错误: LLM API 对摘要请求的响应中内容为空或格式不符。完成原因: {finish_reason}, 响应数据: {str(data)[:500]}")
-    except requests.exceptions.Timeout: _log_summary_api(f"错误: LLM API 对摘要请求超时 (180秒)。URL: {target_url}"); return None
-    except requests.exceptions.RequestException as e: 
-        status_code = e.response.status_code if e.response is not None else 'N/A'
-        _log_summary_api(f"错误: LLM API 对摘要请求失败 (状态码: {status_code}) URL: {target_url}: {e}"); return None
-    except Exception as e: _log_summary_api(f"错误: 处理 LLM API 对摘要请求的响应时发生未知错误 (URL: {target_url}): {e}"); _log_summary_api(traceback.format_exc()); return None
-    return None
+    if text_tokens <= direct_limit:
+        summary, truncated = _request_summary(full_text, "摘要请求", check_cache=False)
+    else:
+        summary, truncated = None, False
+        level_text = full_text; level = 1; level_tokens = text_tokens
+        while True:
+            groups = _split_text_into_chunks(level_text, direct_limit, signals_forwarder, language)
+            if len(groups) <= 1:
+                summary, level_truncated = _request_summary(level_text, "合并摘要请求")
+                truncated = truncated or level_truncated
+                break
+            if level > app_config.LLM_SUMMARY_MAX_LEVELS:
+                # 各组摘要合并后仍放不进单次请求: 不再继续合并，截取开头部分作为摘要 (结果不完整，不缓存)
+                _log_summary_api(f"警告: 已合并 {app_config.LLM_SUMMARY_MAX_LEVELS} 层仍超过单次摘要上限，改用各组摘要的开头部分。")
+                summary, truncated = level_text[:find_token_budget_end(level_text, 0, direct_limit, language)], True
+                break
+            _log_summary_api(f"文本约 {level_tokens} token，超过单次摘要上限 {direct_limit}。第 {level} 层: 将 {len(groups)} 组文本并行摘要后合并。")
+            group_workers = max(1, min(job_options.max_concurrency, len(groups)))
+            with ThreadPoolExecutor(max_workers=group_workers, thread_name_prefix="llm-summary") as executor:
+                group_results = list(executor.map(lambda item: _request_summary(item[1], f"第 {level} 层第 {item[0] + 1}/{len(groups)} 组摘要请求"), enumerate(groups)))
+            if not is_running(): _log_summary_api("分组摘要期间任务已取消。"); return None
+            partial_summaries = [partial for partial, _ in group_results if partial]
+            truncated = truncated or any(flag for _, flag in group_results)
+            if len(partial_summaries) < len(groups):
+                truncated = True # 缺少部分内容的摘要只用于本次任务，不写入缓存
+                _log_summary_api(f"警告: {len(groups) - len(partial_summaries)}/{len(groups)} 组摘要失败，合并时将缺少对应部分。")
+            if not partial_summaries: break
+            if len(partial_summaries) == 1:
+                summary = partial_summaries[0]; break
+            level_text = "\n\n".join(partial_summaries); level += 1
+            next_tokens = estimate_text_tokens(level_text, language)
+            if next_tokens >= level_tokens:
+                _log_summary_api(f"警告: 第 {level - 1} 层摘要合计约 {next_tokens} token，没有比上一层缩短，停止逐层合并。")
+                summary, truncated = level_text[:find_token_budget_end(level_text, 0, direct_limit, language)], True
+                break
+            level_tokens = next_tokens
+
+    if summary is None: return None
+    # 按整篇转录缓存，重跑时跳过分组与合并；任一层有组失败、被截断或未能合并完成时不缓存
+    if not truncated and text_tokens > direct_limit: response_cache.put(transcript_cache_key, summary)
+    return summary
 
 def call_llm_api_for_segmentation(
     api_key: str, text_to_segment: str,
     custom_api_base_url_str: Optional[str], custom_model_name: Optional[str],
     custom_temperature: Optional[float],
-    signals_forwarder: Optional[Any] = None, target_language: Optional[str] = None
+    signals_forwarder: Optional[Any] = None, target_language: Optional[str] = None,
+    job_options: Optional["LlmJobOptions"] = None,
+    on_chunk_segments: Optional[Callable[[List[str]], None]] = None,
+    asr_language_code: Optional[str] = None
 ) -> Optional[List[str]]:
+    """
+    分块请求 LLM 分割全文，返回按原文顺序拼接的片段列表。
+    提示词语言按 target_language (用户指定)、asr_language_code (ASR 返回的语言代码)、文本检测的顺序确定。
+    指定 on_chunk_segments 时，每当从第一块起连续的块完成，就按块顺序把该块的片段传给它 (在调用线程中执行)，
+    供调用方在后续块仍在请求时开始对齐；所有回调传出的片段依次拼接即为返回值。
+    """
+    job_options = job_options or LlmJobOptions()
+
     def _log_main_api(message: str):
         _log_api_message(message, signals_forwarder, prefix="[LLM API - Main]")
 
     def is_running() -> bool:
-        if signals_forwarder and hasattr(signals_forwarder, 'parent') and hasattr(signals_forwarder.parent(), 'is_running'):
-            return signals_forwarder.parent().is_running
-        return True
+        return _is_job_running(signals_forwarder)
     if not is_running(): _log_main_api("API调用前任务已取消。"); return None
+    job_started_at = time.perf_counter()
+    http_stats_before = get_llm_http_client().connection_stats()
+    prompt_usage_before = get_prompt_token_usage().stats()
+    response_cache = get_llm_response_cache(signals_forwarder)
+    cache_stats_before = response_cache.stats()
+    if job_options.bypass_cache: _log_main_api("本次任务跳过LLM响应缓存，所有请求将重新发送。")
+    if job_options.stream: _log_main_api("已启用流式响应 (SSE)，片段将随生成逐行到达。")
+    rate_limiter = get_llm_rate_limiter()
+    rate_limiter.configure(job_options.requests_per_minute, job_options.tokens_per_minute)
+    rate_wait_before = rate_limiter.stats()["wait_seconds"]
+    if rate_limiter.enabled:
+        _log_main_api(f"速率限制: 每分钟最多 {job_options.requests_per_minute or '不限'} 个请求、{job_options.tokens_per_minute or '不限'} 个token。")
 
     target_url, effective_model = _parse_api_url_and_model(
         custom_api_base_url_str, custom_model_name,
@@ -171,106 +703,504 @@ def call_llm_api_for_segmentation(
     )
     effective_temperature = custom_temperature if custom_temperature is not None else app_config.DEFAULT_LLM_TEMPERATURE
 
-    detected_lang_code_for_prompt = None
-    if target_language and target_language in ['zh', 'ja', 'en']: detected_lang_code_for_prompt = target_language
-    else:
-        try:
-            if text_to_segment.strip():
-                detected_lang_raw = detect(text_to_segment)
-                if detected_lang_raw.startswith('zh'): detected_lang_code_for_prompt = 'zh'
-                elif detected_lang_raw == 'ja': detected_lang_code_for_prompt = 'ja'
-                elif detected_lang_raw == 'en': detected_lang_code_for_prompt = 'en'
-        except Exception: pass 
-    system_prompt_segmentation = DEFAULT_SYSTEM_PROMPT_FOR_SEGMENTATION
-    if detected_lang_code_for_prompt == 'ja': system_prompt_segmentation = app_config.DEEPSEEK_SYSTEM_PROMPT_JA
-    elif detected_lang_code_for_prompt == 'zh': system_prompt_segmentation = app_config.DEEPSEEK_SYSTEM_PROMPT_ZH
-    elif detected_lang_code_for_prompt == 'en': system_prompt_segmentation = app_config.DEEPSEEK_SYSTEM_PROMPT_EN
-    system_prompt_summary_task = DEFAULT_SYSTEM_PROMPT_FOR_SUMMARY
-    if detected_lang_code_for_prompt == 'ja': system_prompt_summary_task = app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_JA
-    elif detected_lang_code_for_prompt == 'zh': system_prompt_summary_task = app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_ZH
-    elif detected_lang_code_for_prompt == 'en': system_prompt_summary_task = app_config.DEEPSEEK_SYSTEM_PROMPT_SUMMARY_EN
-    _log_main_api(f"分割任务选用的系统提示词语言: {detected_lang_code_for_prompt or 'default (en)'}")
+    language_resolution = get_language_resolver().resolve(text_to_segment, target_language, asr_language_code)
+    detected_lang_code_for_prompt = language_resolution.language
+    system_prompt_segmentation = _segmentation_prompt_for_language(detected_lang_code_for_prompt)
+    system_prompt_summary_task = _summary_prompt_for_language(detected_lang_code_for_prompt)
+    _log_main_api(f"分割任务选用的系统提示词语言: {detected_lang_code_for_prompt or 'default (en)'} ({language_resolution.source})")
 
-    summary_text = ""
-    if text_to_segment.strip():
+    # 分块先于摘要完成 (overlap 与 skip_single_chunk 策略需要先知道块数)，为摘要预留固定的 token 数
+    chunk_token_budget = _chunk_token_budget(job_options, system_prompt_segmentation, app_config.LLM_SUMMARY_RESERVED_TOKENS)
+    _log_main_api(f"文本块预算: 每块约 {chunk_token_budget} token (上下文窗口 {job_options.context_window}，输出上限 {job_options.max_output_tokens})。")
+    text_chunks = _split_text_into_chunks(text_to_segment, chunk_token_budget, signals_forwarder, detected_lang_code_for_prompt)
+    num_chunks = len(text_chunks)
+    if num_chunks == 0: 
+        if text_to_segment.strip(): text_chunks = [text_to_segment]; num_chunks = 1
+        else: return []
+
+    endpoint_pool = _build_endpoint_pool(job_options, api_key, custom_model_name)
+    cache_target = _cache_target(endpoint_pool, target_url, effective_model) # 缓存键的 (地址, 模型)
+    max_workers = max(1, min(endpoint_pool.total_concurrency if endpoint_pool else job_options.max_concurrency, app_config.LLM_MAX_CONCURRENCY_LIMIT, num_chunks))
+    serial_mode = max_workers == 1
+    concurrency = _build_concurrency_controller(job_options, max_workers, _log_main_api)
+    if endpoint_pool:
+        _log_main_api(f"使用端点池分发文本块: {len(endpoint_pool.endpoints)} 个端点，策略 {app_config.LLM_ROUTING_POLICIES[endpoint_pool.routing_policy]}，合计并发 {endpoint_pool.total_concurrency}。")
+
+    summary_policy = job_options.summary_policy
+    summary_model_name = custom_model_name
+    if summary_policy == "small_model":
+        if job_options.summary_model: summary_model_name = job_options.summary_model
+        else: _log_main_api("小模型摘要策略未设置摘要模型，将使用分割模型生成摘要。")
+    _log_main_api(f"摘要策略: {app_config.LLM_SUMMARY_POLICIES[summary_policy]} ({summary_policy})")
+    summary_seconds: List[float] = []
+
+    def _fetch_summary() -> str:
+        summary_started_at = time.perf_counter()
         _log_main_api("尝试获取全文摘要...")
         summary_text_optional = _get_summary(
             api_key, text_to_segment, system_prompt_summary_task,
-            custom_api_base_url_str, custom_model_name, effective_temperature,
-            signals_forwarder=signals_forwarder
+            custom_api_base_url_str, summary_model_name, effective_temperature,
+            signals_forwarder=signals_forwarder, job_options=job_options, language=detected_lang_code_for_prompt
         )
-        if summary_text_optional: summary_text = summary_text_optional; _log_main_api("成功获取到摘要。")
-        else: _log_main_api("未能获取到摘要，将不带摘要继续进行分割。")
-    else: _log_main_api("输入文本为空，跳过摘要获取。")
+        summary_seconds.append(time.perf_counter() - summary_started_at)
+        if summary_text_optional: _log_main_api(f"成功获取到摘要 (耗时 {summary_seconds[0]:.2f} 秒)。"); return summary_text_optional
+        _log_main_api("未能获取到摘要，将不带摘要继续进行分割。"); return ""
 
-    all_segments: List[str] = []
-    text_chunks = _split_text_into_chunks(text_to_segment, MAX_CHARS_PER_CHUNK, signals_forwarder)
-    num_chunks = len(text_chunks)
-    if num_chunks == 0: 
-        if text_to_segment.strip(): text_chunks = [text_to_segment]; num_chunks = 1
-        else: return []
+    summary_text = ""
+    summary_future = None; summary_executor = None
+    overlap_chunk_count = 0 # overlap 策略下不等待摘要、直接发送的首批块数
+    if not text_to_segment.strip(): _log_main_api("输入文本为空，跳过摘要获取。")
+    elif summary_policy == "skip_single_chunk" and num_chunks == 1: _log_main_api("只有一个文本块，跳过摘要获取。")
+    elif summary_policy == "overlap":
+        overlap_chunk_count = max_workers # 首批占满并发的块不带摘要，保证重跑时缓存键一致
+        if overlap_chunk_count >= num_chunks:
+            _log_main_api(f"全部 {num_chunks} 个块都在首批发送，摘要无法被使用，跳过摘要获取。")
+        else:
+            _log_main_api(f"前 {overlap_chunk_count} 个块不带摘要立即发送，其余块等待摘要完成。")
+            summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-summary-overlap")
+            summary_future = summary_executor.submit(_fetch_summary)
+    else: summary_text = _fetch_summary()
+
+    def _summary_for_chunk(i: int) -> str:
+        """返回第 i 块应附带的摘要；overlap 策略下后续块在此等待后台摘要完成。"""
+        if summary_future is None or i < overlap_chunk_count: return summary_text
+        while True:
+            try: return summary_future.result(timeout=CANCEL_POLL_INTERVAL_S)
+            except FutureTimeoutError:
+                if not is_running(): return ""
 
-    for i, chunk in enumerate(text_chunks):
-        if not is_running(): _log_main_api(f"处理块 {i+1}/{num_chunks} 前任务已取消。"); return all_segments if all_segments else None 
-        _log_main_api(f"向 LLM API 发送块 {i+1}/{num_chunks} 进行分割 (URL: {target_url}, 模型: {effective_model}, 温度: {effective_temperature})...")
+    def _split_truncated_chunk(chunk: str) -> List[str]:
+        """把输出被截断的文本块按 token 数对半拆分。"""
+        half_budget = max(app_config.LLM_MIN_CHUNK_TOKENS, estimate_text_tokens(chunk, detected_lang_code_for_prompt) // 2 + 1)
+        return _split_text_into_chunks(chunk, half_budget, signals_forwarder, detected_lang_code_for_prompt)
+
+    def _request_chunk_segments(i: int, chunk: str, label: Optional[str] = None, split_depth: int = 0, integrity_attempt: int = 0) -> Optional[List[str]]:
+        """
+        发送单个文本块并返回其片段列表；失败或任务取消时返回None。在线程池中执行。
+        输出因达到上限被截断时，将该块拆小后逐个重新请求并按顺序拼接；
+        输出与原文字符不一致时，只重新请求该块 (最多 LLM_INTEGRITY_MAX_RETRIES 次)。
+        """
+        label = label or f"块 {i+1}/{num_chunks}"
+        if not is_running(): return None
+        chunk_summary = _summary_for_chunk(i)
+        if not is_running(): return None
+        destination = "端点池" if endpoint_pool else f"URL: {target_url}, 模型: {effective_model}"
+        _log_main_api(f"向 LLM API 发送{label} 进行分割 ({destination}, 温度: {effective_temperature})...")
         
-        user_content_with_summary = f"【全文摘要】:\n{summary_text}\n\n【当前文本块】:\n{chunk}"
-        if not summary_text: user_content_with_summary = f"【当前文本块】:\n{chunk}"
+        user_content_with_summary = _chunk_user_content(chunk_summary, "【当前文本块】", chunk)
 
         payload = {"model": effective_model, "messages": [{"role": "system", "content": system_prompt_segmentation}, {"role": "user", "content": user_content_with_summary }]}
         if custom_temperature is not None: payload["temperature"] = effective_temperature
+        if job_options.stream: payload["stream"] = True
+
+        cache_key = LlmResponseCache.make_key(*cache_target, payload.get("temperature"), system_prompt_segmentation, user_content_with_summary)
+        if not job_options.bypass_cache and integrity_attempt == 0:
+            cached_content = response_cache.get(cache_key)
+            if cached_content is not None:
+                segments_from_cache = [seg.strip() for seg in cached_content.split('\n') if seg.strip()]
+                cached_report = check_chunk_integrity(chunk, segments_from_cache)
+                if cached_report.is_acceptable():
+                    _log_main_api(f"{label} 命中缓存，获得 {len(segments_from_cache)} 个片段。")
+                    return segments_from_cache
+                _log_main_api(f"{label} 的缓存结果未通过完整性校验 ({cached_report.describe()})，删除该缓存并重新请求。")
+                response_cache.invalidate(cache_key)
         
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        request_started_at = time.perf_counter()
+
+        def _on_segment_line(line: str):
+            """流式响应每到达一行完整文本时调用，记录本块及整个任务的首片段延迟。"""
+            if i in first_segment_latencies or not line.strip(): return
+            now = time.perf_counter()
+            with first_segment_lock:
+                first_segment_latencies[i] = now - request_started_at
+                if first_segment_at[0] is None: first_segment_at[0] = now - job_started_at
+
         try:
-            response = requests.post(target_url, headers=headers, json=payload, timeout=180)
-            if not is_running(): _log_main_api(f"API 对块 {i+1}/{num_chunks} 响应接收后任务已取消。"); return all_segments if all_segments else None
-            response.raise_for_status(); data = response.json()
-            if not is_running(): _log_main_api(f"API 对块 {i+1}/{num_chunks} 响应解析后任务已取消。"); return all_segments if all_segments else None
-            content = None; finish_reason = "unknown"
-            if "choices" in data and data["choices"] and isinstance(data["choices"], list) and len(data["choices"]) > 0 and \
-               isinstance(data["choices"][0], dict) and data["choices"][0].get("message", {}).get("content") is not None:
-                choice = data["choices"][0]; content = choice.get("message", {}).get("content"); finish_reason = choice.get("finish_reason", "unknown")
-            elif data.get("candidates") and isinstance(data["candidates"], list) and len(data["candidates"]) > 0 and \
-                 isinstance(data["candidates"][0], dict) and \
-                 data["candidates"][0].get("content", {}).get("parts", [{}]) and \
-                 isinstance(data["candidates"][0].get("content").get("parts"), list) and \
-                 len(data["candidates"][0].get("content").get("parts")) > 0 and \
-                 isinstance(data["candidates"][0].get("content").get("parts")[0], dict) and \
-                 data["candidates"][0].get("content").get("parts")[0].get("text") is not None:
-                content = data["candidates"][0].get("content").get("parts")[0].get("text"); finish_reason = data["candidates"][0].get("finishReason", "unknown")
+            data = _call_with_retry_traced("chunk",
+                lambda: _send_chunk_request(endpoint_pool, target_url, api_key, payload, 180, is_running, _log_main_api, _on_segment_line, concurrency),
+                job_options.retry_policy, is_running, _log_main_api, label
+            )
+            if not is_running(): _log_main_api(f"API 对{label} 响应接收后任务已取消。"); return None
+            content, finish_reason = _extract_completion_content(data)
 
             if content is not None:
                 segments_from_chunk = [seg.strip() for seg in content.split('\n') if seg.strip()]
-                all_segments.extend(segments_from_chunk)
-                _log_main_api(f"块 {i+1}/{num_chunks} 成功处理，获得 {len(segments_from_chunk)} 个片段。完成原因: {finish_reason}")
                 if finish_reason == "length" or finish_reason == "MAX_TOKENS":
-                    _log_main_api(f"警告: 块 {i+1}/{num_chunks} 的输出可能因为达到API的默认max_tokens限制而被截断。")
+                    sub_chunks = _split_truncated_chunk(chunk) if split_depth < app_config.LLM_TRUNCATION_MAX_SPLIT_DEPTH else []
+                    if len(sub_chunks) > 1:
+                        _log_main_api(f"{label} 的输出因达到max_tokens限制被截断，拆分为 {len(sub_chunks)} 个更小的块重新请求。")
+                        merged_segments: List[str] = []
+                        for sub_index, sub_chunk in enumerate(sub_chunks):
+                            sub_segments = _request_chunk_segments(i, sub_chunk, f"{label}-{sub_index + 1}", split_depth + 1)
+                            if sub_segments is None: return None
+                            merged_segments.extend(sub_segments)
+                        return merged_segments
+                first_segment_note = f"，首片段 {first_segment_latencies[i]:.2f} 秒" if i in first_segment_latencies else ""
+                _log_main_api(f"{label} 成功处理，获得 {len(segments_from_chunk)} 个片段。完成原因: {finish_reason}{first_segment_note}")
+                if finish_reason == "length" or finish_reason == "MAX_TOKENS":
+                    _log_main_api(f"警告: {label} 的输出可能因为达到API的max_tokens限制而被截断，且已无法继续拆分。")
+                    return segments_from_chunk # 被截断的输出不写入缓存，也不做完整性校验
+                integrity_report = check_chunk_integrity(chunk, segments_from_chunk)
+                if not integrity_report.is_acceptable():
+                    if integrity_attempt < app_config.LLM_INTEGRITY_MAX_RETRIES:
+                        with integrity_lock: integrity_stats["retries"] += 1
+                        _log_main_api(f"{label} 的输出与原文不一致 ({integrity_report.describe()})，重新请求该块 ({integrity_attempt + 1}/{app_config.LLM_INTEGRITY_MAX_RETRIES})。")
+                        return _request_chunk_segments(i, chunk, label, split_depth, integrity_attempt + 1)
+                    with integrity_lock: integrity_stats["failed"] += 1
+                    _log_main_api(f"警告: {label} 重新请求 {integrity_attempt} 次后输出仍与原文不一致 ({integrity_report.describe()})，使用最后一次结果 (不写入缓存)。")
+                    return segments_from_chunk
+                response_cache.put(cache_key, content) # 只缓存通过校验的完整输出
+                return segments_from_chunk
             else: 
                 error_info = data.get('error', {}); 
                 if not error_info and data.get("code") and data.get("message"): error_info = data 
                 error_msg = error_info.get('message', str(data)); error_type = error_info.get('type', error_info.get("status")); error_code_val = error_info.get('code')
-                _log_main_api(f"错误: LLM API 对块 {i+1}/{num_chunks} 的响应格式错误或API返回错误。类型: {error_type}, Code: {error_code_val}, 消息: {str(data)[:500]}")
-        except requests.exceptions.Timeout: _log_main_api(f"错误: LLM API 对块 {i+1}/{num_chunks} 的请求超时 (180秒)。URL: {target_url}")
+                _log_main_api(f"错误: LLM API 对{label} 的响应格式错误或API返回错误。类型: {error_type}, Code: {error_code_val}, 消息: {str(data)[:500]}")
+                chunk_failures[i] = "响应格式错误"
+        except RetryCancelled as e: _log_main_api(f"{label} 已取消: {e}。")
+        except requests.exceptions.Timeout:
+            _log_main_api(f"错误: LLM API 对{label} 的请求超时 (180秒)。URL: {target_url}")
+            chunk_failures[i] = "请求超时"
         except requests.exceptions.RequestException as e: 
-            error_details = ""; status_code = 'N/A'
-            if e.response is not None:
-                status_code = e.response.status_code
-                try: 
-                    err_json_data = e.response.json(); err_info_openai = err_json_data.get('error', {}); err_info_gemini = err_json_data if "message" in err_json_data and "code" in err_json_data else {}
-                    message = err_info_openai.get('message', err_info_gemini.get('message', e.response.text)); err_type = err_info_openai.get('type', err_info_gemini.get('status', 'UnknownType')); err_code = err_info_openai.get('code', err_info_gemini.get('code', 'UnknownCode'))
-                    error_details = f": [{err_type}/{err_code}] {message}"
-                except requests.exceptions.JSONDecodeError: error_details = f": {e.response.text[:200]}"
-            else: error_details = f": {str(e)}"
-            _log_main_api(f"错误: LLM API 对块 {i+1}/{num_chunks} 的请求失败 (状态码: {status_code}, URL: {target_url}){error_details}")
-        except Exception as e: _log_main_api(f"错误: 处理 LLM API 对块 {i+1}/{num_chunks} 的响应时发生未知错误 (URL: {target_url}): {e}"); _log_main_api(traceback.format_exc())
-        if signals_forwarder and hasattr(signals_forwarder, 'llm_progress_signal') and hasattr(signals_forwarder.llm_progress_signal, 'emit'):
-             signals_forwarder.llm_progress_signal.emit(int(((i + 1) / num_chunks) * 100))
-        if num_chunks > 1 and i < num_chunks - 1:
-            if not is_running(): _log_main_api(f"处理完块 {i+1}/{num_chunks} 后任务已取消，不再延时。"); return all_segments if all_segments else None
-            time.sleep(0.5)
+            status_code = e.response.status_code if e.response is not None else 'N/A'
+            _log_main_api(f"错误: LLM API 对{label} 的请求失败 (状态码: {status_code}, URL: {target_url}){_describe_request_error(e)}")
+            chunk_failures[i] = f"HTTP {status_code}" if e.response is not None else type(e).__name__
+        except Exception as e:
+            _log_main_api(f"错误: 处理 LLM API 对{label} 的响应时发生未知错误 (URL: {target_url}): {e}"); _log_main_api(traceback.format_exc())
+            chunk_failures[i] = type(e).__name__
+        return None
+
+    def _ordered_segments(upto: int) -> List[str]:
+        """按块顺序拼接前 upto 个块的结果，跳过失败的块。"""
+        merged: List[str] = []
+        for chunk_segments in chunk_results[:upto]:
+            if chunk_segments: merged.extend(chunk_segments)
+        return merged
+
+    if not serial_mode:
+        _log_main_api(f"并发发送 {num_chunks} 个块，最多同时 {max_workers} 个请求{'，实际并发由自适应控制器调整' if concurrency else ''}。")
+    chunk_results: List[Optional[List[str]]] = [None] * num_chunks
+    chunk_failures: Dict[int, str] = {} # 块索引 -> 重试后仍失败的原因
+    first_segment_latencies: Dict[int, float] = {} # 块索引 -> 流式响应首个片段的到达延迟
+    first_segment_at: List[Optional[float]] = [None] # 任务开始到第一个片段到达的秒数
+    first_segment_lock = threading.Lock()
+    integrity_stats = {"retries": 0, "failed": 0} # 完整性校验触发的重新请求次数与最终仍不一致的块数
+    integrity_lock = threading.Lock()
+    completed_count = 0
+    recorded_chunks: set = set() # 结果已写入 chunk_results 的块索引
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-chunk")
+    try:
+        future_to_index = {executor.submit(_request_chunk_segments, i, chunk): i for i, chunk in enumerate(text_chunks)}
+        ordered_futures = list(future_to_index)
+        next_chunk_to_deliver = 0 # on_chunk_segments 尚未收到的第一个块
+        pending = set(future_to_index)
+        while pending:
+            # 以短超时等待，保证取消请求能及时生效
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL_S, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_results[future_to_index[future]] = future.result()
+                recorded_chunks.add(future_to_index[future])
+                completed_count += 1
+                if signals_forwarder and hasattr(signals_forwarder, 'llm_progress_signal') and hasattr(signals_forwarder.llm_progress_signal, 'emit'):
+                    signals_forwarder.llm_progress_signal.emit(int((completed_count / num_chunks) * 100))
+            if on_chunk_segments is not None:
+                # 不在 pending 中的块都已在上面取回结果
+                while next_chunk_to_deliver < num_chunks and ordered_futures[next_chunk_to_deliver] not in pending:
+                    if chunk_results[next_chunk_to_deliver]: on_chunk_segments(chunk_results[next_chunk_to_deliver])
+                    next_chunk_to_deliver += 1
+            if pending and not is_running():
+                _log_main_api(f"任务已取消，放弃剩余 {len(pending)} 个未完成的块。")
+                for future in pending: future.cancel()
+                # 只返回从第一块起连续且已取回结果的部分，保证片段顺序；
+                # 在 wait 返回之后才完成的块没有写入 chunk_results，不能计入
+                contiguous = next((idx for idx in range(num_chunks) if idx not in recorded_chunks), num_chunks)
+                partial_segments = _ordered_segments(contiguous)
+                return partial_segments if partial_segments else None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if summary_executor is not None: summary_executor.shutdown(wait=False)
+
+    all_segments = _ordered_segments(num_chunks)
+    if chunk_failures:
+        failure_report = ", ".join(f"块 {idx + 1} ({reason})" for idx, reason in sorted(chunk_failures.items()))
+        _log_main_api(f"警告: {len(chunk_failures)}/{num_chunks} 个块在重试后仍然失败，对应文本将缺少分割结果: {failure_report}")
+    if first_segment_latencies:
+        latencies = list(first_segment_latencies.values())
+        _log_main_api(f"流式响应: 任务开始后 {first_segment_at[0]:.2f} 秒得到首个片段；各块首片段延迟平均 {sum(latencies) / len(latencies):.2f} 秒 (最快 {min(latencies):.2f}，最慢 {max(latencies):.2f})。")
+    if integrity_stats["retries"] or integrity_stats["failed"]:
+        _log_main_api(f"完整性校验: 共重新请求 {integrity_stats['retries']} 次，{integrity_stats['failed']} 个块最终仍与原文不一致。")
+    _log_main_api(f"响应缓存: {format_cache_stats(cache_stats_before, response_cache.stats())}")
+    summary_time_note = f"摘要 {summary_seconds[0]:.2f} 秒" if summary_seconds else "未请求摘要"
+    _log_main_api(f"耗时 (摘要策略 {summary_policy}): {summary_time_note}，任务总计 {time.perf_counter() - job_started_at:.2f} 秒。")
+    if rate_limiter.enabled:
+        _log_main_api(f"速率限制: 本次任务累计等待 {rate_limiter.stats()['wait_seconds'] - rate_wait_before:.1f} 秒。")
+    _log_main_api(f"HTTP连接: {_format_connection_reuse(http_stats_before, get_llm_http_client().connection_stats())}")
+    _log_main_api(f"提示词缓存: {_format_prompt_cache_usage(prompt_usage_before, get_prompt_token_usage().stats())}")
+    if endpoint_pool:
+        for stats_line in endpoint_pool.stats_lines(): _log_main_api(f"端点统计: {stats_line}")
+    if concurrency: _log_main_api(f"自适应并发: {concurrency.summary()}")
     if not all_segments and text_to_segment.strip(): _log_main_api("所有块处理完毕，但未能从任何块中获取到有效的分割结果。"); return None 
     _log_main_api(f"所有 {num_chunks} 个块处理完成。总共收集到 {len(all_segments)} 个片段。"); return all_segments
 
+def call_llm_api_for_boundary_offsets(
+    api_key: str, words: List[TimestampedWord],
+    custom_api_base_url_str: Optional[str], custom_model_name: Optional[str],
+    custom_temperature: Optional[float],
+    signals_forwarder: Optional[Any] = None, target_language: Optional[str] = None,
+    job_options: Optional["LlmJobOptions"] = None,
+    asr_language_code: Optional[str] = None
+) -> Optional[List[tuple[int, int]]]:
+    """
+    断点索引模式的分割: 按块发送带编号的词序列，模型返回断点编号，结果为每个片段在 words 中的 [起, 止) 区间。
+    提示词语言的确定方式与 call_llm_api_for_segmentation 相同。
+    某个块的编号列表重新请求后仍无效、请求失败或任务取消时返回None，由调用方退回文本模式。
+    """
+    job_options = job_options or LlmJobOptions()
+
+    def _log_offsets_api(message: str):
+        _log_api_message(message, signals_forwarder, prefix="[LLM API - Offsets]")
+
+    def is_running() -> bool:
+        return _is_job_running(signals_forwarder)
+    if not is_running(): _log_offsets_api("API调用前任务已取消。"); return None
+    job_started_at = time.perf_counter()
+    prompt_usage_before = get_prompt_token_usage().stats()
+    response_cache = get_llm_response_cache(signals_forwarder)
+    rate_limiter = get_llm_rate_limiter()
+    rate_limiter.configure(job_options.requests_per_minute, job_options.tokens_per_minute)
+
+    target_url, effective_model = _parse_api_url_and_model(
+        custom_api_base_url_str, custom_model_name,
+        app_config.DEFAULT_LLM_API_BASE_URL, app_config.DEFAULT_LLM_MODEL_NAME
+    )
+    effective_temperature = custom_temperature if custom_temperature is not None else app_config.DEFAULT_LLM_TEMPERATURE
+    full_text = join_word_texts(words)
+    language = get_language_resolver().resolve(full_text, target_language, asr_language_code).language
+    system_prompt = app_config.DEEPSEEK_SYSTEM_PROMPT_BOUNDARY_OFFSETS
+
+    chunk_token_budget = _chunk_token_budget(job_options, system_prompt, app_config.LLM_SUMMARY_RESERVED_TOKENS)
+    word_ranges = split_word_ranges(words, chunk_token_budget, language)
+    num_chunks = len(word_ranges)
+    if num_chunks == 0: _log_offsets_api("词序列为空，无需分割。"); return []
+    _log_offsets_api(f"词序列 ({len(words)} 个词) 被分为 {num_chunks} 块，每块约 {chunk_token_budget} token。")
+
+    summary_text = ""
+    if num_chunks > 1:
+        summary_text = _get_summary(
+            api_key, full_text, _summary_prompt_for_language(language),
+            custom_api_base_url_str, custom_model_name, effective_temperature,
+            signals_forwarder=signals_forwarder, job_options=job_options, language=language
+        ) or ""
+    endpoint_pool = _build_endpoint_pool(job_options, api_key, custom_model_name)
+    cache_target = _cache_target(endpoint_pool, target_url, effective_model) # 缓存键的 (地址, 模型)
+    max_workers = max(1, min(endpoint_pool.total_concurrency if endpoint_pool else job_options.max_concurrency, app_config.LLM_MAX_CONCURRENCY_LIMIT, num_chunks))
+    concurrency = _build_concurrency_controller(job_options, max_workers, _log_offsets_api)
+
+    def _request_chunk_breaks(i: int) -> Optional[List[tuple[int, int]]]:
+        """请求单个块的断点并转换为区间；编号无效时重新请求，仍无效或失败时返回None。在线程池中执行。"""
+        range_start, range_end = word_ranges[i]
+        label = f"块 {i+1}/{num_chunks}"
+        user_content = _chunk_user_content(summary_text, "【当前词序列】", format_indexed_words(words, range_start, range_end))
+        payload = {"model": effective_model, "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}]}
+        if custom_temperature is not None: payload["temperature"] = effective_temperature
+        cache_key = LlmResponseCache.make_key(*cache_target, payload.get("temperature"), system_prompt, user_content)
+        for attempt in range(app_config.LLM_BOUNDARY_OFFSET_MAX_RETRIES + 1):
+            if not is_running(): return None
+            if not job_options.bypass_cache and attempt == 0:
+                cached_breaks = parse_break_offsets(response_cache.get(cache_key), words, range_start, range_end)
+                if cached_breaks is not None:
+                    _log_offsets_api(f"{label} 命中缓存，{len(cached_breaks) + 1} 个片段。")
+                    return word_ranges_from_breaks(range_start, range_end, cached_breaks)
+            try:
+                data = _call_with_retry_traced("offsets",
+                    lambda: _send_chunk_request(endpoint_pool, target_url, api_key, payload, 180, is_running, _log_offsets_api, concurrency=concurrency),
+                    job_options.retry_policy, is_running, _log_offsets_api, label
+                )
+            except RetryCancelled: return None
+            except requests.exceptions.RequestException as e:
+                _log_offsets_api(f"错误: {label} 的请求失败{_describe_request_error(e)}"); return None
+            except Exception as e:
+                _log_offsets_api(f"错误: 处理{label} 时发生未知错误: {e}"); return None
+            content, _finish_reason = _extract_completion_content(data)
+            breaks = parse_break_offsets(content, words, range_start, range_end)
+            if breaks is not None:
+                response_cache.put(cache_key, content)
+                _log_offsets_api(f"{label} 成功处理，{len(breaks) + 1} 个片段。")
+                return word_ranges_from_breaks(range_start, range_end, breaks)
+            if attempt < app_config.LLM_BOUNDARY_OFFSET_MAX_RETRIES:
+                _log_offsets_api(f"{label} 返回的断点编号无效 ({str(content)[:80]!r})，重新请求 ({attempt + 1}/{app_config.LLM_BOUNDARY_OFFSET_MAX_RETRIES})。")
+            else:
+                _log_offsets_api(f"{label} 重新请求后返回的断点编号仍然无效 ({str(content)[:80]!r})。")
+        return None
+
+    chunk_results: List[Optional[List[tuple[int, int]]]] = [None] * num_chunks
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-offsets")
+    try:
+        future_to_index = {executor.submit(_request_chunk_breaks, i): i for i in range(num_chunks)}
+        pending = set(future_to_index)
+        completed_count = 0
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL_S, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_index = future_to_index[future]
+                chunk_results[chunk_index] = future.result()
+                completed_count += 1
+                if chunk_results[chunk_index] is None and is_running():
+                    _log_offsets_api(f"块 {chunk_index + 1} 未能得到有效的断点编号，放弃断点索引模式。")
+                    for other in pending: other.cancel()
+                    return None
+                if signals_forwarder and hasattr(signals_forwarder, 'llm_progress_signal') and hasattr(signals_forwarder.llm_progress_signal, 'emit'):
+                    signals_forwarder.llm_progress_signal.emit(int((completed_count / num_chunks) * 100))
+            if pending and not is_running():
+                _log_offsets_api(f"任务已取消，放弃剩余 {len(pending)} 个未完成的块。")
+                for future in pending: future.cancel()
+                return None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if not is_running(): return None
+
+    all_ranges = [segment_range for chunk_ranges in chunk_results for segment_range in (chunk_ranges or [])]
+    _log_offsets_api(f"所有 {num_chunks} 个块处理完成，共 {len(all_ranges)} 个片段，耗时 {time.perf_counter() - job_started_at:.2f} 秒。")
+    if endpoint_pool:
+        for stats_line in endpoint_pool.stats_lines(): _log_offsets_api(f"端点统计: {stats_line}")
+    _log_offsets_api(f"提示词缓存: {_format_prompt_cache_usage(prompt_usage_before, get_prompt_token_usage().stats())}")
+    if concurrency: _log_offsets_api(f"自适应并发: {concurrency.summary()}")
+    return all_ranges
+
+def call_llm_api_for_batch_segmentation(
+    api_key: str, texts: List[str],
+    custom_api_base_url_str: Optional[str], custom_model_name: Optional[str],
+    custom_temperature: Optional[float],
+    signals_forwarder: Optional[Any] = None, target_language: Optional[str] = None,
+    job_options: Optional["LlmJobOptions"] = None,
+    asr_language_codes: Optional[List[Optional[str]]] = None
+) -> List[Optional[List[str]]]:
+    """
+    批量分割多个转录文本，返回与 texts 一一对应的片段列表 (失败或取消的项为None，空文本为空列表)。
+    asr_language_codes 与 texts 一一对应，为各转录 ASR 返回的语言代码 (可省略)。
+    同一语言的短文本按 token 预算打包进同一个请求 (不请求摘要)，响应按标记行拆回各文本；
+    较长的文本、打包响应中缺失或未通过完整性校验的文本，改用 call_llm_api_for_segmentation 单独分割。
+    """
+    job_options = job_options or LlmJobOptions()
+
+    def _log_batch_api(message: str):
+        _log_api_message(message, signals_forwarder, prefix="[LLM API - Batch]")
+
+    def is_running() -> bool:
+        return _is_job_running(signals_forwarder)
+
+    def _asr_code(index: int) -> Optional[str]:
+        return asr_language_codes[index] if asr_language_codes and index < len(asr_language_codes) else None
+    results: List[Optional[List[str]]] = [None] * len(texts)
+    if not is_running(): _log_batch_api("API调用前任务已取消。"); return results
+    job_started_at = time.perf_counter()
+    prompt_usage_before = get_prompt_token_usage().stats()
+    response_cache = get_llm_response_cache(signals_forwarder)
+    rate_limiter = get_llm_rate_limiter()
+    rate_limiter.configure(job_options.requests_per_minute, job_options.tokens_per_minute)
+
+    target_url, effective_model = _parse_api_url_and_model(
+        custom_api_base_url_str, custom_model_name,
+        app_config.DEFAULT_LLM_API_BASE_URL, app_config.DEFAULT_LLM_MODEL_NAME
+    )
+    effective_temperature = custom_temperature if custom_temperature is not None else app_config.DEFAULT_LLM_TEMPERATURE
+
+    # 按提示词语言分组，只有同一语言的文本才装进同一个包
+    indices_by_language: Dict[Optional[str], List[int]] = {}
+    for index, text in enumerate(texts):
+        if not text or not text.strip(): results[index] = []; continue
+        indices_by_language.setdefault(get_language_resolver().resolve(text, target_language, _asr_code(index)).language, []).append(index)
+
+    packs: List[tuple[Optional[str], List[int]]] = [] # (语言, 文本下标)
+    solo_indices: List[int] = [] # 单独走普通分割流程的文本
+    prompt_tokens_by_language: Dict[Optional[str], int] = {}
+    for language, indices in indices_by_language.items():
+        system_prompt = _segmentation_prompt_for_language(language) + app_config.LLM_PACKED_PROMPT_SUFFIX
+        prompt_tokens_by_language[language] = estimate_text_tokens(system_prompt)
+        language_packs, too_long = pack_texts([texts[index] for index in indices], _chunk_token_budget(job_options, system_prompt, 0), language)
+        packs.extend((language, [indices[position] for position in pack]) for pack in language_packs)
+        solo_indices.extend(indices[position] for position in too_long)
+    _log_batch_api(f"{len(texts)} 个文本中 {sum(len(pack) for _, pack in packs)} 个打包为 {len(packs)} 个请求，{len(solo_indices)} 个较长的文本单独分割。")
+
+    endpoint_pool = _build_endpoint_pool(job_options, api_key, custom_model_name)
+    cache_target = _cache_target(endpoint_pool, target_url, effective_model) # 缓存键的 (地址, 模型)
+    max_workers = max(1, min(endpoint_pool.total_concurrency if endpoint_pool else job_options.max_concurrency, app_config.LLM_MAX_CONCURRENCY_LIMIT, max(1, len(packs))))
+    concurrency = _build_concurrency_controller(job_options, max_workers, _log_batch_api)
+
+    def _request_pack(pack_number: int, language: Optional[str], indices: List[int]) -> Dict[int, List[str]]:
+        """发送一个包并返回通过完整性校验的 {文本下标: 片段列表}；失败时返回空字典。在线程池中执行。"""
+        label = f"包 {pack_number + 1}/{len(packs)} ({len(indices)} 个文本)"
+        if not is_running(): return {}
+        system_prompt = _segmentation_prompt_for_language(language) + app_config.LLM_PACKED_PROMPT_SUFFIX
+        user_content = _chunk_user_content(None, "【当前文本块】", format_packed_texts([(index, texts[index]) for index in indices]))
+        payload = {"model": effective_model, "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}]}
+        if custom_temperature is not None: payload["temperature"] = effective_temperature
+        cache_key = LlmResponseCache.make_key(*cache_target, payload.get("temperature"), system_prompt, user_content)
+        content = None if job_options.bypass_cache else response_cache.get(cache_key)
+        from_cache = content is not None
+        if not from_cache:
+            try:
+                data = _call_with_retry_traced("batch",
+                    lambda: _send_chunk_request(endpoint_pool, target_url, api_key, payload, 180, is_running, _log_batch_api, concurrency=concurrency),
+                    job_options.retry_policy, is_running, _log_batch_api, label
+                )
+            except RetryCancelled: return {}
+            except requests.exceptions.RequestException as e:
+                _log_batch_api(f"错误: {label} 的请求失败{_describe_request_error(e)}"); return {}
+            except Exception as e:
+                _log_batch_api(f"错误: 处理{label} 时发生未知错误: {e}"); return {}
+            content, finish_reason = _extract_completion_content(data)
+            if finish_reason == "length" or finish_reason == "MAX_TOKENS":
+                _log_batch_api(f"警告: {label} 的输出被截断，末尾的文本将单独重新请求。")
+        accepted: Dict[int, List[str]] = {}
+        for index, segments in split_packed_response(content, indices).items():
+            if check_chunk_integrity(texts[index], segments).is_acceptable(): accepted[index] = segments
+        if len(accepted) == len(indices) and not from_cache: response_cache.put(cache_key, content) # 只缓存全部通过校验的响应
+        _log_batch_api(f"{label} {'命中缓存' if from_cache else '成功处理'}，{len(accepted)}/{len(indices)} 个文本通过校验。")
+        return accepted
+
+    unpacked_retries: List[int] = [] # 打包响应中缺失或未通过校验、需要单独重新分割的文本
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-batch")
+    try:
+        future_to_pack = {executor.submit(_request_pack, number, language, indices): indices for number, (language, indices) in enumerate(packs)}
+        pending = set(future_to_pack)
+        completed_count = 0
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL_S, return_when=FIRST_COMPLETED)
+            for future in done:
+                accepted = future.result()
+                for index in future_to_pack[future]:
+                    if index in accepted: results[index] = accepted[index]
+                    else: unpacked_retries.append(index)
+                completed_count += 1
+                if signals_forwarder and hasattr(signals_forwarder, 'llm_progress_signal') and hasattr(signals_forwarder.llm_progress_signal, 'emit'):
+                    signals_forwarder.llm_progress_signal.emit(int((completed_count / max(1, len(packs))) * 100))
+            if pending and not is_running():
+                _log_batch_api(f"任务已取消，放弃剩余 {len(pending)} 个未完成的包。")
+                for future in pending: future.cancel()
+                return results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if unpacked_retries: _log_batch_api(f"{len(unpacked_retries)} 个打包的文本未能从响应中拆出有效结果，改为单独分割。")
+    for index in sorted(solo_indices + unpacked_retries):
+        if not is_running(): _log_batch_api("任务已取消，跳过剩余的单独分割。"); break
+        results[index] = call_llm_api_for_segmentation(
+            api_key, texts[index], custom_api_base_url_str, custom_model_name, custom_temperature,
+            signals_forwarder=signals_forwarder, target_language=target_language, job_options=job_options,
+            asr_language_code=_asr_code(index)
+        )
+
+    packed_count = sum(len(pack) for _, pack in packs)
+    saved_prompt_tokens = sum(prompt_tokens_by_language[language] * (len(pack) - 1) for language, pack in packs)
+    _log_batch_api(f"打包节省: {packed_count} 个短文本只用了 {len(packs)} 个分割请求 (逐个处理需 {packed_count} 个，且不再需要摘要请求)，"
+                   f"少发送约 {saved_prompt_tokens} 个系统提示词 token。")
+    if concurrency: _log_batch_api(f"自适应并发: {concurrency.summary()}")
+    _log_batch_api(f"提示词缓存 (含单独分割): {_format_prompt_cache_usage(prompt_usage_before, get_prompt_token_usage().stats())}")
+    failed_count = sum(1 for result in results if result is None)
+    _log_batch_api(f"批量分割完成: {len(texts) - failed_count}/{len(texts)} 个文本成功，耗时 {time.perf_counter() - job_started_at:.2f} 秒。")
+    return results
+
 # --- 测试连接函数 ---
 def test_llm_connection(
     api_key: str,
@@ -295,14 +1225,17 @@ def test_llm_connection(
     
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
     try:
-        response = requests.post(target_url, headers=headers, json=payload, timeout=20) 
+        # 直接经共享客户端发送: 测试请求不占用任务的 RPM/TPM 额度，也不计入提示词统计与遥测
+        response = get_llm_http_client().post(target_url, headers=headers, data=json_utils.dumps_bytes(payload),
+                                              timeout=(app_config.LLM_CONNECT_TIMEOUT_S, 20))
         response.raise_for_status()
-        data = response.json()
+        data = json_utils.loads(response.content)
         if (data.get("choices") and isinstance(data["choices"], list) and len(data["choices"]) > 0 and isinstance(data["choices"][0], dict) and data["choices"][0].get("message", {}).get("content") is not None) or \
            (data.get("candidates") and isinstance(data["candidates"], list) and len(data["candidates"]) > 0 and isinstance(data["candidates"][0], dict) and data["candidates"][0].get("content", {}).get("parts", [{}]) and isinstance(data["candidates"][0].get("content").get("parts"), list) and len(data["candidates"][0].get("content").get("parts")) > 0 and isinstance(data["candidates"][0].get("content").get("parts")[0], dict) and data["candidates"][0].get("content").get("parts")[0].get("text") is not None):
             return True, f"连接成功！模型 {effective_model} 在 {target_url} 返回了响应。"
         else:
             return True, f"连接测试：收到HTTP 200响应，但响应内容格式未知或不完整。模型: {effective_model}, URL: {target_url}. 响应: {str(data)[:200]}"
+    except requests.exceptions.ConnectTimeout: return False, f"建立连接超时 ({app_config.LLM_CONNECT_TIMEOUT_S:g}秒)。URL: {target_url}"
     except requests.exceptions.Timeout: return False, f"连接超时 (20秒)。URL: {target_url}"
     except requests.exceptions.HTTPError as e:
         status_code = e.response.status_code; error_text = e.response.text[:200] 
@@ -0,0 +1,172 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+import config as app_config
+from utils import json_utils
+
+# --- LLM 响应的内容寻址磁盘缓存 ---
+# 以 (端点, 模型, 温度, 系统提示词, 用户内容) 的哈希为键保存模型返回的原始文本。
+# 崩溃后重跑或只修改了SRT参数时，相同的文本块无需再次调用付费API。
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    cache_key TEXT PRIMARY KEY,
+    response_text TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class LlmResponseCache:
+    """基于 SQLite 的线程安全响应缓存，带容量与有效期限制及命中统计。"""
+
+    def __init__(self, db_path: str = app_config.LLM_CACHE_DB_FILE,
+                 max_bytes: int = app_config.LLM_CACHE_MAX_BYTES,
+                 max_age_days: float = app_config.LLM_CACHE_MAX_AGE_DAYS):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disabled = False # 数据库不可用时降级为无缓存
+        self.hits = 0
+        self.misses = 0
+        self.signals_forwarder: Optional[Any] = None # 当前任务的信号转发器，缓存错误写入任务日志
+
+    def _log(self, message: str):
+        signals = self.signals_forwarder
+        if signals and hasattr(signals, 'log_message') and hasattr(signals.log_message, 'emit'):
+            signals.log_message.emit(f"[LLM Cache] {message}")
+        else:
+            print(f"[LLM Cache] {message}")
+
+    @staticmethod
+    def make_key(endpoint: str, model: str, temperature: Optional[float], system_prompt: str, user_content: str) -> str:
+        """根据请求的全部决定性输入计算缓存键。"""
+        material = json_utils.dumps_bytes([endpoint, model, temperature, system_prompt, user_content])
+        return hashlib.sha256(material).hexdigest()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """延迟打开数据库连接。调用方须持有 self._lock。"""
+        if self._disabled:
+            return None
+        if self._conn is None:
+            try:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._conn.execute(_SCHEMA)
+                self._conn.commit()
+            except (sqlite3.Error, OSError) as e:
+                self._log(f"无法打开缓存数据库 '{self.db_path}'，本次运行不使用缓存: {e}")
+                self._disabled = True
+                self._conn = None
+        return self._conn
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """读取缓存条目；不存在或已过期时返回None并计为未命中。"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = None
+            if conn is not None:
+                try:
+                    row = conn.execute("SELECT response_text, created_at FROM llm_responses WHERE cache_key = ?", (cache_key,)).fetchone()
+                    if row is not None and now - row[1] > self.max_age_seconds:
+                        conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (cache_key,))
+                        conn.commit()
+                        row = None
+                    elif row is not None:
+                        conn.execute("UPDATE llm_responses SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+                        conn.commit()
+                except sqlite3.Error as e:
+                    self._log(f"读取缓存失败: {e}")
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, cache_key: str, response_text: str):
+        """写入缓存条目，并在超出容量时淘汰最久未使用的条目。"""
+        now = time.time()
+        size_bytes = len(response_text.encode("utf-8"))
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (cache_key, response_text, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (cache_key, response_text, size_bytes, now, now)
+                )
+                self._prune_locked(conn, now)
+                conn.commit()
+            except sqlite3.Error as e:
+                self._log(f"写入缓存失败: {e}")
+
+    def invalidate(self, cache_key: str):
+        """删除单个缓存条目 (例如确认其内容有误时)。"""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (cache_key,))
+                conn.commit()
+            except sqlite3.Error as e:
+                self._log(f"删除缓存条目失败: {e}")
+
+    def _prune_locked(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        total_bytes = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        excess = total_bytes - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size_bytes in conn.execute("SELECT cache_key, size_bytes FROM llm_responses ORDER BY last_access ASC"):
+            stale_keys.append((key,))
+            freed += size_bytes
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM llm_responses WHERE cache_key = ?", stale_keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_shared_cache: Optional[LlmResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache(signals_forwarder: Optional[Any] = None) -> LlmResponseCache:
+    """获取进程内共享的响应缓存实例；指定 signals_forwarder 时此后的缓存错误写入该任务的日志。"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LlmResponseCache()
+        if signals_forwarder is not None:
+            _shared_cache.signals_forwarder = signals_forwarder
+        return _shared_cache
+
+
+def format_cache_stats(before: Dict[str, int], after: Dict[str, int]) -> str:
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    total = hits + misses
+    rate = hits / total if total else 0.0
+    return f"命中 {hits} 次，未命中 {misses} 次 (命中率 {rate:.0%})。"
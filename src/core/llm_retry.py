@@ -0,0 +1,123 @@
+import time
+import random
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Callable, TypeVar
+
+import requests
+
+import config as app_config
+
+# --- LLM 请求的重试策略 ---
+# 超时、429 与 5xx 属于暂时性错误，按错误类别分别计算重试次数，
+# 等待时间为带抖动的封顶指数退避；服务器给出 Retry-After 时优先遵循。
+
+ERROR_CLASS_TIMEOUT = "timeout"
+ERROR_CLASS_RATE_LIMIT = "rate_limit"
+ERROR_CLASS_SERVER = "server_error"
+ERROR_CLASS_CONNECTION = "connection"
+
+ERROR_CLASS_DESCRIPTIONS = {
+    ERROR_CLASS_TIMEOUT: "请求超时",
+    ERROR_CLASS_RATE_LIMIT: "限流 (429)",
+    ERROR_CLASS_SERVER: "服务器错误",
+    ERROR_CLASS_CONNECTION: "连接错误",
+}
+
+CANCEL_CHECK_INTERVAL_S = 0.1 # 退避等待期间检查取消状态的间隔
+
+T = TypeVar("T")
+
+
+class RetryCancelled(Exception):
+    """任务在退避等待、排队或请求进行中被取消。"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式。"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """封顶指数退避 + 抖动的重试策略，每类错误有独立的重试预算。"""
+    base_delay_s: float = app_config.LLM_RETRY_BASE_DELAY_S
+    max_delay_s: float = app_config.LLM_RETRY_MAX_DELAY_S
+    max_retry_after_s: float = app_config.LLM_RETRY_MAX_RETRY_AFTER_S
+    budgets: Dict[str, int] = field(default_factory=lambda: dict(app_config.LLM_RETRY_BUDGETS))
+
+    def classify(self, error: BaseException) -> Optional[str]:
+        """返回可重试的错误类别；不可重试的错误 (如401、请求格式错误) 返回None。"""
+        if isinstance(error, requests.exceptions.Timeout):
+            return ERROR_CLASS_TIMEOUT
+        if isinstance(error, requests.exceptions.HTTPError):
+            status_code = error.response.status_code if error.response is not None else None
+            if status_code == 429:
+                return ERROR_CLASS_RATE_LIMIT
+            if status_code is not None and (status_code >= 500 or status_code == 408):
+                return ERROR_CLASS_SERVER
+            return None
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+            return ERROR_CLASS_CONNECTION
+        return None
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次重试 (从0开始) 前的等待秒数。"""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after_s)
+        capped = min(self.max_delay_s, self.base_delay_s * (2 ** attempt))
+        return random.uniform(capped / 2, capped) # 抖动，避免并发请求同时重试
+
+
+def sleep_unless_cancelled(seconds: float, is_running: Callable[[], bool]) -> bool:
+    """分段等待，任务取消时立即返回False。"""
+    deadline = time.monotonic() + seconds
+    while True:
+        if not is_running():
+            return False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        time.sleep(min(CANCEL_CHECK_INTERVAL_S, remaining))
+
+
+def call_with_retry(send: Callable[[], T], policy: RetryPolicy,
+                    is_running: Callable[[], bool], log: Callable[[str], None], label: str) -> T:
+    """
+    执行 send()，遇到暂时性错误时按策略重试。
+    重试预算耗尽或错误不可重试时重新抛出最后一次异常；等待期间任务取消时抛出 RetryCancelled。
+    """
+    used_by_class: Dict[str, int] = {}
+    while True:
+        try:
+            return send()
+        except Exception as e:
+            error_class = policy.classify(e)
+            if error_class is None:
+                raise
+            used = used_by_class.get(error_class, 0)
+            budget = policy.budgets.get(error_class, 0)
+            if used >= budget:
+                if budget:
+                    log(f"{label} {ERROR_CLASS_DESCRIPTIONS[error_class]}的重试次数 ({budget}) 已用尽。")
+                raise
+            used_by_class[error_class] = used + 1
+            retry_after = None
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+            delay = policy.backoff_delay(sum(used_by_class.values()) - 1, retry_after)
+            source = " (遵循 Retry-After)" if retry_after is not None else ""
+            log(f"{label} 遇到{ERROR_CLASS_DESCRIPTIONS[error_class]}，{delay:.1f} 秒后重试{source} ({used + 1}/{budget})。")
+            if not sleep_unless_cancelled(delay, is_running):
+                raise RetryCancelled(label)
@@ -0,0 +1,176 @@
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any, Iterator
+
+from utils import json_utils
+
+# --- LLM 请求遥测 ---
+# 每次实际发出的 chat/completions 请求 (包括重试) 记录一条结构化事件:
+# 首字节时间、总耗时、提示词/输出/缓存命中 token、每秒输出字符数、HTTP 状态、第几次尝试与结束原因。
+# 事件记入当前任务的 LlmTelemetry，任务结束时汇总，可与 SRT 一起写成 JSON 供容量规划使用。
+
+TELEMETRY_FILE_SUFFIX = ".llm_telemetry.json"
+
+
+@dataclass
+class LlmRequestEvent:
+    """一次 HTTP 请求的遥测数据。时间单位为秒，started_at 为相对任务开始的偏移。"""
+    kind: str # 请求类别: summary / chunk / offsets / batch / other
+    label: str # 日志中的请求标签，如 "块 3/12"
+    attempt: int # 同一逻辑请求的第几次尝试 (从1开始，大于1即为重试)
+    url: str
+    model: str
+    started_at: float
+    streamed: bool = False
+    status: Optional[int] = None # HTTP 状态码；连接失败、超时时为None
+    error: Optional[str] = None # 异常类型，成功时为None
+    ttfb_s: Optional[float] = None # 发出请求到收到响应头的时间
+    latency_s: Optional[float] = None # 发出请求到读完响应的时间
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None # 命中前缀缓存的提示词 token
+    output_chars: int = 0
+    chars_per_second: Optional[float] = None
+    finish_reason: Optional[str] = None
+
+
+@dataclass
+class _RequestScope:
+    kind: str
+    label: str
+    attempts: int = 0
+
+
+_scope_local = threading.local()
+
+
+@contextmanager
+def request_scope(kind: str, label: str) -> Iterator[None]:
+    """标记当前线程正在执行的逻辑请求；其间记录的每个事件都归入该请求，并按顺序编号尝试次数。"""
+    previous = getattr(_scope_local, "scope", None)
+    _scope_local.scope = _RequestScope(kind, label)
+    try:
+        yield
+    finally:
+        _scope_local.scope = previous
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+
+
+def _distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "avg": round(sum(values) / len(values), 3) if values else None,
+        "p50": _percentile(values, 0.5),
+        "p95": _percentile(values, 0.95),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+class LlmTelemetry:
+    """一个任务内所有 LLM 请求事件的线程安全收集器。"""
+
+    def __init__(self):
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.events: List[LlmRequestEvent] = []
+
+    def begin_event(self, url: str, model: str, streamed: bool) -> LlmRequestEvent:
+        """创建一条事件并按当前线程的 request_scope 填写类别、标签与尝试次数。"""
+        scope: Optional[_RequestScope] = getattr(_scope_local, "scope", None)
+        if scope is not None:
+            scope.attempts += 1
+        return LlmRequestEvent(
+            kind=scope.kind if scope else "other", label=scope.label if scope else "",
+            attempt=scope.attempts if scope else 1, url=url, model=model,
+            started_at=round(time.monotonic() - self._started_at, 3), streamed=streamed,
+        )
+
+    def record(self, event: LlmRequestEvent):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> Dict[str, Any]:
+        """按任务汇总: 请求数、重试、状态码与结束原因分布、延迟分布、token 合计与吞吐量。"""
+        with self._lock:
+            events = list(self.events)
+        succeeded = [event for event in events if event.error is None]
+        prompt_tokens = sum(event.prompt_tokens or 0 for event in succeeded)
+        cached_tokens = sum(event.cached_tokens or 0 for event in succeeded)
+        completion_tokens = sum(event.completion_tokens or 0 for event in succeeded)
+        busy_seconds = sum(event.latency_s or 0 for event in succeeded)
+        by_kind: Dict[str, Dict[str, int]] = {}
+        for event in events:
+            kind_stats = by_kind.setdefault(event.kind, {"requests": 0, "failed": 0})
+            kind_stats["requests"] += 1
+            kind_stats["failed"] += event.error is not None
+        return {
+            "wall_seconds": round(time.monotonic() - self._started_at, 3),
+            "requests": len(events),
+            "succeeded": len(succeeded),
+            "failed": len(events) - len(succeeded),
+            "retries": sum(1 for event in events if event.attempt > 1),
+            "by_kind": by_kind,
+            "status_codes": dict(Counter(str(event.status) for event in events)),
+            "errors": dict(Counter(event.error for event in events if event.error)),
+            "finish_reasons": dict(Counter(event.finish_reason or "unknown" for event in succeeded)),
+            "ttfb_s": _distribution([event.ttfb_s for event in succeeded if event.ttfb_s is not None]),
+            "latency_s": _distribution([event.latency_s for event in succeeded if event.latency_s is not None]),
+            "chars_per_second": _distribution([event.chars_per_second for event in succeeded if event.chars_per_second is not None]),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_ratio": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None,
+            "output_chars": sum(event.output_chars for event in succeeded),
+            "completion_tokens_per_busy_second": round(completion_tokens / busy_seconds, 2) if busy_seconds and completion_tokens else None,
+        }
+
+    def describe(self) -> str:
+        """单行的中文摘要，写入任务日志。"""
+        summary = self.summary()
+        if not summary["requests"]:
+            return "本次任务没有实际发送的LLM请求。"
+        latency = summary["latency_s"]
+        latency_note = f"延迟 p50 {latency['p50']:.2f} 秒 / p95 {latency['p95']:.2f} 秒" if latency["p50"] is not None else "无成功请求"
+        throughput = summary["chars_per_second"]["avg"]
+        throughput_note = f"，平均输出 {throughput:.0f} 字符/秒" if throughput is not None else ""
+        return (f"请求 {summary['requests']} 次 (失败 {summary['failed']}，重试 {summary['retries']})，{latency_note}{throughput_note}，"
+                f"提示词 {summary['prompt_tokens']} token (缓存命中 {summary['cached_tokens']})，输出 {summary['completion_tokens']} token。")
+
+    def write_json(self, file_path: str):
+        """把汇总与全部事件写成 JSON 文件。"""
+        with self._lock:
+            events = [asdict(event) for event in self.events]
+        json_utils.dump_file({"summary": self.summary(), "events": events}, file_path, pretty=True)
+
+
+_active_telemetry: Optional[LlmTelemetry] = None
+_active_lock = threading.Lock()
+
+
+def begin_job_telemetry() -> LlmTelemetry:
+    """开始一个新任务的遥测收集，之后发出的请求都记入返回的收集器。"""
+    global _active_telemetry
+    with _active_lock:
+        _active_telemetry = LlmTelemetry()
+        return _active_telemetry
+
+
+def end_job_telemetry(telemetry: LlmTelemetry):
+    """结束 telemetry 的收集 (若它仍是当前任务的收集器)。"""
+    global _active_telemetry
+    with _active_lock:
+        if _active_telemetry is telemetry:
+            _active_telemetry = None
+
+
+def get_active_telemetry() -> Optional[LlmTelemetry]:
+    with _active_lock:
+        return _active_telemetry
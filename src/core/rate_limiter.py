@@ -0,0 +1,112 @@
+import time
+import threading
+from typing import Optional, Callable, Dict
+
+# --- 进程内共享的 LLM 速率限制器 ---
+# 以两个令牌桶分别限制每分钟请求数 (RPM) 与每分钟 token 数 (TPM)，
+# 所有 LLM 调用在发送前从中取令牌，让并发请求贴着服务商上限运行而不被限流。
+
+WAIT_SLICE_S = 0.1 # 等待令牌期间检查取消状态的间隔
+
+
+class TokenBucket:
+    """容量为每分钟额度、匀速回填的令牌桶。余额允许为负，用于事后补扣低估的用量。"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self._available = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._available = min(self.capacity, self._available + elapsed * self.refill_per_second)
+        self._updated_at = now
+
+    def try_take(self, amount: float, now: float) -> float:
+        """尝试取出 amount 个令牌；成功返回0，否则返回还需等待的秒数。"""
+        self._refill(now)
+        amount = min(amount, self.capacity) # 超过桶容量的请求在桶满时放行
+        if self._available >= amount:
+            self._available -= amount
+            return 0.0
+        return (amount - self._available) / self.refill_per_second
+
+    def adjust(self, delta: float):
+        """按实际用量修正余额: 正数退还多扣的令牌，负数补扣。"""
+        self._available = min(self.capacity, self._available + delta)
+
+
+class LlmRateLimiter:
+    """线程安全的 RPM/TPM 双令牌桶限流器。上限为0表示不限制。"""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self._lock = threading.Lock()
+        self._request_bucket: Optional[TokenBucket] = None
+        self._token_bucket: Optional[TokenBucket] = None
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self.total_wait_seconds = 0.0
+        self.configure(requests_per_minute, tokens_per_minute)
+
+    def configure(self, requests_per_minute: int, tokens_per_minute: int):
+        """更新上限；数值未变化时保留现有桶的余额。"""
+        with self._lock:
+            if requests_per_minute != self.requests_per_minute:
+                self.requests_per_minute = requests_per_minute
+                self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+            if tokens_per_minute != self.tokens_per_minute:
+                self.tokens_per_minute = tokens_per_minute
+                self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._request_bucket is not None or self._token_bucket is not None
+
+    def acquire(self, estimated_tokens: int, is_running: Callable[[], bool] = lambda: True) -> bool:
+        """
+        阻塞直到一个请求及其预估 token 数都有额度。两个桶同时满足才会扣除，避免只扣一半。
+        :return: 取得额度返回True；等待期间任务取消返回False。
+        """
+        started_at = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait_request = self._request_bucket.try_take(1, now) if self._request_bucket else 0.0
+                wait_tokens = 0.0
+                if wait_request == 0.0 and self._token_bucket:
+                    wait_tokens = self._token_bucket.try_take(estimated_tokens, now)
+                    if wait_tokens > 0.0 and self._request_bucket:
+                        self._request_bucket.adjust(1) # token 不足时退还已扣的请求额度
+                if wait_request == 0.0 and wait_tokens == 0.0:
+                    self.total_wait_seconds += now - started_at
+                    return True
+                wait_seconds = max(wait_request, wait_tokens)
+            if not is_running():
+                return False
+            time.sleep(min(WAIT_SLICE_S, wait_seconds))
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """收到响应后用 usage 中的实际 token 数修正预估值。"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            if self._token_bucket:
+                self._token_bucket.adjust(estimated_tokens - actual_tokens)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"wait_seconds": self.total_wait_seconds}
+
+
+_shared_rate_limiter: Optional[LlmRateLimiter] = None
+_shared_rate_limiter_lock = threading.Lock()
+
+
+def get_llm_rate_limiter() -> LlmRateLimiter:
+    """获取进程内共享的速率限制器，默认不限速，由每个任务按配置调整上限。"""
+    global _shared_rate_limiter
+    with _shared_rate_limiter_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = LlmRateLimiter()
+        return _shared_rate_limiter
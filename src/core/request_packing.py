@@ -0,0 +1,70 @@
+import re
+from typing import List, Optional, Dict, Tuple
+
+import config as app_config
+from core.token_estimator import estimate_text_tokens
+
+# --- 跨文件请求打包 ---
+# 远小于一个文本块的短转录 (如语音片段) 逐个请求时，每个文件都要重复发送完整的系统提示词。
+# 这里把多个短文本以 "<<<编号>>>" 标记行分隔后装进同一个分割请求，
+# 模型按提示词原样输出标记行，响应再按标记行拆回各个文件。
+
+_MARKER_TEMPLATE = "<<<{index}>>>"
+_MARKER_PATTERN = re.compile(r"^\s*<<<\s*(\d+)\s*>>>\s*$")
+_MARKER_OVERHEAD_TOKENS = 6 # 标记行与换行的估算 token 数
+
+
+def format_packed_texts(texts: List[Tuple[int, str]]) -> str:
+    """把 (编号, 文本) 列表格式化为以标记行分隔的请求正文。"""
+    return "\n".join(f"{_MARKER_TEMPLATE.format(index=index)}\n{text.strip()}" for index, text in texts)
+
+
+def pack_texts(texts: List[str], max_tokens: int, language: Optional[str] = None,
+               max_texts: int = app_config.LLM_PACK_MAX_TEXTS,
+               max_text_ratio: float = app_config.LLM_PACK_MAX_TEXT_RATIO) -> Tuple[List[List[int]], List[int]]:
+    """
+    按原顺序把文本下标装入若干个包，每包的估算 token 数 (含标记行) 不超过 max_tokens、文本数不超过 max_texts。
+    超过 max_tokens * max_text_ratio 的文本不参与打包，与空白文本一起在第二个返回值中按下标列出。
+    """
+    packs: List[List[int]] = []
+    unpacked: List[int] = []
+    current: List[int] = []
+    used = 0
+    for index, text in enumerate(texts):
+        if not text or not text.strip():
+            unpacked.append(index)
+            continue
+        tokens = estimate_text_tokens(text, language) + _MARKER_OVERHEAD_TOKENS
+        if tokens > max_tokens * max_text_ratio:
+            unpacked.append(index)
+            continue
+        if current and (used + tokens > max_tokens or len(current) >= max_texts):
+            packs.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs, unpacked
+
+
+def split_packed_response(content: Optional[str], indices: List[int]) -> Dict[int, List[str]]:
+    """
+    按标记行把打包请求的响应拆回各文本的片段列表。只返回标记行出现且有片段的编号，
+    缺失、重复或未请求的编号所属内容被丢弃，由调用方对缺失的文本单独重新请求。
+    """
+    expected = set(indices)
+    segments_by_index: Dict[int, List[str]] = {}
+    seen = set()
+    current: Optional[int] = None
+    for line in (content or "").split("\n"):
+        match = _MARKER_PATTERN.match(line)
+        if match:
+            index = int(match.group(1))
+            current = index if index in expected and index not in seen else None
+            if current is not None:
+                seen.add(current)
+            continue
+        if current is not None and line.strip():
+            segments_by_index.setdefault(current, []).append(line.strip())
+    return segments_by_index
@@ -0,0 +1,182 @@
+import re
+import time
+from typing import List, Optional, Any
+
+import config as app_config
+
+# --- 离线规则分割器 ---
+# 按 DEEPSEEK_SYSTEM_PROMPT_JA/ZH/EN 中的机械规则在本地分割文本:
+# 括号内的附加情景与引号内的引用各自成段，句首语气词单独成段，其余文本在句末标点后断开。
+# 不调用网络，结果与 call_llm_api_for_segmentation 同为 List[str]，用于批量处理时快速出草稿。
+
+_ELLIPSIS_CHARS = {"…", "‥"}
+_TERMINAL_CHARS = {char for mark in app_config.FINAL_PUNCTUATION for char in mark} | _ELLIPSIS_CHARS
+_FILLER_TRAILING_CHARS = "ー〜~…‥" # 语气词后可能拖长的符号
+_CLOSING_CHARS = set("」』”’）)】]\"'") # 句末标点之后仍属于同一片段的收尾符号
+_EN_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "jr", "sr", "prof", "no", "e.g", "i.e"}
+_SPACE_BETWEEN_CJK = re.compile(r"(?<=[぀-ヿ㐀-鿿ｦ-ﾟ])\s+(?=[぀-ヿ㐀-鿿ｦ-ﾟ])")
+
+
+def guess_language(text: str) -> str:
+    """无需 langdetect 的粗略判断: 含假名为日语，含汉字为中文，否则为英语。"""
+    has_cjk = False
+    for char in text:
+        code = ord(char)
+        if 0x3040 <= code <= 0x30FF or 0xFF66 <= code <= 0xFF9F:
+            return "ja"
+        if 0x4E00 <= code <= 0x9FFF:
+            has_cjk = True
+    return "zh" if has_cjk else "en"
+
+
+def _preprocess(text: str, language: str) -> str:
+    """与提示词的预处理步骤一致: 日语去除所有空白，中文去除汉字间的空白，英语合并连续空白。"""
+    if language == "ja":
+        return re.sub(r"\s+", "", text)
+    if language == "zh":
+        return _SPACE_BETWEEN_CJK.sub("", text).strip()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _read_terminal_run(text: str, pos: int) -> int:
+    """返回从 pos 开始的连续句末标点 (含收尾引号、括号) 之后的位置。"""
+    end = pos
+    while end < len(text) and text[end] in _TERMINAL_CHARS:
+        end += 1
+    while end > pos and end < len(text) and text[end] in _CLOSING_CHARS:
+        end += 1
+    return end
+
+
+def _find_closing(text: str, start: int, opener: str, closer: str) -> int:
+    """查找与 text[start] 处开符号配对的闭符号位置 (支持嵌套)；未闭合时返回-1。"""
+    if opener == closer: # 英文直引号无法区分开闭，取下一个同符号
+        return text.find(closer, start + 1)
+    depth = 0
+    for pos in range(start, len(text)):
+        if text[pos] == opener:
+            depth += 1
+        elif text[pos] == closer:
+            depth -= 1
+            if depth == 0:
+                return pos
+    return -1
+
+
+class RuleSegmenter:
+    """单一语言的规则分割器。language 为 'ja'、'zh' 或 'en'。"""
+
+    def __init__(self, language: str):
+        self.language = language if language in app_config.RULE_SEGMENTER_FILLERS else "en"
+        self.pairs = dict(app_config.RULE_SEGMENTER_BRACKET_PAIRS)
+        self.pairs.update(app_config.RULE_SEGMENTER_QUOTE_PAIRS.get(self.language, {}))
+        # 长的语气词优先匹配，避免 "ええと" 被 "ええ" 截断
+        self.fillers = sorted(app_config.RULE_SEGMENTER_FILLERS[self.language], key=len, reverse=True)
+        self.pause_chars = "," if self.language == "en" else ",、，!！"
+        self.min_ellipsis_chars = app_config.RULE_SEGMENTER_MIN_ELLIPSIS_SEGMENT_CHARS.get(self.language, 15)
+
+    def segment(self, text: str) -> List[str]:
+        text = _preprocess(text or "", self.language)
+        segments: List[str] = []
+        pending_start = 0 # 尚未输出的普通文本起点
+        pos = 0
+        while pos < len(text):
+            closer = self.pairs.get(text[pos])
+            close_pos = _find_closing(text, pos, text[pos], closer) if closer else -1
+            if close_pos == -1:
+                pos += 1
+                continue
+            plain = text[pending_start:pos]
+            unit_end = close_pos + 1
+            run_end = _read_terminal_run(text, unit_end)
+            if run_end > unit_end and plain.strip() and plain.rstrip()[-1] not in _TERMINAL_CHARS:
+                # "文A(事件)。" -> "文A。" / "(事件)": 紧随其后的句末标点归入前一个片段
+                plain = plain.rstrip() + text[unit_end:run_end]
+                segments.extend(self._split_plain(plain))
+                segments.append(text[pos:unit_end].strip())
+            else:
+                segments.extend(self._split_plain(plain))
+                segments.append(text[pos:run_end].strip())
+            pending_start = pos = run_end
+        segments.extend(self._split_plain(text[pending_start:]))
+        return [segment for segment in segments if segment]
+
+    def _split_plain(self, text: str) -> List[str]:
+        """在句末标点后断开普通文本，并把句首语气词单独分出。"""
+        pieces: List[str] = []
+        start = 0
+        pos = 0
+        while pos < len(text):
+            if text[pos] not in _TERMINAL_CHARS:
+                pos += 1
+                continue
+            run_end = _read_terminal_run(text, pos)
+            run = text[pos:run_end]
+            if self._should_break(text, start, pos, run_end, run):
+                pieces.append(text[start:run_end])
+                start = run_end
+            pos = run_end
+        pieces.append(text[start:])
+        result: List[str] = []
+        for piece in pieces:
+            result.extend(self._split_leading_filler(piece.strip()))
+        return result
+
+    def _should_break(self, text: str, start: int, pos: int, run_end: int, run: str) -> bool:
+        if all(char in _ELLIPSIS_CHARS or char == "." for char in run.rstrip("".join(_CLOSING_CHARS))) and \
+                (len(run) > 1 or run[0] in _ELLIPSIS_CHARS):
+            # 省略号常用于连接未完结的意群，片段过短时不断开 (规则4)
+            return len(text[start:pos].strip()) >= self.min_ellipsis_chars
+        if self.language == "en" and run == ".":
+            if run_end < len(text) and not text[run_end].isspace():
+                return False # 小数、网址等
+            previous_word = text[start:pos].rsplit(" ", 1)[-1].lower()
+            if previous_word in _EN_ABBREVIATIONS or (len(previous_word) == 1 and previous_word.isalpha()):
+                return False
+        return True
+
+    def _split_leading_filler(self, piece: str) -> List[str]:
+        if not piece:
+            return []
+        lowered = piece.lower()
+        for filler in self.fillers:
+            if not lowered.startswith(filler):
+                continue
+            end = len(filler)
+            while end < len(piece) and piece[end] in _FILLER_TRAILING_CHARS:
+                end += 1
+            lengthened = end > len(filler) or filler[-1] in _FILLER_TRAILING_CHARS # "あのー" 本身带拖长音
+            pause_end = end
+            while pause_end < len(piece) and piece[pause_end] in self.pause_chars:
+                pause_end += 1
+            # 语气词后须有停顿，否则只是普通单词的开头 ("うんざり"、"Well done"、"So the ...")
+            if pause_end == end and (self.language == "en" or not lengthened):
+                continue
+            end = pause_end
+            remainder = piece[end:].strip()
+            # 语气词后面须能独立成句，否则保持原样
+            if len(remainder) >= 2 and remainder[0] not in _TERMINAL_CHARS:
+                return [piece[:end].strip(), remainder]
+            return [piece]
+        return [piece]
+
+
+def segment_text(text: str, language: Optional[str] = None) -> List[str]:
+    """用规则分割文本；language 未指定时按文字种类猜测。"""
+    if not text or not text.strip():
+        return []
+    return RuleSegmenter(language or guess_language(text)).segment(text)
+
+
+def segment_with_rules(text: str, language: Optional[str] = None, signals_forwarder: Optional[Any] = None) -> List[str]:
+    """分割并把语言、片段数与耗时写入日志。"""
+    effective_language = language if language in app_config.RULE_SEGMENTER_FILLERS else guess_language(text or "")
+    started_at = time.perf_counter()
+    segments = segment_text(text, effective_language)
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    message = f"[Rule Segmenter] 本地规则分割完成 (语言: {effective_language})，得到 {len(segments)} 个片段，耗时 {elapsed_ms:.1f} 毫秒。"
+    if signals_forwarder and hasattr(signals_forwarder, 'log_message') and hasattr(signals_forwarder.log_message, 'emit'):
+        signals_forwarder.log_message.emit(message)
+    else:
+        print(message)
+    return segments
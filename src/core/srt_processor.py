@@ -2,7 +2,7 @@ import re
 import difflib
 from typing import List, Optional, Any, Dict
 from PyQt6.QtCore import QObject, pyqtSignal
-from .data_models import TimestampedWord, ParsedTranscription, SubtitleEntry
+from .data_models import TimestampedWord, ParsedTranscription, SubtitleEntry, join_word_texts
 import config as app_config # 使用别名以减少潜在冲突并清晰化来源
 
 class SrtProcessor:
@@ -207,7 +207,7 @@ class SrtProcessor:
         entries: List[SubtitleEntry] = []
         words_to_process = list(sentence_words)
         while words_to_process:
-            current_segment_text = "".join([w.text for w in words_to_process])
+            current_segment_text = join_word_texts(words_to_process)
             if not words_to_process: break
             current_segment_start_time = words_to_process[0].start_time
             current_segment_end_time = words_to_process[-1].end_time
@@ -246,7 +246,7 @@ class SrtProcessor:
                     first_segment_start_time = first_segment_words[0].start_time
                     first_segment_end_time = first_segment_words[-1].end_time
                     first_segment_duration = first_segment_end_time - first_segment_start_time
-                    first_segment_char_len = len("".join(w.text for w in first_segment_words))
+                    first_segment_char_len = len(join_word_texts(first_segment_words))
                     if first_segment_duration >= self.min_duration_target and \
                        first_segment_duration <= self.max_duration and \
                        first_segment_char_len <= self.max_chars_per_line:
@@ -258,7 +258,7 @@ class SrtProcessor:
                 best_split_index = best_split_point_data[0]
             if best_split_index != -1:
                 words_for_this_sub_entry = words_to_process[:best_split_index + 1]
-                sub_text = "".join([w.text for w in words_for_this_sub_entry])
+                sub_text = join_word_texts(words_for_this_sub_entry)
                 sub_start_time = words_for_this_sub_entry[0].start_time
                 sub_end_time = words_for_this_sub_entry[-1].end_time
                 if (sub_end_time - sub_start_time) < self.min_duration_target: sub_end_time = sub_start_time + self.min_duration_target
@@ -283,85 +283,101 @@ class SrtProcessor:
             if not words_to_process: break 
         return entries
 
+    def _entries_for_segment(self, entry_text_from_llm: str, matched_words: List[TimestampedWord],
+                             match_ratio: float) -> List[SubtitleEntry]:
+        """由一个片段及其对应的ASR词生成字幕条目: 音频事件单独成条，超限的片段再分割，过短的片段延长显示。"""
+        entries: List[SubtitleEntry] = []
+        first_actual_word_index = -1
+        for idx_fw, word_obj_fw in enumerate(matched_words):
+            if word_obj_fw.text.strip(): first_actual_word_index = idx_fw; break
+        last_actual_word_index = -1
+        for idx_bw in range(len(matched_words) - 1, -1, -1):
+            if matched_words[idx_bw].text.strip(): last_actual_word_index = idx_bw; break
+        actual_words_for_entry: List[TimestampedWord]
+        if first_actual_word_index != -1 and last_actual_word_index != -1 :
+            entry_start_time = matched_words[first_actual_word_index].start_time
+            entry_end_time = matched_words[last_actual_word_index].end_time
+            actual_words_for_entry = matched_words[first_actual_word_index : last_actual_word_index+1]
+            if not actual_words_for_entry:
+                self.log(f"警告: 修正后的词列表为空，LLM片段 \"{entry_text_from_llm[:30]}...\"。将使用原始匹配边界。")
+                entry_start_time = matched_words[0].start_time; entry_end_time = matched_words[-1].end_time
+                actual_words_for_entry = matched_words
+        else:
+            self.log(f"警告: LLM片段 \"{entry_text_from_llm[:30]}...\" 匹配到的所有ASR词元均为空或空格。将使用原始匹配边界。")
+            entry_start_time = matched_words[0].start_time; entry_end_time = matched_words[-1].end_time
+            actual_words_for_entry = matched_words
+        entry_duration = max(0.001, entry_end_time - entry_start_time)
+        text_len = len(entry_text_from_llm)
+        is_audio_event = False
+        if actual_words_for_entry:
+            is_audio_event = all(not w.text.strip() or getattr(w, 'type', 'word') == 'audio_event' or re.match(r"^\(.*\)$|^（.*）$", w.text.strip()) for w in actual_words_for_entry)
+        if is_audio_event:
+            final_audio_event_end_time = entry_end_time
+            if entry_duration < app_config.MIN_DURATION_ABSOLUTE: final_audio_event_end_time = entry_start_time + app_config.MIN_DURATION_ABSOLUTE
+            final_audio_event_end_time = max(final_audio_event_end_time, entry_start_time + 0.001)
+            audio_event_text_content = "".join([w.text for w in actual_words_for_entry])
+            entries.append(SubtitleEntry(0, entry_start_time, final_audio_event_end_time, audio_event_text_content, actual_words_for_entry, match_ratio))
+        elif entry_duration > self.max_duration or text_len > self.max_chars_per_line:
+            self.log(f"   片段超限，需分割: \"{entry_text_from_llm[:50]}...\" (时长: {entry_duration:.2f}s, 字符: {text_len})")
+            split_sub_entries = self.split_long_sentence(entry_text_from_llm, actual_words_for_entry, entry_start_time, entry_end_time)
+            for sub_entry in split_sub_entries: sub_entry.alignment_ratio = match_ratio
+            entries.extend(split_sub_entries)
+        elif entry_duration < self.min_duration_target :
+            final_short_entry_end_time = entry_start_time + self.min_duration_target
+            if entry_duration < app_config.MIN_DURATION_ABSOLUTE: final_short_entry_end_time = entry_start_time + app_config.MIN_DURATION_ABSOLUTE
+            original_end_of_last_actual_word = actual_words_for_entry[-1].end_time if actual_words_for_entry else entry_start_time
+            max_allowed_extension = original_end_of_last_actual_word + 0.5 
+            final_short_entry_end_time = min(final_short_entry_end_time, max_allowed_extension)
+            final_short_entry_end_time = max(final_short_entry_end_time, entry_end_time) 
+            final_short_entry_end_time = max(final_short_entry_end_time, entry_start_time + 0.001)
+            entries.append(SubtitleEntry(0, entry_start_time, final_short_entry_end_time, entry_text_from_llm, actual_words_for_entry, match_ratio))
+        else:
+            entries.append(SubtitleEntry(0, entry_start_time, entry_end_time, entry_text_from_llm, actual_words_for_entry, match_ratio))
+        return entries
+
     def process_to_srt(self, parsed_transcription: ParsedTranscription,
                        llm_segments_text: List[str]
                       ) -> Optional[str]:
-        self.log("--- 开始对齐 LLM 片段 (SrtProcessor) ---")
-        intermediate_entries: List[SubtitleEntry] = []
-        word_search_start_index = 0
-        unaligned_segments: List[str] = []
-        all_parsed_words = parsed_transcription.words
         if not llm_segments_text: self.log("错误：LLM 未返回任何分割片段。"); return None
-        if not all_parsed_words: self.log("错误：解析后的词列表为空，无法进行对齐。"); return None
-        total_llm_segments = len(llm_segments_text)
-        WEIGHT_ALIGN = 40; WEIGHT_MERGE = 30; WEIGHT_FORMAT = 30
-        completed_steps_phase1 = 0
+        aligner = self.create_aligner(parsed_transcription, total_segments=len(llm_segments_text))
+        if aligner is None or not aligner.align(llm_segments_text): return None
+        return aligner.finish()
+
+    def create_aligner(self, parsed_transcription: ParsedTranscription,
+                       total_segments: Optional[int] = None) -> Optional["SegmentAligner"]:
+        """创建逐批对齐片段的对齐器；total_segments 未知 (流水线模式) 时阶段1不报告进度。"""
+        if not parsed_transcription.words: self.log("错误：解析后的词列表为空，无法进行对齐。"); return None
+        self.log("--- 开始对齐 LLM 片段 (SrtProcessor) ---")
         self.log("SRT阶段1: 对齐LLM片段...")
-        for i, text_seg_from_llm in enumerate(llm_segments_text):
-            if not self._is_worker_running(): self.log("任务被用户中断(对齐阶段)。"); return None
-            self.log(f"   对齐LLM片段 {i+1}/{total_llm_segments}: \"{text_seg_from_llm[:30]}...\"")
-            matched_words, next_search_idx, match_ratio = self.get_segment_words_fuzzy(text_seg_from_llm, all_parsed_words, word_search_start_index)
-            if not matched_words or match_ratio == 0:
-                unaligned_segments.append(text_seg_from_llm)
-                completed_steps_phase1 += 1
-                self._emit_srt_progress(int( (completed_steps_phase1 / total_llm_segments) * WEIGHT_ALIGN ), 100)
-                continue
-            word_search_start_index = next_search_idx
-            first_actual_word_index = -1
-            for idx_fw, word_obj_fw in enumerate(matched_words):
-                if word_obj_fw.text.strip(): first_actual_word_index = idx_fw; break
-            last_actual_word_index = -1
-            for idx_bw in range(len(matched_words) - 1, -1, -1):
-                if matched_words[idx_bw].text.strip(): last_actual_word_index = idx_bw; break
-            entry_text_from_llm = text_seg_from_llm.strip()
-            actual_words_for_entry: List[TimestampedWord]
-            if first_actual_word_index != -1 and last_actual_word_index != -1 :
-                entry_start_time = matched_words[first_actual_word_index].start_time
-                entry_end_time = matched_words[last_actual_word_index].end_time
-                actual_words_for_entry = matched_words[first_actual_word_index : last_actual_word_index+1]
-                if not actual_words_for_entry:
-                    self.log(f"警告: 修正后的词列表为空，LLM片段 \"{entry_text_from_llm[:30]}...\"。将使用原始匹配边界。")
-                    entry_start_time = matched_words[0].start_time; entry_end_time = matched_words[-1].end_time
-                    actual_words_for_entry = matched_words
-            else:
-                self.log(f"警告: LLM片段 \"{entry_text_from_llm[:30]}...\" 匹配到的所有ASR词元均为空或空格。将使用原始匹配边界。")
-                entry_start_time = matched_words[0].start_time; entry_end_time = matched_words[-1].end_time
-                actual_words_for_entry = matched_words
-            entry_duration = max(0.001, entry_end_time - entry_start_time)
-            text_len = len(entry_text_from_llm)
-            is_audio_event = False
-            if actual_words_for_entry:
-                is_audio_event = all(not w.text.strip() or getattr(w, 'type', 'word') == 'audio_event' or re.match(r"^\(.*\)$|^（.*）$", w.text.strip()) for w in actual_words_for_entry)
-            if is_audio_event:
-                final_audio_event_end_time = entry_end_time
-                if entry_duration < app_config.MIN_DURATION_ABSOLUTE: final_audio_event_end_time = entry_start_time + app_config.MIN_DURATION_ABSOLUTE
-                final_audio_event_end_time = max(final_audio_event_end_time, entry_start_time + 0.001)
-                audio_event_text_content = "".join([w.text for w in actual_words_for_entry])
-                intermediate_entries.append(SubtitleEntry(0, entry_start_time, final_audio_event_end_time, audio_event_text_content, actual_words_for_entry, match_ratio))
-            elif entry_duration > self.max_duration or text_len > self.max_chars_per_line:
-                self.log(f"   片段超限，需分割: \"{entry_text_from_llm[:50]}...\" (时长: {entry_duration:.2f}s, 字符: {text_len})")
-                split_sub_entries = self.split_long_sentence(entry_text_from_llm, actual_words_for_entry, entry_start_time, entry_end_time)
-                for sub_entry in split_sub_entries: sub_entry.alignment_ratio = match_ratio
-                intermediate_entries.extend(split_sub_entries)
-            elif entry_duration < self.min_duration_target :
-                final_short_entry_end_time = entry_start_time + self.min_duration_target
-                if entry_duration < app_config.MIN_DURATION_ABSOLUTE: final_short_entry_end_time = entry_start_time + app_config.MIN_DURATION_ABSOLUTE
-                original_end_of_last_actual_word = actual_words_for_entry[-1].end_time if actual_words_for_entry else entry_start_time
-                max_allowed_extension = original_end_of_last_actual_word + 0.5 
-                final_short_entry_end_time = min(final_short_entry_end_time, max_allowed_extension)
-                final_short_entry_end_time = max(final_short_entry_end_time, entry_end_time) 
-                final_short_entry_end_time = max(final_short_entry_end_time, entry_start_time + 0.001)
-                intermediate_entries.append(SubtitleEntry(0, entry_start_time, final_short_entry_end_time, entry_text_from_llm, actual_words_for_entry, match_ratio))
-            else:
-                intermediate_entries.append(SubtitleEntry(0, entry_start_time, entry_end_time, entry_text_from_llm, actual_words_for_entry, match_ratio))
-            completed_steps_phase1 += 1
-            self._emit_srt_progress(int( (completed_steps_phase1 / total_llm_segments) * WEIGHT_ALIGN ), 100)
-        self.log("--- LLM片段对齐结束 ---")
-        if unaligned_segments:
-            self.log(f"\n--- 以下 {len(unaligned_segments)} 个LLM片段未能成功对齐，已跳过 ---")
-            for seg_idx, seg_text in enumerate(unaligned_segments): self.log(f"- 片段 {seg_idx+1}: \"{seg_text}\"")
-            self.log("----------------------------------------\n")
-        if not intermediate_entries: self.log("错误：对齐后没有生成任何有效的字幕条目。"); return None
+        return SegmentAligner(self, parsed_transcription.words, total_segments)
+
+    def process_word_ranges_to_srt(self, parsed_transcription: ParsedTranscription,
+                                   word_ranges: List[tuple[int, int]]
+                                  ) -> Optional[str]:
+        """
+        断点索引模式: word_ranges 为每个片段在 parsed_transcription.words 中的 [起, 止) 下标，
+        直接切片取得片段的词与时间戳，不做模糊对齐，其后的分割、合并与格式化与 process_to_srt 相同。
+        """
+        self.log("--- 按断点索引生成字幕条目 (SrtProcessor，无需对齐) ---")
+        all_parsed_words = parsed_transcription.words
+        if not word_ranges: self.log("错误：LLM 未返回任何分割片段。"); return None
+        if not all_parsed_words: self.log("错误：解析后的词列表为空，无法生成字幕。"); return None
+        WEIGHT_SLICE = 10
+        intermediate_entries: List[SubtitleEntry] = []
+        self.log("SRT阶段1: 按索引切分词序列...")
+        for i, (range_start, range_end) in enumerate(word_ranges):
+            if not self._is_worker_running(): self.log("任务被用户中断(切分阶段)。"); return None
+            segment_words = all_parsed_words[max(0, range_start):min(range_end, len(all_parsed_words))]
+            segment_text = join_word_texts(segment_words).strip()
+            if not segment_text: continue
+            intermediate_entries.extend(self._entries_for_segment(segment_text, segment_words, 1.0))
+            self._emit_srt_progress(int(((i + 1) / len(word_ranges)) * WEIGHT_SLICE), 100)
+        if not intermediate_entries: self.log("错误：按索引切分后没有生成任何有效的字幕条目。"); return None
+        return self._merge_and_format_entries(intermediate_entries, WEIGHT_SLICE)
+
+    def _merge_and_format_entries(self, intermediate_entries: List[SubtitleEntry], progress_start: int) -> Optional[str]:
+        """SRT阶段2、3: 合并过短的相邻条目，调整间隔与时长后输出SRT文本。progress_start 为阶段1已占用的进度权重。"""
+        WEIGHT_MERGE = (100 - progress_start) // 2; WEIGHT_FORMAT = 100 - progress_start - WEIGHT_MERGE
         intermediate_entries.sort(key=lambda e: e.start_time)
         self.log("SRT阶段2: 合并调整字幕条目...")
         merged_entries: List[SubtitleEntry] = []
@@ -394,7 +410,7 @@ class SrtProcessor:
             if not merged_this_iteration:
                 merged_entries.append(current_entry_to_merge); idx_merge += 1
             current_phase2_progress_component = int(((idx_merge) / total_intermediate_entries if total_intermediate_entries > 0 else 1) * WEIGHT_MERGE)
-            self._emit_srt_progress(WEIGHT_ALIGN + current_phase2_progress_component, 100)
+            self._emit_srt_progress(progress_start + current_phase2_progress_component, 100)
         self.log(f"--- 合并调整后得到 {len(merged_entries)} 个字幕条目，开始最终格式化 ---")
         self.log("SRT阶段3: 最终格式化字幕...")
         final_srt_formatted_list: List[str] = []
@@ -435,6 +451,52 @@ class SrtProcessor:
             final_srt_formatted_list.append(current_entry.to_srt_format(self))
             last_processed_entry_object = current_entry; subtitle_index += 1
             current_phase3_progress_component = int(((entry_idx + 1) / total_merged_final_entries if total_merged_final_entries > 0 else 1) * WEIGHT_FORMAT)
-            self._emit_srt_progress(WEIGHT_ALIGN + WEIGHT_MERGE + current_phase3_progress_component, 100)
+            self._emit_srt_progress(progress_start + WEIGHT_MERGE + current_phase3_progress_component, 100)
         self.log("--- SRT 内容生成和格式化完成 ---")
         return "".join(final_srt_formatted_list).strip()
+
+
+class SegmentAligner:
+    """
+    逐批对齐 LLM 片段。词游标在批次之间单调前进，分多批送入与一次送入全部片段的结果相同，
+    因此可以在后续文本块仍在请求时先对齐已返回的块；全部送入后调用 finish 进行合并与格式化。
+    """
+    WEIGHT_ALIGN = 40
+
+    def __init__(self, processor: SrtProcessor, all_parsed_words: List[TimestampedWord], total_segments: Optional[int] = None):
+        self.processor = processor
+        self.all_parsed_words = all_parsed_words
+        self.total_segments = total_segments
+        self.word_search_start_index = 0
+        self.aligned_count = 0
+        self.intermediate_entries: List[SubtitleEntry] = []
+        self.unaligned_segments: List[str] = []
+
+    def align(self, llm_segments_text: List[str]) -> bool:
+        """对齐一批片段；任务被取消时返回False。"""
+        processor = self.processor
+        total_label = self.total_segments if self.total_segments else "?"
+        for text_seg_from_llm in llm_segments_text:
+            if not processor._is_worker_running(): processor.log("任务被用户中断(对齐阶段)。"); return False
+            self.aligned_count += 1
+            processor.log(f"   对齐LLM片段 {self.aligned_count}/{total_label}: \"{text_seg_from_llm[:30]}...\"")
+            matched_words, next_search_idx, match_ratio = processor.get_segment_words_fuzzy(text_seg_from_llm, self.all_parsed_words, self.word_search_start_index)
+            if not matched_words or match_ratio == 0:
+                self.unaligned_segments.append(text_seg_from_llm)
+            else:
+                self.word_search_start_index = next_search_idx
+                self.intermediate_entries.extend(processor._entries_for_segment(text_seg_from_llm.strip(), matched_words, match_ratio))
+            if self.total_segments:
+                processor._emit_srt_progress(int((min(self.aligned_count, self.total_segments) / self.total_segments) * self.WEIGHT_ALIGN), 100)
+        return True
+
+    def finish(self) -> Optional[str]:
+        processor = self.processor
+        processor.log("--- LLM片段对齐结束 ---")
+        if self.unaligned_segments:
+            processor.log(f"\n--- 以下 {len(self.unaligned_segments)} 个LLM片段未能成功对齐，已跳过 ---")
+            for seg_idx, seg_text in enumerate(self.unaligned_segments): processor.log(f"- 片段 {seg_idx+1}: \"{seg_text}\"")
+            processor.log("----------------------------------------\n")
+        if not self.aligned_count: processor.log("错误：LLM 未返回任何分割片段。"); return None
+        if not self.intermediate_entries: processor.log("错误：对齐后没有生成任何有效的字幕条目。"); return None
+        return processor._merge_and_format_entries(self.intermediate_entries, self.WEIGHT_ALIGN)
@@ -0,0 +1,121 @@
+from typing import Any, Dict, Optional, Tuple
+
+# --- 提示词 token 数估算 ---
+# 不依赖具体模型的分词器，按字符类别近似估算，宁多勿少，供限流与分块预算使用。
+
+CJK_TOKENS_PER_CHAR = 1.0 # 汉字、假名、谚文: 每字约一个token
+OTHER_CHARS_PER_TOKEN = 4.0 # 拉丁字母等: 约四个字符一个token
+MESSAGE_OVERHEAD_TOKENS = 4 # 每条消息的角色与分隔符开销
+
+# 已知语言时对 CJK 字符使用更贴近实际的系数: 常用汉字多被合并为词元，假名则接近一字一token
+CJK_TOKENS_PER_CHAR_BY_LANGUAGE = {
+    "zh": 0.7,
+    "ja": 1.0,
+    "ko": 1.0,
+}
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF or # 平假名、片假名
+        0x3400 <= code <= 0x4DBF or # CJK 扩展A
+        0x4E00 <= code <= 0x9FFF or # CJK 统一汉字
+        0xAC00 <= code <= 0xD7AF or # 谚文
+        0xF900 <= code <= 0xFAFF or # CJK 兼容汉字
+        0xFF66 <= code <= 0xFF9F # 半角片假名
+    )
+
+
+def _cjk_tokens_per_char(language: Optional[str]) -> float:
+    return CJK_TOKENS_PER_CHAR_BY_LANGUAGE.get(language, CJK_TOKENS_PER_CHAR) if language else CJK_TOKENS_PER_CHAR
+
+
+def estimate_text_tokens(text: Optional[str], language: Optional[str] = None) -> int:
+    """估算一段文本的 token 数。language 为两字母语言代码，未知时按最保守的系数估算。"""
+    if not text:
+        return 0
+    cjk_chars = sum(1 for char in text if _is_cjk(char))
+    other_chars = len(text) - cjk_chars
+    return int(cjk_chars * _cjk_tokens_per_char(language) + other_chars / OTHER_CHARS_PER_TOKEN) + 1
+
+
+def find_token_budget_end(text: str, start: int, max_tokens: int, language: Optional[str] = None) -> int:
+    """从 start 开始向后累计估算的 token 数，返回不超过 max_tokens 的最远位置 (至少前进一个字符)。"""
+    cjk_weight = _cjk_tokens_per_char(language)
+    other_weight = 1.0 / OTHER_CHARS_PER_TOKEN
+    used = 0.0
+    pos = start
+    text_len = len(text)
+    while pos < text_len:
+        used += cjk_weight if _is_cjk(text[pos]) else other_weight
+        if used > max_tokens and pos > start:
+            break
+        pos += 1
+    return pos
+
+
+def estimate_payload_tokens(payload: Dict[str, Any]) -> int:
+    """估算一次 chat/completions 请求消耗的 token 数 (提示词 + 预期输出)。"""
+    prompt_tokens = 0
+    user_tokens = 0
+    for message in payload.get("messages", []):
+        message_tokens = estimate_text_tokens(message.get("content")) + MESSAGE_OVERHEAD_TOKENS
+        prompt_tokens += message_tokens
+        if message.get("role") == "user":
+            user_tokens = message_tokens
+    max_tokens = payload.get("max_tokens")
+    # 分割任务的输出与输入文本规模相当；指定了 max_tokens 时以其为上限
+    expected_output = min(user_tokens, max_tokens) if max_tokens else user_tokens
+    return prompt_tokens + expected_output
+
+
+def usage_total_tokens(data: Dict[str, Any]) -> Optional[int]:
+    """从响应中读取实际消耗的 token 总数 (OpenAI 的 usage 或 Gemini 的 usageMetadata)。"""
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if isinstance(usage, dict):
+        total = usage.get("total_tokens")
+        if total is None and usage.get("prompt_tokens") is not None:
+            total = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        if isinstance(total, (int, float)):
+            return int(total)
+    usage_metadata = data.get("usageMetadata") if isinstance(data, dict) else None
+    if isinstance(usage_metadata, dict) and isinstance(usage_metadata.get("totalTokenCount"), (int, float)):
+        return int(usage_metadata["totalTokenCount"])
+    return None
+
+
+def usage_prompt_cache_tokens(data: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """
+    从响应中读取 (命中前缀缓存的提示词 token 数, 提示词 token 总数)；服务商未报告缓存命中时返回None。
+    支持 DeepSeek 的 prompt_cache_hit_tokens / prompt_cache_miss_tokens、
+    OpenAI 的 prompt_tokens_details.cached_tokens 与 Gemini 的 usageMetadata.cachedContentTokenCount。
+    """
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if isinstance(usage, dict):
+        hit, miss = usage.get("prompt_cache_hit_tokens"), usage.get("prompt_cache_miss_tokens")
+        if isinstance(hit, (int, float)) and isinstance(miss, (int, float)):
+            return int(hit), int(hit + miss)
+        details = usage.get("prompt_tokens_details")
+        prompt_tokens = usage.get("prompt_tokens")
+        if isinstance(details, dict) and isinstance(details.get("cached_tokens"), (int, float)) and isinstance(prompt_tokens, (int, float)):
+            return int(details["cached_tokens"]), int(prompt_tokens)
+    usage_metadata = data.get("usageMetadata") if isinstance(data, dict) else None
+    if isinstance(usage_metadata, dict) and isinstance(usage_metadata.get("promptTokenCount"), (int, float)):
+        return int(usage_metadata.get("cachedContentTokenCount") or 0), int(usage_metadata["promptTokenCount"])
+    return None
+
+
+def usage_prompt_completion_tokens(data: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    """从响应中读取 (提示词 token 数, 输出 token 数)；未报告的项为None。"""
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if isinstance(usage, dict):
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        return (int(prompt) if isinstance(prompt, (int, float)) else None,
+                int(completion) if isinstance(completion, (int, float)) else None)
+    usage_metadata = data.get("usageMetadata") if isinstance(data, dict) else None
+    if isinstance(usage_metadata, dict):
+        prompt, completion = usage_metadata.get("promptTokenCount"), usage_metadata.get("candidatesTokenCount")
+        return (int(prompt) if isinstance(prompt, (int, float)) else None,
+                int(completion) if isinstance(completion, (int, float)) else None)
+    return None, None
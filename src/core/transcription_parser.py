@@ -1,14 +1,81 @@
-from typing import List, Optional, Literal
+from typing import List, Optional, Literal, Any, Set
+import re
+import heapq
 import traceback
 # Corrected import: removed 'src.' prefix, or use relative if preferred for sibling modules
-from core.data_models import TimestampedWord, ParsedTranscription
+from core.data_models import TimestampedWord, ParsedTranscription, ParseDiagnostics
+import config as app_config
 # from .data_models import TimestampedWord, ParsedTranscription # Alternative using relative import
 
+SUPPORTED_SOURCE_FORMATS = ("elevenlabs", "whisper", "deepgram", "assemblyai")
+FORMAT_SNIFF_BYTES = 8192 # 嗅探格式时读取的文件头字节数
+
+# 各服务商JSON中具有区分度的键名 (出现任意一个即可判定)
+_DEEPGRAM_MARKER_KEYS = {"alternatives", "transaction_key", "model_info"}
+_ASSEMBLYAI_MARKER_KEYS = {"utterances", "audio_url", "acoustic_model", "language_model", "audio_duration"}
+# language_probability 也出现在 faster-whisper 的顶层，不能作为 ElevenLabs 的特征
+_ELEVENLABS_MARKER_KEYS = {"speaker_id", "additional_formats"}
+_WHISPER_MARKER_KEYS = {"segments", "avg_logprob", "no_speech_prob", "compression_ratio", "seek"}
+
+_JSON_KEY_PATTERN = re.compile(r'"([A-Za-z_][A-Za-z0-9_]*)"\s*:')
+_START_VALUE_PATTERN = re.compile(r'"start"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)')
+_MAX_SNIFFED_START_VALUES = 20
+
+DEFAULT_MAX_DIAGNOSTIC_SAMPLES = 5 # 汇总日志中保留的跳过词条示例数
+_MAX_SAMPLE_CHARS = 200
+
+SKIP_REASON_INCOMPLETE = "字段不完整"
+SKIP_REASON_INVALID_TIMESTAMP = "时间戳无效"
+
+
+class TranscriptionParseError(Exception):
+    """严格模式下被跳过词条的比例超过阈值时抛出，用于提前中止解析。"""
+
+
+def _classify_format(keys: Set[str], start_values: List[str], has_deepgram_nesting: bool = False) -> Optional[str]:
+    """根据键名集合、时间戳取值和嵌套结构推断格式。start_values 为 "start" 字段的原始文本。"""
+    if has_deepgram_nesting or ("results" in keys and keys & _DEEPGRAM_MARKER_KEYS):
+        return "deepgram"
+    if keys & _ASSEMBLYAI_MARKER_KEYS:
+        return "assemblyai"
+    # Whisper 的分段结构先于 ElevenLabs 判断；ElevenLabs 只有顶层 words 列表，没有 segments
+    if keys & _WHISPER_MARKER_KEYS:
+        return "whisper"
+    if keys & _ELEVENLABS_MARKER_KEYS and "words" in keys:
+        return "elevenlabs"
+    if not start_values:
+        return None
+    # 没有特征键时按时间戳单位区分: AssemblyAI 使用整数毫秒，其他服务商使用浮点秒
+    try:
+        numeric_values = [float(v) for v in start_values]
+    except ValueError:
+        return None
+    all_integral = all(("." not in v and "e" not in v.lower()) for v in start_values)
+    if all_integral and max(numeric_values) >= 1000:
+        return "assemblyai"
+    if "word" in keys:
+        return "whisper"
+    if "text" in keys:
+        return "elevenlabs"
+    return None
+
 
 class TranscriptionParser:
     """解析来自不同ASR服务商的JSON输出。"""
-    def __init__(self, signals_forwarder=None):
+    def __init__(self, signals_forwarder=None, strict_mode: bool = app_config.DEFAULT_PARSER_STRICT_MODE,
+                 max_error_rate: float = app_config.DEFAULT_PARSER_MAX_ERROR_RATE,
+                 max_diagnostic_samples: int = DEFAULT_MAX_DIAGNOSTIC_SAMPLES):
         self._signals = signals_forwarder # 用于日志输出的信号转发器
+        self.strict_mode = strict_mode # 严格模式: 跳过比例超过 max_error_rate 时中止解析
+        self.max_error_rate = max_error_rate
+        self.max_diagnostic_samples = max_diagnostic_samples
+        self.last_diagnostics: Optional[ParseDiagnostics] = None # 最近一次解析的词条统计
+        self._parsers = {
+            "elevenlabs": self._parse_elevenlabs,
+            "whisper": self._parse_whisper,
+            "deepgram": self._parse_deepgram,
+            "assemblyai": self._parse_assemblyai,
+        }
 
     def log(self, message):
         """记录日志消息。"""
@@ -17,38 +84,125 @@ class TranscriptionParser:
         else:
             print(f"[Parser] {message}") # 如果没有信号转发器，则打印到控制台
 
-    def parse(self, data: dict, source_format: Literal["elevenlabs", "whisper", "deepgram", "assemblyai"]) -> Optional[ParsedTranscription]:
+    def sniff_text_format(self, head_text: str) -> Optional[str]:
+        """
+        仅根据JSON文本开头部分推断格式，无需完整解析。
+        :param head_text: 文件开头的若干字符 (可以是被截断的不完整JSON)。
+        :return: 推断出的格式名，无法判断时返回None。
+        """
+        keys = set(_JSON_KEY_PATTERN.findall(head_text))
+        start_values = _START_VALUE_PATTERN.findall(head_text)[:_MAX_SNIFFED_START_VALUES]
+        return _classify_format(keys, start_values)
+
+    def sniff_file_format(self, file_path: str, max_bytes: int = FORMAT_SNIFF_BYTES) -> Optional[str]:
+        """读取文件开头的 max_bytes 字节并推断格式。读取失败时返回None。"""
+        try:
+            with open(file_path, "rb") as f:
+                head_bytes = f.read(max_bytes)
+        except OSError as e:
+            self.log(f"警告: 读取文件头以检测格式失败: {e}")
+            return None
+        # 截断处可能落在多字节字符中间，忽略解码错误即可
+        head_text = head_bytes.decode("utf-8", errors="ignore").lstrip("\ufeff")
+        return self.sniff_text_format(head_text)
+
+    def detect_format(self, data: dict) -> Optional[str]:
+        """根据已加载的JSON字典推断格式，只检查顶层键、首个词条和嵌套结构。"""
+        if not isinstance(data, dict):
+            return None
+        keys: Set[str] = set(data.keys())
+        results = data.get("results")
+        has_deepgram_nesting = isinstance(results, dict) and isinstance(results.get("channels"), list)
+
+        sample_words: List[Any] = []
+        if isinstance(data.get("words"), list):
+            sample_words = data["words"][:_MAX_SNIFFED_START_VALUES]
+        else:
+            for container_key in ("segments", "utterances"):
+                containers = data.get(container_key)
+                if isinstance(containers, list):
+                    for container in containers:
+                        if isinstance(container, dict) and isinstance(container.get("words"), list) and container["words"]:
+                            keys.update(container.keys())
+                            sample_words = container["words"][:_MAX_SNIFFED_START_VALUES]
+                            break
+                    break
+
+        start_values: List[str] = []
+        for word_info in sample_words:
+            if not isinstance(word_info, dict):
+                continue
+            keys.update(word_info.keys())
+            start = word_info.get("start")
+            if isinstance(start, (int, float)) and not isinstance(start, bool):
+                start_values.append(repr(start))
+        return _classify_format(keys, start_values, has_deepgram_nesting)
+
+    def parse(self, data: dict, source_format: Literal["auto", "elevenlabs", "whisper", "deepgram", "assemblyai"]) -> Optional[ParsedTranscription]:
         """
         解析JSON数据。
         :param data: 包含ASR结果的字典。
-        :param source_format: JSON的来源格式。
+        :param source_format: JSON的来源格式；为 "auto" 时根据数据结构自动检测。
         :return: 解析后的转录数据对象，或在失败时返回None。
         """
+        if source_format == "auto":
+            detected_format = self.detect_format(data)
+            if detected_format is None:
+                self.log("错误: 无法自动识别 JSON 的来源格式。")
+                return None
+            self.log(f"自动识别 JSON 格式为: {detected_format.capitalize()}")
+            source_format = detected_format
+
+        parse_method = self._parsers.get(source_format)
+        if parse_method is None:
+            self.log(f"错误: 不支持的 JSON 格式源 '{source_format}'")
+            return None
+
         self.log(f"开始解析 {source_format.capitalize()} JSON...")
+        self.last_diagnostics = ParseDiagnostics(source_format=source_format)
         result: Optional[ParsedTranscription] = None
         try:
-            if source_format == "elevenlabs": result = self._parse_elevenlabs(data)
-            elif source_format == "whisper": result = self._parse_whisper(data)
-            elif source_format == "deepgram": result = self._parse_deepgram(data)
-            elif source_format == "assemblyai": result = self._parse_assemblyai(data)
-            else:
-                self.log(f"错误: 不支持的 JSON 格式源 '{source_format}'")
-                return None
-
+            result = parse_method(data)
+            if self.last_diagnostics.total_words:
+                self.log(self.last_diagnostics.summary())
             if result:
                 self.log(f"{source_format.capitalize()} JSON 解析完成，得到 {len(result.words)} 个词。总文本长度: {len(result.full_text or '')} 字符。")
             else:
                 self.log(f"{source_format.capitalize()} JSON 解析未能返回有效结果。")
             return result
+        except TranscriptionParseError as e:
+            self.log(self.last_diagnostics.summary())
+            self.log(f"错误: {e}")
+            return None
         except Exception as e:
             self.log(f"解析 {source_format.capitalize()} JSON 时出错: {e}")
             self.log(traceback.format_exc())
             return None
 
+    def _begin_word_scan(self, total_words: int):
+        """在遍历词列表前登记词条总数，严格模式据此计算跳过比例。"""
+        if self.last_diagnostics is not None:
+            self.last_diagnostics.total_words += total_words
+
+    def _record_skipped_word(self, reason: str, word_info: Any):
+        """记录一个被跳过的词条；严格模式下超过阈值立即中止。"""
+        diagnostics = self.last_diagnostics
+        if diagnostics is None:
+            return
+        diagnostics.skipped_by_reason[reason] = diagnostics.skipped_by_reason.get(reason, 0) + 1
+        if len(diagnostics.samples) < self.max_diagnostic_samples:
+            diagnostics.samples.append(f"[{reason}] {str(word_info)[:_MAX_SAMPLE_CHARS]}")
+        if self.strict_mode and diagnostics.skipped_words > self.max_error_rate * diagnostics.total_words:
+            raise TranscriptionParseError(
+                f"严格模式: 跳过的词条数 {diagnostics.skipped_words}/{diagnostics.total_words} 已超过允许比例 {self.max_error_rate:.1%}，中止解析。"
+            )
+
     def _parse_elevenlabs(self, data: dict) -> Optional[ParsedTranscription]:
         """解析 ElevenLabs 格式的JSON。"""
         parsed_words: List[TimestampedWord] = []
-        for word_info in data.get("words", []):
+        elevenlabs_words_list = data.get("words", [])
+        self._begin_word_scan(len(elevenlabs_words_list))
+        for word_info in elevenlabs_words_list:
             text = word_info.get("text", word_info.get("word")) # 兼容 'text' 和 'word' 字段
             start = word_info.get("start")
             end = word_info.get("end")
@@ -56,10 +210,10 @@ class TranscriptionParser:
             if text is not None and start is not None and end is not None:
                 try:
                     parsed_words.append(TimestampedWord(str(text), float(start), float(end), str(speaker) if speaker else None))
-                except ValueError:
-                    self.log(f"警告: 跳过 ElevenLabs 词条，时间戳格式无效: {word_info}")
+                except (ValueError, TypeError):
+                    self._record_skipped_word(SKIP_REASON_INVALID_TIMESTAMP, word_info)
             else:
-                self.log(f"警告: 跳过不完整的 ElevenLabs 词条: {word_info}")
+                self._record_skipped_word(SKIP_REASON_INCOMPLETE, word_info)
         full_text = data.get("text", "") # 获取完整文本
         if not full_text and parsed_words:
             full_text = " ".join(word.text for word in parsed_words) # 如果没有完整文本，则从词语拼接
@@ -85,6 +239,7 @@ class TranscriptionParser:
             self.log("错误: Whisper JSON 既无有效词列表也无顶层文本。")
             return None
 
+        self._begin_word_scan(len(whisper_words_list))
         for word_info in whisper_words_list:
             text = word_info.get("word", word_info.get("text")) # 兼容 'word' 和 'text'
             start = word_info.get("start")
@@ -92,10 +247,10 @@ class TranscriptionParser:
             if text is not None and start is not None and end is not None:
                 try:
                     parsed_words.append(TimestampedWord(str(text), float(start), float(end)))
-                except ValueError:
-                    self.log(f"警告: 跳过 Whisper 词条，时间戳格式无效: {word_info}")
+                except (ValueError, TypeError):
+                    self._record_skipped_word(SKIP_REASON_INVALID_TIMESTAMP, word_info)
             else:
-                self.log(f"警告: 跳过不完整的 Whisper 词条: {word_info}")
+                self._record_skipped_word(SKIP_REASON_INCOMPLETE, word_info)
         full_text = data.get("text", "")
         if not full_text and parsed_words:
             full_text = " ".join(word.text for word in parsed_words)
@@ -103,7 +258,7 @@ class TranscriptionParser:
         return ParsedTranscription(words=parsed_words, full_text=full_text, language_code=language)
 
     def _parse_deepgram(self, data: dict) -> Optional[ParsedTranscription]:
-        """解析 Deepgram 格式的JSON。"""
+        """解析 Deepgram 格式的JSON。多声道录音会读取全部声道，并按时间合并为一条词流。"""
         try:
             # 检查 Deepgram JSON 的预期结构
             if not (data.get("results") and data["results"].get("channels") and isinstance(data["results"]["channels"], list) and
@@ -112,36 +267,73 @@ class TranscriptionParser:
                 self.log("错误: Deepgram JSON 结构不符合预期。")
                 return None
 
-            alternative = data["results"]["channels"][0]["alternatives"][0] # 通常取第一个 alternative
-            if "words" not in alternative or not isinstance(alternative["words"], list): # 如果没有词列表
-                full_text_only = alternative.get("transcript", "") # 尝试获取 "transcript"
+            channels = data["results"]["channels"]
+            multi_channel = len(channels) > 1
+            language = None
+            transcripts: List[str] = []
+            channel_word_lists: List[List[TimestampedWord]] = []
+
+            for channel_index, channel in enumerate(channels):
+                if not (isinstance(channel, dict) and isinstance(channel.get("alternatives"), list) and channel["alternatives"]):
+                    self.log(f"警告: Deepgram 声道 {channel_index} 缺少 alternatives，已忽略。")
+                    continue
+                if language is None:
+                    language = channel.get("detected_language")
+                alternative = channel["alternatives"][0] # 通常取第一个 alternative
+                transcript = alternative.get("transcript", "")
+                if transcript:
+                    transcripts.append(transcript)
+                if "words" not in alternative or not isinstance(alternative["words"], list): # 该声道没有词列表
+                    continue
+                channel_word_lists.append(self._parse_deepgram_channel_words(alternative["words"], channel_index if multi_channel else None))
+
+            if not channel_word_lists: # 所有声道都没有词列表
+                full_text_only = "\n".join(transcripts) # 尝试获取 "transcript"
                 if full_text_only:
-                    return ParsedTranscription(words=[], full_text=full_text_only, language_code=data["results"]["channels"][0].get("detected_language"))
+                    return ParsedTranscription(words=[], full_text=full_text_only, language_code=language)
                 self.log("错误: Deepgram JSON 既无词列表也无 transcript。")
                 return None
 
-            parsed_words: List[TimestampedWord] = []
-            for word_info in alternative.get("words", []):
-                text = word_info.get("word", word_info.get("punctuated_word")) # 优先使用 "punctuated_word"
-                start = word_info.get("start")
-                end = word_info.get("end")
-                speaker = word_info.get("speaker")
-                if text is not None and start is not None and end is not None:
-                    try:
-                        parsed_words.append(TimestampedWord(str(text), float(start), float(end), str(speaker) if speaker else None))
-                    except ValueError:
-                        self.log(f"警告: 跳过 Deepgram 词条，时间戳格式无效: {word_info}")
-                else:
-                    self.log(f"警告: 跳过不完整的 Deepgram 词条: {word_info}")
-            full_text = alternative.get("transcript", "")
+            if not multi_channel:
+                parsed_words = channel_word_lists[0]
+                full_text = transcripts[0] if transcripts else ""
+            else:
+                # k 路堆合并: 每个声道内部已按时间排序，合并复杂度 O(n log k)
+                parsed_words = list(heapq.merge(*channel_word_lists, key=lambda word: word.start_time))
+                full_text = "" # 各声道的 transcript 互相独立，需按合并后的时间顺序重建全文
+                self.log(f"Deepgram 多声道: 已合并 {len(channel_word_lists)} 个声道，共 {len(parsed_words)} 个词。")
             if not full_text and parsed_words:
                 full_text = " ".join(word.text for word in parsed_words)
-            language = data["results"]["channels"][0].get("detected_language")
             return ParsedTranscription(words=parsed_words, full_text=full_text, language_code=language)
         except (KeyError, IndexError) as e:
             self.log(f"错误: 解析 Deepgram JSON 时键或索引错误: {e}")
             return None
 
+    def _parse_deepgram_channel_words(self, words_list: list, channel_index: Optional[int]) -> List[TimestampedWord]:
+        """解析单个 Deepgram 声道的词列表；channel_index 不为 None 时把声道编号写入发言人标记。"""
+        parsed_words: List[TimestampedWord] = []
+        self._begin_word_scan(len(words_list))
+        for word_info in words_list:
+            text = word_info.get("word", word_info.get("punctuated_word")) # 优先使用 "punctuated_word"
+            start = word_info.get("start")
+            end = word_info.get("end")
+            speaker = word_info.get("speaker")
+            if channel_index is None:
+                speaker_tag = str(speaker) if speaker else None
+            else:
+                speaker_tag = f"ch{channel_index}" if speaker is None else f"ch{channel_index}:{speaker}"
+            if text is not None and start is not None and end is not None:
+                try:
+                    parsed_words.append(TimestampedWord(str(text), float(start), float(end), speaker_tag))
+                except (ValueError, TypeError):
+                    self._record_skipped_word(SKIP_REASON_INVALID_TIMESTAMP, word_info)
+            else:
+                self._record_skipped_word(SKIP_REASON_INCOMPLETE, word_info)
+        # 堆合并要求每路输入有序，个别乱序的声道先做一次稳定排序
+        if channel_index is not None and any(parsed_words[i].start_time > parsed_words[i + 1].start_time for i in range(len(parsed_words) - 1)):
+            parsed_words.sort(key=lambda word: word.start_time)
+        return parsed_words
+
     def _parse_assemblyai(self, data: dict) -> Optional[ParsedTranscription]:
         """解析 AssemblyAI 格式的JSON。"""
         parsed_words: List[TimestampedWord] = []
@@ -161,6 +353,7 @@ class TranscriptionParser:
             self.log("错误: AssemblyAI JSON 既无有效词列表也无顶层文本。")
             return None
 
+        self._begin_word_scan(len(assemblyai_words_list))
         for word_info in assemblyai_words_list:
             text = word_info.get("text")
             start_ms = word_info.get("start")
@@ -170,10 +363,10 @@ class TranscriptionParser:
             if text is not None and start_ms is not None and end_ms is not None:
                 try:
                     parsed_words.append(TimestampedWord(str(text), float(start_ms)/1000.0, float(end_ms)/1000.0, str(speaker) if speaker else None))
-                except ValueError:
-                    self.log(f"警告: 跳过 AssemblyAI 词条，时间戳或ID格式无效: {word_info}")
+                except (ValueError, TypeError):
+                    self._record_skipped_word(SKIP_REASON_INVALID_TIMESTAMP, word_info)
             else:
-                self.log(f"警告: 跳过不完整的 AssemblyAI 词条: {word_info}")
+                self._record_skipped_word(SKIP_REASON_INCOMPLETE, word_info)
         full_text = data.get("text", "")
         if not full_text and parsed_words:
             full_text = " ".join(word.text for word in parsed_words)
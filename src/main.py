@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtGui import QIcon
@@ -9,6 +10,7 @@ from utils.file_utils import resource_path, setup_faulthandler
 from ui.main_window import HealJimakuApp
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 打包后的程序启动进程池子进程时需要
     setup_faulthandler()
     app = QApplication(sys.argv)
 
@@ -1,20 +1,29 @@
 import os
-import json
+import queue
+import threading
 import traceback
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List
 
 from PyQt6.QtCore import QObject, pyqtSignal
 
 from core.transcription_parser import TranscriptionParser
 from core.srt_processor import SrtProcessor
-from core.llm_api import call_llm_api_for_segmentation
+from core.llm_api import call_llm_api_for_segmentation, call_llm_api_for_boundary_offsets, LlmJobOptions, abort_llm_requests
+from core.rule_segmenter import segment_with_rules
+from core.language_resolver import map_asr_language_code
+from core.llm_telemetry import begin_job_telemetry, end_job_telemetry, TELEMETRY_FILE_SUFFIX
 from core.data_models import ParsedTranscription
 from core.elevenlabs_api import ElevenLabsSTTClient
+from utils import json_utils
 from config import (
     USER_LLM_API_KEY_KEY, DEFAULT_LLM_API_KEY,
     USER_LLM_API_BASE_URL_KEY, DEFAULT_LLM_API_BASE_URL,
     USER_LLM_MODEL_NAME_KEY, DEFAULT_LLM_MODEL_NAME,
-    USER_LLM_TEMPERATURE_KEY, DEFAULT_LLM_TEMPERATURE
+    USER_LLM_TEMPERATURE_KEY, DEFAULT_LLM_TEMPERATURE,
+    USER_PARSER_STRICT_MODE_KEY, DEFAULT_PARSER_STRICT_MODE,
+    USER_PARSER_MAX_ERROR_RATE_KEY, DEFAULT_PARSER_MAX_ERROR_RATE,
+    DEFAULT_FREE_TRANSCRIPTION_PRETTY_JSON,
+    USER_SEGMENTATION_MODE_KEY, DEFAULT_SEGMENTATION_MODE
 )
 
 class WorkerSignals(QObject):
@@ -24,6 +33,46 @@ class WorkerSignals(QObject):
     free_transcription_json_generated = pyqtSignal(str)
 
 
+class AlignmentPipeline:
+    """
+    LLM 分块请求与 SRT 对齐之间的生产者/消费者流水线。
+    call_llm_api_for_segmentation 按块顺序通过 submit 送入片段，消费者线程立即用同一个 SegmentAligner 对齐，
+    词游标跨块保持；close 等待队列中的片段全部对齐后返回对齐器，由调用方执行合并与格式化。
+    """
+    def __init__(self, srt_processor: SrtProcessor, parsed_transcription: ParsedTranscription):
+        self.aligner = srt_processor.create_aligner(parsed_transcription)
+        self._queue: "queue.Queue[Optional[List[str]]]" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._abandoned = False
+        self._thread = threading.Thread(target=self._consume, name="srt-align-pipeline", daemon=True)
+        self._thread.start()
+
+    def submit(self, segments: List[str]):
+        self._queue.put(list(segments))
+
+    def _consume(self):
+        while True:
+            segments = self._queue.get()
+            if segments is None: return
+            if self._abandoned or self.aligner is None or self._error is not None: continue
+            try:
+                if not self.aligner.align(segments): self.aligner = None # 任务已取消，丢弃其余片段
+            except Exception as e:
+                self._error = e
+
+    def close(self):
+        """送入结束标记并等待消费者线程处理完毕；对齐中出现的异常在此重新抛出。"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None: raise self._error
+        return self.aligner
+
+    def abandon(self):
+        """LLM 请求失败、抛出异常或任务取消时调用: 丢弃尚未对齐的片段并让消费者线程退出，不等待对齐结果。"""
+        self._abandoned = True
+        self._queue.put(None)
+
+
 class ConversionWorker(QObject):
     def __init__(self,
                  input_json_path: str,
@@ -34,6 +83,7 @@ class ConversionWorker(QObject):
                  free_transcription_params: Optional[Dict[str, Any]],
                  elevenlabs_stt_client: ElevenLabsSTTClient,
                  llm_config: Dict[str, Any], # 包含LLM配置的字典
+                 parser_options: Optional[Dict[str, Any]] = None, # JSON解析诊断选项
                  parent: Optional[QObject] = None):
         super().__init__(parent)
         self.signals = WorkerSignals()
@@ -58,7 +108,12 @@ class ConversionWorker(QObject):
             self.elevenlabs_stt_client._signals = self.signals
 
 
-        self.transcription_parser = TranscriptionParser(signals_forwarder=self.signals)
+        parser_options = parser_options or {}
+        self.transcription_parser = TranscriptionParser(
+            signals_forwarder=self.signals,
+            strict_mode=bool(parser_options.get(USER_PARSER_STRICT_MODE_KEY, DEFAULT_PARSER_STRICT_MODE)),
+            max_error_rate=float(parser_options.get(USER_PARSER_MAX_ERROR_RATE_KEY, DEFAULT_PARSER_MAX_ERROR_RATE))
+        )
         self.is_running = True
 
     def stop(self):
@@ -66,8 +121,12 @@ class ConversionWorker(QObject):
         self.signals.log_message.emit("接收到停止信号，尝试优雅停止任务...")
         if self.elevenlabs_stt_client and hasattr(self.elevenlabs_stt_client, 'stop_current_task'):
             self.elevenlabs_stt_client.stop_current_task()
+        aborted = abort_llm_requests() # 正在等待响应的LLM请求立即返回，不必等到读超时
+        if aborted:
+            self.signals.log_message.emit(f"已中断 {aborted} 个进行中的LLM请求连接。")
 
     def run(self):
+        llm_telemetry = None # 本次任务的LLM请求遥测 (规则分割时不创建)
         try:
             generated_json_path = self.input_json_path
             actual_source_format = self.source_format
@@ -109,8 +168,8 @@ class ConversionWorker(QObject):
                 base_name = os.path.splitext(os.path.basename(audio_path))[0]
                 generated_json_path = os.path.join(self.output_dir, f"{base_name}_elevenlabs_transcript.json")
                 try:
-                    with open(generated_json_path, "w", encoding="utf-8") as f_json:
-                        json.dump(transcription_data, f_json, ensure_ascii=False, indent=4)
+                    pretty_json = bool(self.free_transcription_params.get("pretty_json", DEFAULT_FREE_TRANSCRIPTION_PRETTY_JSON))
+                    json_utils.dump_file(transcription_data, generated_json_path, pretty=pretty_json)
                     self.signals.log_message.emit(f"ElevenLabs转录结果已保存到: {generated_json_path}")
                     self.signals.free_transcription_json_generated.emit(generated_json_path)
                 except IOError as e:
@@ -125,16 +184,38 @@ class ConversionWorker(QObject):
             
             if not self.is_running: self.signals.finished.emit("任务在加载/生成JSON前被取消。", False); return
 
+            # 只读取文件头嗅探格式，选错格式时无需等完整解析失败才发现
+            fallback_source_format: Optional[str] = None
+            if self.input_mode == "local_json":
+                sniffed_format = self.transcription_parser.sniff_file_format(generated_json_path)
+                if actual_source_format == "auto":
+                    if sniffed_format:
+                        self.signals.log_message.emit(f"根据文件头自动识别JSON格式为: {sniffed_format}")
+                        actual_source_format = sniffed_format
+                    else:
+                        self.signals.log_message.emit("文件头不足以识别JSON格式，将在加载后根据完整结构识别。")
+                elif sniffed_format and sniffed_format != actual_source_format:
+                    # 用户明确选择的格式优先，嗅探结果只在所选格式解析不出任何词时作为后备
+                    self.signals.log_message.emit(f"警告: 所选格式 '{actual_source_format}' 与文件头识别结果 '{sniffed_format}' 不一致，仍按所选格式解析。")
+                    fallback_source_format = sniffed_format
+
             self.signals.log_message.emit(f"开始解析JSON文件 '{os.path.basename(generated_json_path)}', 格式 '{actual_source_format}'")
             try:
-                with open(generated_json_path, "r", encoding="utf-8") as f: raw_api_data = json.load(f)
+                raw_api_data = json_utils.load_file(generated_json_path)
             except FileNotFoundError:
                 self.signals.finished.emit(f"错误：无法找到输入JSON文件 '{generated_json_path}'。", False); return
-            except json.JSONDecodeError as e:
+            except json_utils.JSONDecodeError as e:
                 self.signals.finished.emit(f"错误：解析JSON文件 '{generated_json_path}' 失败: {e}", False); return
             
             parsed_transcription_data: Optional[ParsedTranscription] = self.transcription_parser.parse(raw_api_data, actual_source_format)
+            if fallback_source_format and (parsed_transcription_data is None or not parsed_transcription_data.words):
+                self.signals.log_message.emit(f"按所选格式 '{actual_source_format}' 未解析出任何词，改用文件头识别的格式 '{fallback_source_format}' 重试。")
+                fallback_data = self.transcription_parser.parse(raw_api_data, fallback_source_format)
+                if fallback_data is not None and fallback_data.words:
+                    parsed_transcription_data, actual_source_format = fallback_data, fallback_source_format
             if parsed_transcription_data is None:
+                if actual_source_format == "auto":
+                    self.signals.finished.emit("JSON 解析失败 (无法识别来源格式)。", False); return
                 self.signals.finished.emit(f"JSON 解析失败 ({actual_source_format} 格式)。", False); return
             
             if self.input_mode == "local_json":
@@ -158,19 +239,14 @@ class ConversionWorker(QObject):
                     llm_target_language_for_api = lang_code_from_dialog
                     self.signals.log_message.emit(f"LLM处理将优先使用对话框指定的语言: {llm_target_language_for_api}")
             
-            if not llm_target_language_for_api and parsed_transcription_data and \
-               parsed_transcription_data.language_code:
-                asr_lang_code = parsed_transcription_data.language_code.lower()
-                mapped_lang = None
-                if asr_lang_code.startswith('zh'): mapped_lang = 'zh'
-                elif asr_lang_code == 'ja' or asr_lang_code == 'jpn': mapped_lang = 'ja'
-                elif asr_lang_code == 'en' or asr_lang_code.startswith('en-') or asr_lang_code == 'eng': mapped_lang = 'en'
-                
+            # ASR 返回的语言代码单独传给 LLM 接口，由语言解析器排在用户指定语言之后、文本检测之前使用
+            asr_language_code: Optional[str] = parsed_transcription_data.language_code if parsed_transcription_data else None
+            if not llm_target_language_for_api and asr_language_code:
+                mapped_lang = map_asr_language_code(asr_language_code)
                 if mapped_lang:
-                    llm_target_language_for_api = mapped_lang
-                    self.signals.log_message.emit(f"LLM处理将使用ASR检测到的语言: {llm_target_language_for_api} (原始ASR代码: '{asr_lang_code}')")
+                    self.signals.log_message.emit(f"LLM处理将使用ASR检测到的语言: {mapped_lang} (原始ASR代码: '{asr_language_code}')")
                 else:
-                    self.signals.log_message.emit(f"ASR语言代码 '{asr_lang_code}' 未能映射到目标语言 (中/日/英)，LLM将进行自动语言检测。")
+                    self.signals.log_message.emit(f"ASR语言代码 '{asr_language_code}' 未能映射到目标语言 (中/日/英)，LLM将进行自动语言检测。")
             elif not llm_target_language_for_api:
                  self.signals.log_message.emit(f"未从对话框或ASR结果中获得明确语言指示，LLM将进行自动语言检测。")
 
@@ -179,26 +255,70 @@ class ConversionWorker(QObject):
             llm_base_url_str = self.llm_config.get(USER_LLM_API_BASE_URL_KEY, DEFAULT_LLM_API_BASE_URL)
             llm_model_name = self.llm_config.get(USER_LLM_MODEL_NAME_KEY, DEFAULT_LLM_MODEL_NAME)
             llm_temperature = self.llm_config.get(USER_LLM_TEMPERATURE_KEY, DEFAULT_LLM_TEMPERATURE)
+            llm_job_options = LlmJobOptions.from_config(self.llm_config)
+            segmentation_mode = self.llm_config.get(USER_SEGMENTATION_MODE_KEY, DEFAULT_SEGMENTATION_MODE)
             # --- 获取结束 ---
+            if segmentation_mode != "rules": llm_telemetry = begin_job_telemetry()
 
-            self.signals.log_message.emit(f"调用LLM API进行文本分割 (URL配置: '{llm_base_url_str}', 模型: '{llm_model_name}', 温度: {llm_temperature})...")
-            llm_segments = call_llm_api_for_segmentation(
-                api_key=llm_api_key,
-                text_to_segment=text_to_segment,
-                custom_api_base_url_str=llm_base_url_str,
-                custom_model_name=llm_model_name,
-                custom_temperature=llm_temperature,
-                signals_forwarder=self.signals, # 传递信号转发器
-                target_language=llm_target_language_for_api
-            ) 
-            if not self.is_running : self.signals.finished.emit("任务在LLM API调用期间被取消。", False); return
-            if llm_segments is None: self.signals.finished.emit("LLM API 调用失败或返回空。", False); return
+            llm_segments = None
+            word_ranges = None # 断点索引模式的结果: 每个片段在 words 中的 [起, 止) 区间
+            if segmentation_mode == "rules":
+                self.signals.log_message.emit("使用本地规则分割文本 (不调用LLM API)...")
+                llm_segments = segment_with_rules(text_to_segment, llm_target_language_for_api or map_asr_language_code(asr_language_code), self.signals)
+                if not llm_segments: self.signals.finished.emit("本地规则分割未得到任何片段。", False); return
+            elif segmentation_mode == "llm_offsets" and parsed_transcription_data.words:
+                self.signals.log_message.emit(f"调用LLM API获取断点索引 (URL配置: '{llm_base_url_str}', 模型: '{llm_model_name}', 温度: {llm_temperature})...")
+                word_ranges = call_llm_api_for_boundary_offsets(
+                    api_key=llm_api_key,
+                    words=parsed_transcription_data.words,
+                    custom_api_base_url_str=llm_base_url_str,
+                    custom_model_name=llm_model_name,
+                    custom_temperature=llm_temperature,
+                    signals_forwarder=self.signals,
+                    target_language=llm_target_language_for_api,
+                    job_options=llm_job_options,
+                    asr_language_code=asr_language_code
+                )
+                if not self.is_running : self.signals.finished.emit("任务在LLM API调用期间被取消。", False); return
+                if not word_ranges:
+                    self.signals.log_message.emit("断点索引模式未得到有效结果，退回文本分割模式。")
+                    word_ranges = None
+            pipelined_aligner = None # 流水线模式下已在LLM请求期间完成对齐的对齐器
+            if segmentation_mode != "rules" and word_ranges is None:
+                self.signals.log_message.emit(f"调用LLM API进行文本分割 (URL配置: '{llm_base_url_str}', 模型: '{llm_model_name}', 温度: {llm_temperature})...")
+                alignment_pipeline = None
+                if llm_job_options.pipeline_alignment and self.srt_processor:
+                    alignment_pipeline = AlignmentPipeline(self.srt_processor, parsed_transcription_data)
+                    self.signals.log_message.emit("已启用边请求边对齐: 已返回的文本块将在后台线程中按顺序对齐。")
+                try:
+                    llm_segments = call_llm_api_for_segmentation(
+                        api_key=llm_api_key,
+                        text_to_segment=text_to_segment,
+                        custom_api_base_url_str=llm_base_url_str,
+                        custom_model_name=llm_model_name,
+                        custom_temperature=llm_temperature,
+                        signals_forwarder=self.signals, # 传递信号转发器
+                        target_language=llm_target_language_for_api,
+                        job_options=llm_job_options,
+                        on_chunk_segments=alignment_pipeline.submit if alignment_pipeline else None,
+                        asr_language_code=asr_language_code
+                    )
+                    if alignment_pipeline and llm_segments is not None and self.is_running:
+                        pipelined_aligner = alignment_pipeline.close()
+                finally:
+                    # 请求失败、抛出异常或任务取消时不再等待对齐，结束消费者线程
+                    if alignment_pipeline and pipelined_aligner is None: alignment_pipeline.abandon()
+                if not self.is_running : self.signals.finished.emit("任务在LLM API调用期间被取消。", False); return
+                if llm_segments is None: self.signals.finished.emit("LLM API 调用失败或返回空。", False); return
             
             if self.input_mode == "free_transcription":
                 current_overall_progress = PROGRESS_LLM_COMPLETE_FREE
             else: 
                 current_overall_progress = PROGRESS_LLM_COMPLETE_LOCAL
             self.signals.progress.emit(current_overall_progress)
+            if llm_telemetry:
+                end_job_telemetry(llm_telemetry)
+                self.signals.log_message.emit(f"LLM请求统计: {llm_telemetry.describe()}")
 
             self.signals.log_message.emit("开始使用LLM返回的片段生成 SRT 内容...")
             
@@ -213,9 +333,14 @@ class ConversionWorker(QObject):
                 self.srt_processor._current_progress_offset = srt_progress_offset
                 self.srt_processor._current_progress_range = srt_progress_range
 
-            final_srt = self.srt_processor.process_to_srt(
-                parsed_transcription_data, llm_segments
-            )
+            if word_ranges is not None:
+                final_srt = self.srt_processor.process_word_ranges_to_srt(parsed_transcription_data, word_ranges)
+            elif pipelined_aligner is not None:
+                final_srt = pipelined_aligner.finish()
+            else:
+                final_srt = self.srt_processor.process_to_srt(
+                    parsed_transcription_data, llm_segments
+                )
 
             if not self.is_running: self.signals.finished.emit("任务在SRT生成期间被取消。", False); return
             if final_srt is None: self.signals.finished.emit("SRT 内容生成失败。", False); return
@@ -236,6 +361,13 @@ class ConversionWorker(QObject):
                 self.signals.log_message.emit(f"SRT 文件已成功保存到: {output_srt_filepath}")
             except IOError as e:
                 self.signals.finished.emit(f"保存最终SRT文件失败: {e}", False); return
+            if llm_telemetry and llm_job_options.write_telemetry:
+                telemetry_filepath = os.path.join(self.output_dir, f"{output_base_name}{TELEMETRY_FILE_SUFFIX}")
+                try:
+                    llm_telemetry.write_json(telemetry_filepath)
+                    self.signals.log_message.emit(f"LLM请求统计已保存到: {telemetry_filepath}")
+                except (IOError, TypeError, ValueError) as e:
+                    self.signals.log_message.emit(f"警告: 保存LLM请求统计失败 (不影响SRT): {e}")
 
             if not self.is_running: self.signals.finished.emit(f"文件已保存，但任务随后被取消。", True); return
 
@@ -248,4 +380,5 @@ class ConversionWorker(QObject):
             final_message = f"处理失败: {e}" if self.is_running else f"任务因用户取消而停止，过程中出现异常: {e}"
             self.signals.finished.emit(final_message, False)
         finally:
+            if llm_telemetry: end_job_telemetry(llm_telemetry)
             self.is_running = False
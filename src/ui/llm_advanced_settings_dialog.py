@@ -1,16 +1,16 @@
 import os
-import json
 from typing import Optional, Dict, Any
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
-    QCheckBox, QSlider, QMessageBox, QSpacerItem, QSizePolicy, QApplication, QWidget
+    QCheckBox, QSlider, QMessageBox, QSpacerItem, QSizePolicy, QApplication, QWidget, QComboBox
 )
 from PyQt6.QtCore import Qt, pyqtSignal, QThread, QObject, QPoint
-from PyQt6.QtGui import QIcon, QPixmap, QFont, QColor
+from PyQt6.QtGui import QIcon, QPixmap, QFont, QColor, QIntValidator
 
 import config
 from ui.custom_widgets import CustomLabel
 from utils.file_utils import resource_path
+from utils import json_utils
 
 ICON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "assets", "info_icon.png"))
 
@@ -51,7 +51,7 @@ class LlmAdvancedSettingsDialog(QDialog):
         self.setWindowTitle("LLM高级设置")
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.Dialog)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground, True)
-        self.resize(600, 420) # 调整窗口高度，使其更紧凑
+        self.resize(680, 710) # 调整窗口高度，使其更紧凑
 
         self.current_settings = current_llm_settings if current_llm_settings else self._load_default_llm_settings()
 
@@ -183,6 +183,147 @@ class LlmAdvancedSettingsDialog(QDialog):
         temp_layout.addWidget(self.temp_value_label, 1)
         layout_to_populate.addLayout(temp_layout) # 添加到传入的布局
 
+        # --- 并发请求数滑块 ---
+        concurrency_layout = QHBoxLayout()
+        concurrency_label = CustomLabel("并发请求数:")
+        concurrency_label.setFont(QFont('楷体', 16, QFont.Weight.Bold))
+        concurrency_label.setCustomColors(self.param_label_main_color, self.param_label_stroke_color)
+
+        self.concurrency_slider = QSlider(Qt.Orientation.Horizontal)
+        self.concurrency_slider.setMinimum(1)
+        self.concurrency_slider.setMaximum(config.LLM_MAX_CONCURRENCY_LIMIT)
+        self.concurrency_slider.setSingleStep(1)
+        self.concurrency_slider.setTickInterval(1)
+        self.concurrency_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
+        self.concurrency_slider.setObjectName("dialogSlider")
+        self.concurrency_slider.setToolTip("同时发送给LLM的文本块请求数。设为1时逐块串行发送；服务商限流较严时请调低。")
+
+        self.concurrency_value_label = QLabel(str(config.DEFAULT_LLM_MAX_CONCURRENCY))
+        self.concurrency_value_label.setFont(QFont('Microsoft YaHei', 14))
+        self.concurrency_value_label.setStyleSheet("color: #EAEAEA;")
+
+        concurrency_layout.addWidget(concurrency_label, 3)
+        concurrency_layout.addWidget(self.concurrency_slider, 7)
+        concurrency_layout.addWidget(self.concurrency_value_label, 1)
+        self.adaptive_concurrency_checkbox = QCheckBox("自适应")
+        self.adaptive_concurrency_checkbox.setObjectName("dialogCheckboxFT")
+        self.adaptive_concurrency_checkbox.setToolTip("勾选后滑块的值作为并发上限，实际并发按 AIMD 自动调整:\n请求成功时逐步增加，遇到 429、超时或延迟明显升高时减半。\n并发变化与历史会写入日志。")
+        concurrency_layout.addWidget(self.adaptive_concurrency_checkbox, 2)
+        layout_to_populate.addLayout(concurrency_layout)
+
+        # --- 速率上限 (RPM / TPM) ---
+        rate_limit_layout = QHBoxLayout()
+        rate_limit_label = CustomLabel("速率上限:")
+        rate_limit_label.setFont(QFont('楷体', 16, QFont.Weight.Bold))
+        rate_limit_label.setCustomColors(self.param_label_main_color, self.param_label_stroke_color)
+        rate_limit_tooltip = "每分钟请求数 (RPM) 与每分钟token数 (TPM) 上限，按服务商的限额填写可避免被限流。0 表示不限制。"
+
+        self.rpm_edit = QLineEdit()
+        self.rpm_edit.setObjectName("dialogLineEditFT")
+        self.rpm_edit.setValidator(QIntValidator(0, 1000000, self))
+        self.rpm_edit.setPlaceholderText("RPM (0=不限)")
+        self.rpm_edit.setToolTip(rate_limit_tooltip)
+
+        self.tpm_edit = QLineEdit()
+        self.tpm_edit.setObjectName("dialogLineEditFT")
+        self.tpm_edit.setValidator(QIntValidator(0, 100000000, self))
+        self.tpm_edit.setPlaceholderText("TPM (0=不限)")
+        self.tpm_edit.setToolTip(rate_limit_tooltip)
+
+        rate_limit_layout.addWidget(rate_limit_label, 2)
+        rate_limit_layout.addWidget(self.rpm_edit, 3)
+        rate_limit_layout.addWidget(self.tpm_edit, 3)
+        layout_to_populate.addLayout(rate_limit_layout)
+
+        # --- 模型 token 预算 (上下文窗口 / 输出上限) ---
+        token_budget_layout = QHBoxLayout()
+        token_budget_label = CustomLabel("Token预算:")
+        token_budget_label.setFont(QFont('楷体', 16, QFont.Weight.Bold))
+        token_budget_label.setCustomColors(self.param_label_main_color, self.param_label_stroke_color)
+        token_budget_tooltip = "模型的上下文窗口与单次输出上限 (token)。文本块大小据此按语言自动计算；\n输出被截断的块会自动拆小重试。更换模型时请按其规格填写。"
+
+        self.context_window_edit = QLineEdit()
+        self.context_window_edit.setObjectName("dialogLineEditFT")
+        self.context_window_edit.setValidator(QIntValidator(config.LLM_MIN_CHUNK_TOKENS, 10000000, self))
+        self.context_window_edit.setPlaceholderText("上下文窗口")
+        self.context_window_edit.setToolTip(token_budget_tooltip)
+
+        self.max_output_tokens_edit = QLineEdit()
+        self.max_output_tokens_edit.setObjectName("dialogLineEditFT")
+        self.max_output_tokens_edit.setValidator(QIntValidator(config.LLM_MIN_CHUNK_TOKENS, 1000000, self))
+        self.max_output_tokens_edit.setPlaceholderText("输出上限")
+        self.max_output_tokens_edit.setToolTip(token_budget_tooltip)
+
+        token_budget_layout.addWidget(token_budget_label, 2)
+        token_budget_layout.addWidget(self.context_window_edit, 3)
+        token_budget_layout.addWidget(self.max_output_tokens_edit, 3)
+        layout_to_populate.addLayout(token_budget_layout)
+
+        # --- 摘要策略与摘要模型 ---
+        summary_policy_layout = QHBoxLayout()
+        summary_policy_label = CustomLabel("摘要策略:")
+        summary_policy_label.setFont(QFont('楷体', 16, QFont.Weight.Bold))
+        summary_policy_label.setCustomColors(self.param_label_main_color, self.param_label_stroke_color)
+        self.summary_policy_combo = QComboBox()
+        self.summary_policy_combo.setObjectName("dialogComboBoxFT")
+        for policy_key, policy_name in config.LLM_SUMMARY_POLICIES.items():
+            self.summary_policy_combo.addItem(policy_name, policy_key)
+        self.summary_policy_combo.setToolTip("先摘要后分割: 等待全文摘要完成后再分割 (默认)。\n摘要与分割重叠: 首批文本块不带摘要立即发送。\n单块时跳过摘要: 只有一个文本块时不请求摘要。\n小模型摘要: 用右侧填写的更快模型生成摘要。")
+
+        self.summary_model_edit = QLineEdit()
+        self.summary_model_edit.setObjectName("dialogLineEditFT")
+        self.summary_model_edit.setPlaceholderText("摘要模型 (留空同分割模型)")
+        self.summary_model_edit.setToolTip("仅“小模型摘要”策略使用，与分割请求共用同一API地址。")
+
+        summary_policy_layout.addWidget(summary_policy_label, 2)
+        summary_policy_layout.addWidget(self.summary_policy_combo, 3)
+        summary_policy_layout.addWidget(self.summary_model_edit, 3)
+        layout_to_populate.addLayout(summary_policy_layout)
+
+        # --- 分割方式 (LLM / 本地规则) ---
+        segmentation_mode_layout = QHBoxLayout()
+        segmentation_mode_label = CustomLabel("分割方式:")
+        segmentation_mode_label.setFont(QFont('楷体', 16, QFont.Weight.Bold))
+        segmentation_mode_label.setCustomColors(self.param_label_main_color, self.param_label_stroke_color)
+        self.segmentation_mode_combo = QComboBox()
+        self.segmentation_mode_combo.setObjectName("dialogComboBoxFT")
+        for mode_key, mode_name in config.SEGMENTATION_MODES.items():
+            self.segmentation_mode_combo.addItem(mode_name, mode_key)
+        self.segmentation_mode_combo.setToolTip("本地规则分割按提示词中的括号、引号、语气词与句末标点规则在本机处理，\n不调用API、几乎瞬间完成，适合批量出草稿；语义断句效果不如LLM。\nLLM 断点索引模式只让模型返回断点词的编号，字幕直接按编号取时间戳、无需模糊对齐，\n输出更短；编号无效时自动退回 LLM 智能分割。")
+        segmentation_mode_layout.addWidget(segmentation_mode_label, 2)
+        segmentation_mode_layout.addWidget(self.segmentation_mode_combo, 6)
+        layout_to_populate.addLayout(segmentation_mode_layout)
+
+        # --- 响应缓存与流式响应开关 ---
+        bypass_cache_layout = QHBoxLayout()
+        bypass_cache_layout.addStretch()
+        self.bypass_cache_checkbox = QCheckBox("跳过响应缓存 (强制重新请求LLM)")
+        self.bypass_cache_checkbox.setObjectName("dialogCheckboxFT")
+        self.bypass_cache_checkbox.setToolTip("默认情况下，相同文本块的LLM结果会被缓存，重跑同一文件时直接复用。\n勾选后本次任务将忽略已有缓存并重新请求 (新结果仍会写入缓存)。")
+        bypass_cache_layout.addWidget(self.bypass_cache_checkbox)
+        bypass_cache_layout.addStretch()
+        self.stream_checkbox = QCheckBox("流式响应 (SSE)")
+        self.stream_checkbox.setObjectName("dialogCheckboxFT")
+        self.stream_checkbox.setToolTip("以 stream 模式请求 OpenAI 兼容接口，片段随生成逐行到达，\n无需等待整个文本块生成完毕。不支持流式的服务会自动按普通响应处理。")
+        bypass_cache_layout.addWidget(self.stream_checkbox)
+        bypass_cache_layout.addStretch()
+        self.pipeline_alignment_checkbox = QCheckBox("边请求边对齐")
+        self.pipeline_alignment_checkbox.setObjectName("dialogCheckboxFT")
+        self.pipeline_alignment_checkbox.setToolTip("按原文顺序返回的文本块立即在后台线程中对齐，\n不必等所有块都返回后才开始对齐；生成的字幕与不勾选时相同。")
+        bypass_cache_layout.addWidget(self.pipeline_alignment_checkbox)
+        bypass_cache_layout.addStretch()
+        layout_to_populate.addLayout(bypass_cache_layout)
+
+        # --- 请求统计开关 ---
+        telemetry_layout = QHBoxLayout()
+        telemetry_layout.addStretch()
+        self.write_telemetry_checkbox = QCheckBox("在SRT旁保存LLM请求统计 (JSON)")
+        self.write_telemetry_checkbox.setObjectName("dialogCheckboxFT")
+        self.write_telemetry_checkbox.setToolTip("每个请求的首字节时间、总耗时、token 用量 (含缓存命中)、输出速度、\nHTTP 状态、重试次数与结束原因，连同任务汇总写入 <文件名>.llm_telemetry.json。\n汇总行始终会写入日志。")
+        telemetry_layout.addWidget(self.write_telemetry_checkbox)
+        telemetry_layout.addStretch()
+        layout_to_populate.addLayout(telemetry_layout)
+
         # --- API Key 输入框 ---
         api_key_layout = QHBoxLayout()
         api_key_label = CustomLabel("API Key:")
@@ -349,6 +490,28 @@ class LlmAdvancedSettingsDialog(QDialog):
                 background-position: center;
             }}
 
+            QComboBox#dialogComboBoxFT {{
+                background-color: {input_bg};
+                color: {input_text_color};
+                border: 1px solid {input_border_color};
+                border-radius: 5px;
+                padding: 5px 8px;
+                font-family: 'Microsoft YaHei'; font-size: 12pt;
+            }}
+            QComboBox#dialogComboBoxFT::drop-down {{
+                subcontrol-origin: padding; subcontrol-position: center right;
+                width: 22px;
+                border-left: 1px solid {input_border_color};
+            }}
+            QComboBox#dialogComboBoxFT::down-arrow {{
+                image: {qss_dropdown_arrow if qss_dropdown_arrow else "none"};
+            }}
+            QComboBox#dialogComboBoxFT QAbstractItemView {{
+                background-color: rgba(60, 60, 80, 240);
+                color: {input_text_color};
+                selection-background-color: rgba(100, 149, 237, 170);
+            }}
+
             QPushButton#dialogBrowseButton {{
                 font-size: 12pt;
                 padding: 6px 15px;
@@ -366,17 +529,47 @@ class LlmAdvancedSettingsDialog(QDialog):
         self.reset_button.clicked.connect(self._reset_settings)
         self.test_connection_button.clicked.connect(self._test_connection)
         self.temp_slider.valueChanged.connect(self._update_temp_label)
+        self.summary_policy_combo.currentIndexChanged.connect(self._update_summary_model_enabled)
+        self.concurrency_slider.valueChanged.connect(self._update_concurrency_label)
 
     def _update_temp_label(self, value):
         self.temp_value_label.setText(f"{value / 10.0:.1f}")
 
+    def _update_concurrency_label(self, value):
+        self.concurrency_value_label.setText(str(value))
+
+    def _update_summary_model_enabled(self, _index=None):
+        self.summary_model_edit.setEnabled(self.summary_policy_combo.currentData() == "small_model")
+
+    def _set_segmentation_mode(self, mode: str):
+        mode_index = self.segmentation_mode_combo.findData(mode)
+        self.segmentation_mode_combo.setCurrentIndex(mode_index if mode_index != -1 else self.segmentation_mode_combo.findData(config.DEFAULT_SEGMENTATION_MODE))
+
+    def _set_summary_policy(self, policy: str):
+        policy_index = self.summary_policy_combo.findData(policy)
+        self.summary_policy_combo.setCurrentIndex(policy_index if policy_index != -1 else self.summary_policy_combo.findData(config.DEFAULT_LLM_SUMMARY_POLICY))
+        self._update_summary_model_enabled()
+
     def _load_default_llm_settings(self) -> Dict[str, Any]:
         return {
             config.USER_LLM_API_BASE_URL_KEY: config.DEFAULT_LLM_API_BASE_URL,
             config.USER_LLM_MODEL_NAME_KEY: config.DEFAULT_LLM_MODEL_NAME,
             config.USER_LLM_API_KEY_KEY: config.DEFAULT_LLM_API_KEY,
             config.USER_LLM_REMEMBER_API_KEY_KEY: config.DEFAULT_LLM_REMEMBER_API_KEY,
-            config.USER_LLM_TEMPERATURE_KEY: config.DEFAULT_LLM_TEMPERATURE
+            config.USER_LLM_TEMPERATURE_KEY: config.DEFAULT_LLM_TEMPERATURE,
+            config.USER_LLM_MAX_CONCURRENCY_KEY: config.DEFAULT_LLM_MAX_CONCURRENCY,
+            config.USER_LLM_ADAPTIVE_CONCURRENCY_KEY: config.DEFAULT_LLM_ADAPTIVE_CONCURRENCY,
+            config.USER_LLM_WRITE_TELEMETRY_KEY: config.DEFAULT_LLM_WRITE_TELEMETRY,
+            config.USER_LLM_BYPASS_CACHE_KEY: config.DEFAULT_LLM_BYPASS_CACHE,
+            config.USER_LLM_REQUESTS_PER_MINUTE_KEY: config.DEFAULT_LLM_REQUESTS_PER_MINUTE,
+            config.USER_LLM_TOKENS_PER_MINUTE_KEY: config.DEFAULT_LLM_TOKENS_PER_MINUTE,
+            config.USER_LLM_STREAM_KEY: config.DEFAULT_LLM_STREAM,
+            config.USER_LLM_PIPELINE_ALIGNMENT_KEY: config.DEFAULT_LLM_PIPELINE_ALIGNMENT,
+            config.USER_LLM_CONTEXT_WINDOW_KEY: config.DEFAULT_LLM_CONTEXT_WINDOW,
+            config.USER_LLM_MAX_OUTPUT_TOKENS_KEY: config.DEFAULT_LLM_MAX_OUTPUT_TOKENS,
+            config.USER_LLM_SUMMARY_POLICY_KEY: config.DEFAULT_LLM_SUMMARY_POLICY,
+            config.USER_LLM_SUMMARY_MODEL_KEY: config.DEFAULT_LLM_SUMMARY_MODEL,
+            config.USER_SEGMENTATION_MODE_KEY: config.DEFAULT_SEGMENTATION_MODE
         }
 
     def _load_settings_to_ui(self):
@@ -387,6 +580,22 @@ class LlmAdvancedSettingsDialog(QDialog):
         self.temp_slider.setValue(int(float(temp_value) * 10))
         self._update_temp_label(int(float(temp_value) * 10))
 
+        concurrency_value = int(self.current_settings.get(config.USER_LLM_MAX_CONCURRENCY_KEY, config.DEFAULT_LLM_MAX_CONCURRENCY))
+        self.concurrency_slider.setValue(concurrency_value)
+        self._update_concurrency_label(self.concurrency_slider.value())
+        self.adaptive_concurrency_checkbox.setChecked(bool(self.current_settings.get(config.USER_LLM_ADAPTIVE_CONCURRENCY_KEY, config.DEFAULT_LLM_ADAPTIVE_CONCURRENCY)))
+        self.bypass_cache_checkbox.setChecked(bool(self.current_settings.get(config.USER_LLM_BYPASS_CACHE_KEY, config.DEFAULT_LLM_BYPASS_CACHE)))
+        self.stream_checkbox.setChecked(bool(self.current_settings.get(config.USER_LLM_STREAM_KEY, config.DEFAULT_LLM_STREAM)))
+        self.pipeline_alignment_checkbox.setChecked(bool(self.current_settings.get(config.USER_LLM_PIPELINE_ALIGNMENT_KEY, config.DEFAULT_LLM_PIPELINE_ALIGNMENT)))
+        self.write_telemetry_checkbox.setChecked(bool(self.current_settings.get(config.USER_LLM_WRITE_TELEMETRY_KEY, config.DEFAULT_LLM_WRITE_TELEMETRY)))
+        self.rpm_edit.setText(str(self.current_settings.get(config.USER_LLM_REQUESTS_PER_MINUTE_KEY, config.DEFAULT_LLM_REQUESTS_PER_MINUTE)))
+        self.tpm_edit.setText(str(self.current_settings.get(config.USER_LLM_TOKENS_PER_MINUTE_KEY, config.DEFAULT_LLM_TOKENS_PER_MINUTE)))
+        self.context_window_edit.setText(str(self.current_settings.get(config.USER_LLM_CONTEXT_WINDOW_KEY, config.DEFAULT_LLM_CONTEXT_WINDOW)))
+        self.max_output_tokens_edit.setText(str(self.current_settings.get(config.USER_LLM_MAX_OUTPUT_TOKENS_KEY, config.DEFAULT_LLM_MAX_OUTPUT_TOKENS)))
+        self.summary_model_edit.setText(self.current_settings.get(config.USER_LLM_SUMMARY_MODEL_KEY, config.DEFAULT_LLM_SUMMARY_MODEL))
+        self._set_summary_policy(self.current_settings.get(config.USER_LLM_SUMMARY_POLICY_KEY, config.DEFAULT_LLM_SUMMARY_POLICY))
+        self._set_segmentation_mode(self.current_settings.get(config.USER_SEGMENTATION_MODE_KEY, config.DEFAULT_SEGMENTATION_MODE))
+
         self.api_key_edit.setText(self.current_settings.get(config.USER_LLM_API_KEY_KEY, config.DEFAULT_LLM_API_KEY))
         self.remember_api_key_checkbox.setChecked(self.current_settings.get(config.USER_LLM_REMEMBER_API_KEY_KEY, config.DEFAULT_LLM_REMEMBER_API_KEY))
 
@@ -394,6 +603,19 @@ class LlmAdvancedSettingsDialog(QDialog):
         self.current_settings[config.USER_LLM_API_BASE_URL_KEY] = self.api_url_edit.text().strip()
         self.current_settings[config.USER_LLM_MODEL_NAME_KEY] = self.model_name_edit.text().strip()
         self.current_settings[config.USER_LLM_TEMPERATURE_KEY] = self.temp_slider.value() / 10.0
+        self.current_settings[config.USER_LLM_MAX_CONCURRENCY_KEY] = self.concurrency_slider.value()
+        self.current_settings[config.USER_LLM_ADAPTIVE_CONCURRENCY_KEY] = self.adaptive_concurrency_checkbox.isChecked()
+        self.current_settings[config.USER_LLM_BYPASS_CACHE_KEY] = self.bypass_cache_checkbox.isChecked()
+        self.current_settings[config.USER_LLM_STREAM_KEY] = self.stream_checkbox.isChecked()
+        self.current_settings[config.USER_LLM_PIPELINE_ALIGNMENT_KEY] = self.pipeline_alignment_checkbox.isChecked()
+        self.current_settings[config.USER_LLM_WRITE_TELEMETRY_KEY] = self.write_telemetry_checkbox.isChecked()
+        self.current_settings[config.USER_LLM_REQUESTS_PER_MINUTE_KEY] = int(self.rpm_edit.text() or 0)
+        self.current_settings[config.USER_LLM_TOKENS_PER_MINUTE_KEY] = int(self.tpm_edit.text() or 0)
+        self.current_settings[config.USER_LLM_CONTEXT_WINDOW_KEY] = int(self.context_window_edit.text() or config.DEFAULT_LLM_CONTEXT_WINDOW)
+        self.current_settings[config.USER_LLM_MAX_OUTPUT_TOKENS_KEY] = int(self.max_output_tokens_edit.text() or config.DEFAULT_LLM_MAX_OUTPUT_TOKENS)
+        self.current_settings[config.USER_LLM_SUMMARY_POLICY_KEY] = self.summary_policy_combo.currentData()
+        self.current_settings[config.USER_LLM_SUMMARY_MODEL_KEY] = self.summary_model_edit.text().strip()
+        self.current_settings[config.USER_SEGMENTATION_MODE_KEY] = self.segmentation_mode_combo.currentData()
         
         api_key = self.api_key_edit.text()
         remember_api_key = self.remember_api_key_checkbox.isChecked()
@@ -413,21 +635,32 @@ class LlmAdvancedSettingsDialog(QDialog):
             
             full_config_data = {}
             if os.path.exists(config.CONFIG_FILE):
-                with open(config.CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    full_config_data = json.load(f)
+                full_config_data = json_utils.load_file(config.CONFIG_FILE)
             
             full_config_data[config.USER_LLM_API_BASE_URL_KEY] = self.current_settings[config.USER_LLM_API_BASE_URL_KEY]
             full_config_data[config.USER_LLM_MODEL_NAME_KEY] = self.current_settings[config.USER_LLM_MODEL_NAME_KEY]
             full_config_data[config.USER_LLM_TEMPERATURE_KEY] = self.current_settings[config.USER_LLM_TEMPERATURE_KEY]
             full_config_data[config.USER_LLM_REMEMBER_API_KEY_KEY] = self.current_settings[config.USER_LLM_REMEMBER_API_KEY_KEY]
+            full_config_data[config.USER_LLM_MAX_CONCURRENCY_KEY] = self.current_settings[config.USER_LLM_MAX_CONCURRENCY_KEY]
+            full_config_data[config.USER_LLM_ADAPTIVE_CONCURRENCY_KEY] = self.current_settings[config.USER_LLM_ADAPTIVE_CONCURRENCY_KEY]
+            full_config_data[config.USER_LLM_BYPASS_CACHE_KEY] = self.current_settings[config.USER_LLM_BYPASS_CACHE_KEY]
+            full_config_data[config.USER_LLM_REQUESTS_PER_MINUTE_KEY] = self.current_settings[config.USER_LLM_REQUESTS_PER_MINUTE_KEY]
+            full_config_data[config.USER_LLM_TOKENS_PER_MINUTE_KEY] = self.current_settings[config.USER_LLM_TOKENS_PER_MINUTE_KEY]
+            full_config_data[config.USER_LLM_STREAM_KEY] = self.current_settings[config.USER_LLM_STREAM_KEY]
+            full_config_data[config.USER_LLM_PIPELINE_ALIGNMENT_KEY] = self.current_settings[config.USER_LLM_PIPELINE_ALIGNMENT_KEY]
+            full_config_data[config.USER_LLM_WRITE_TELEMETRY_KEY] = self.current_settings[config.USER_LLM_WRITE_TELEMETRY_KEY]
+            full_config_data[config.USER_LLM_CONTEXT_WINDOW_KEY] = self.current_settings[config.USER_LLM_CONTEXT_WINDOW_KEY]
+            full_config_data[config.USER_LLM_MAX_OUTPUT_TOKENS_KEY] = self.current_settings[config.USER_LLM_MAX_OUTPUT_TOKENS_KEY]
+            full_config_data[config.USER_LLM_SUMMARY_POLICY_KEY] = self.current_settings[config.USER_LLM_SUMMARY_POLICY_KEY]
+            full_config_data[config.USER_LLM_SUMMARY_MODEL_KEY] = self.current_settings[config.USER_LLM_SUMMARY_MODEL_KEY]
+            full_config_data[config.USER_SEGMENTATION_MODE_KEY] = self.current_settings[config.USER_SEGMENTATION_MODE_KEY]
 
             if self.current_settings[config.USER_LLM_REMEMBER_API_KEY_KEY]:
                  full_config_data[config.USER_LLM_API_KEY_KEY] = self.current_settings[config.USER_LLM_API_KEY_KEY]
             elif config.USER_LLM_API_KEY_KEY in full_config_data: 
                 del full_config_data[config.USER_LLM_API_KEY_KEY]
 
-            with open(config.CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(full_config_data, f, indent=4, ensure_ascii=False)
+            json_utils.dump_file(full_config_data, config.CONFIG_FILE, pretty=True)
             
             self.settings_saved.emit() 
             self.accept() 
@@ -444,6 +677,19 @@ class LlmAdvancedSettingsDialog(QDialog):
             self.model_name_edit.setText(config.DEFAULT_LLM_MODEL_NAME)
             self.temp_slider.setValue(int(config.DEFAULT_LLM_TEMPERATURE * 10))
             self._update_temp_label(int(config.DEFAULT_LLM_TEMPERATURE * 10))
+            self.concurrency_slider.setValue(config.DEFAULT_LLM_MAX_CONCURRENCY)
+            self.adaptive_concurrency_checkbox.setChecked(config.DEFAULT_LLM_ADAPTIVE_CONCURRENCY)
+            self.bypass_cache_checkbox.setChecked(config.DEFAULT_LLM_BYPASS_CACHE)
+            self.stream_checkbox.setChecked(config.DEFAULT_LLM_STREAM)
+            self.pipeline_alignment_checkbox.setChecked(config.DEFAULT_LLM_PIPELINE_ALIGNMENT)
+            self.write_telemetry_checkbox.setChecked(config.DEFAULT_LLM_WRITE_TELEMETRY)
+            self.rpm_edit.setText(str(config.DEFAULT_LLM_REQUESTS_PER_MINUTE))
+            self.tpm_edit.setText(str(config.DEFAULT_LLM_TOKENS_PER_MINUTE))
+            self.context_window_edit.setText(str(config.DEFAULT_LLM_CONTEXT_WINDOW))
+            self.max_output_tokens_edit.setText(str(config.DEFAULT_LLM_MAX_OUTPUT_TOKENS))
+            self.summary_model_edit.setText(config.DEFAULT_LLM_SUMMARY_MODEL)
+            self._set_summary_policy(config.DEFAULT_LLM_SUMMARY_POLICY)
+            self._set_segmentation_mode(config.DEFAULT_SEGMENTATION_MODE)
             self.api_key_edit.setText("") 
             self.remember_api_key_checkbox.setChecked(config.DEFAULT_LLM_REMEMBER_API_KEY)
             QMessageBox.information(self, "已重置", "LLM高级设置已恢复为默认值。请点击“确认”保存更改，或“取消”放弃。")
@@ -1,5 +1,4 @@
 import os
-import json
 from typing import Optional, Any, Dict
 
 from PyQt6.QtWidgets import (
@@ -25,13 +24,18 @@ from config import (
     DEFAULT_FREE_TRANSCRIPTION_LANGUAGE,
     DEFAULT_FREE_TRANSCRIPTION_NUM_SPEAKERS,
     DEFAULT_FREE_TRANSCRIPTION_TAG_AUDIO_EVENTS,
+    USER_FREE_TRANSCRIPTION_PRETTY_JSON_KEY, DEFAULT_FREE_TRANSCRIPTION_PRETTY_JSON,
     USER_LLM_API_BASE_URL_KEY, USER_LLM_MODEL_NAME_KEY,
     USER_LLM_API_KEY_KEY, USER_LLM_REMEMBER_API_KEY_KEY, USER_LLM_TEMPERATURE_KEY,
     DEFAULT_LLM_API_BASE_URL, DEFAULT_LLM_MODEL_NAME,
-    DEFAULT_LLM_API_KEY, DEFAULT_LLM_REMEMBER_API_KEY, DEFAULT_LLM_TEMPERATURE
+    DEFAULT_LLM_API_KEY, DEFAULT_LLM_REMEMBER_API_KEY, DEFAULT_LLM_TEMPERATURE,
+    LLM_JOB_OPTION_DEFAULTS,
+    USER_PARSER_STRICT_MODE_KEY, USER_PARSER_MAX_ERROR_RATE_KEY,
+    DEFAULT_PARSER_STRICT_MODE, DEFAULT_PARSER_MAX_ERROR_RATE
 )
 
 from utils.file_utils import resource_path
+from utils import json_utils
 from .custom_widgets import TransparentWidget, CustomLabel, CustomLabel_title
 from .conversion_worker import ConversionWorker
 from core.srt_processor import SrtProcessor
@@ -217,7 +221,7 @@ class HealJimakuApp(QMainWindow):
                 self.free_transcription_button.style().polish(self.free_transcription_button)
                 self._free_transcription_button_is_in_cancel_mode = False
             
-            last_format = self.config.get('last_source_format', 'ElevenLabs(推荐)')
+            last_format = self.config.get('last_source_format', '自动检测')
             last_format_index = self.json_format_combo.findText(last_format)
             if last_format_index != -1:
                  self.json_format_combo.setCurrentIndex(last_format_index)
@@ -353,7 +357,7 @@ class HealJimakuApp(QMainWindow):
         format_label = CustomLabel("JSON 格式:")
         format_label.setFont(QFont('楷体', 13, QFont.Weight.Bold))
         self.json_format_combo = QComboBox()
-        self.json_format_combo.addItems(["ElevenLabs(推荐)", "Whisper(推荐)", "Deepgram", "AssemblyAI"])
+        self.json_format_combo.addItems(["自动检测", "ElevenLabs(推荐)", "Whisper(推荐)", "Deepgram", "AssemblyAI"])
         self.json_format_combo.setObjectName("formatCombo")
         format_layout.addWidget(format_label,1)
         format_layout.addWidget(self.json_format_combo,5)
@@ -552,7 +556,7 @@ class HealJimakuApp(QMainWindow):
             'remember_api_key': True,
             'last_json_path': '',
             'last_output_path': '',
-            'last_source_format': 'ElevenLabs(推荐)',
+            'last_source_format': '自动检测',
             'last_input_mode': 'local_json', # Default initial mode
             'last_free_transcription_audio_path': None,
             USER_MIN_DURATION_TARGET_KEY: DEFAULT_MIN_DURATION_TARGET,
@@ -567,12 +571,15 @@ class HealJimakuApp(QMainWindow):
             USER_LLM_API_KEY_KEY: DEFAULT_LLM_API_KEY,
             USER_LLM_REMEMBER_API_KEY_KEY: DEFAULT_LLM_REMEMBER_API_KEY,
             USER_LLM_TEMPERATURE_KEY: DEFAULT_LLM_TEMPERATURE,
+            **LLM_JOB_OPTION_DEFAULTS,
+            USER_FREE_TRANSCRIPTION_PRETTY_JSON_KEY: DEFAULT_FREE_TRANSCRIPTION_PRETTY_JSON,
+            USER_PARSER_STRICT_MODE_KEY: DEFAULT_PARSER_STRICT_MODE,
+            USER_PARSER_MAX_ERROR_RATE_KEY: DEFAULT_PARSER_MAX_ERROR_RATE,
         }
 
         try:
             if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    loaded_config = json.load(f)
+                loaded_config = json_utils.load_file(CONFIG_FILE)
                 self.config = default_cfg_structure.copy()
                 self.config.update(loaded_config)
             else:
@@ -610,6 +617,7 @@ class HealJimakuApp(QMainWindow):
                 USER_LLM_API_KEY_KEY: self.config.get(USER_LLM_API_KEY_KEY, DEFAULT_LLM_API_KEY),
                 USER_LLM_REMEMBER_API_KEY_KEY: self.config.get(USER_LLM_REMEMBER_API_KEY_KEY, DEFAULT_LLM_REMEMBER_API_KEY),
                 USER_LLM_TEMPERATURE_KEY: self.config.get(USER_LLM_TEMPERATURE_KEY, DEFAULT_LLM_TEMPERATURE),
+                **{key: self.config.get(key, default) for key, default in LLM_JOB_OPTION_DEFAULTS.items()},
             }
 
             # --- 修改点 开始 ---
@@ -631,7 +639,7 @@ class HealJimakuApp(QMainWindow):
                 # self._update_input_mode_ui() 会处理这个
             
             if self.json_format_combo:
-                format_index = self.json_format_combo.findText(self.config.get('last_source_format', 'ElevenLabs(推荐)'))
+                format_index = self.json_format_combo.findText(self.config.get('last_source_format', '自动检测'))
                 self.json_format_combo.setCurrentIndex(format_index if format_index != -1 else 0)
             
             if self.output_path_entry:
@@ -645,7 +653,7 @@ class HealJimakuApp(QMainWindow):
 
             self._update_input_mode_ui() # 这将确保按钮基于强制的 'local_json' 模式正确更新
 
-        except (json.JSONDecodeError, Exception) as e:
+        except (json_utils.JSONDecodeError, Exception) as e:
              self.log_message(f"加载配置出错或配置格式错误: {e}")
              self.config = default_cfg_structure.copy()
              self.advanced_srt_settings = {
@@ -660,6 +668,7 @@ class HealJimakuApp(QMainWindow):
                 USER_LLM_API_BASE_URL_KEY: DEFAULT_LLM_API_BASE_URL, USER_LLM_MODEL_NAME_KEY: DEFAULT_LLM_MODEL_NAME,
                 USER_LLM_API_KEY_KEY: DEFAULT_LLM_API_KEY, USER_LLM_REMEMBER_API_KEY_KEY: DEFAULT_LLM_REMEMBER_API_KEY,
                 USER_LLM_TEMPERATURE_KEY: DEFAULT_LLM_TEMPERATURE,
+                **LLM_JOB_OPTION_DEFAULTS,
              }
              # 确保在异常情况下也重置为 local_json 模式
              self._current_input_mode = 'local_json'
@@ -694,6 +703,8 @@ class HealJimakuApp(QMainWindow):
         self.config[USER_LLM_API_BASE_URL_KEY] = self.llm_advanced_settings.get(USER_LLM_API_BASE_URL_KEY, DEFAULT_LLM_API_BASE_URL)
         self.config[USER_LLM_MODEL_NAME_KEY] = self.llm_advanced_settings.get(USER_LLM_MODEL_NAME_KEY, DEFAULT_LLM_MODEL_NAME)
         self.config[USER_LLM_TEMPERATURE_KEY] = self.llm_advanced_settings.get(USER_LLM_TEMPERATURE_KEY, DEFAULT_LLM_TEMPERATURE)
+        for key, default in LLM_JOB_OPTION_DEFAULTS.items():
+            self.config[key] = self.llm_advanced_settings.get(key, self.config.get(key, default))
 
         if self._current_input_mode == 'local_json':
             self.config['last_json_path'] = self.json_path_entry.text()
@@ -710,8 +721,7 @@ class HealJimakuApp(QMainWindow):
             del self.config['remember_api_key']
 
         try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=4, ensure_ascii=False)
+            json_utils.dump_file(self.config, CONFIG_FILE, pretty=True)
         except Exception as e:
             self.log_message(f"保存配置失败: {e}")
 
@@ -765,6 +775,7 @@ class HealJimakuApp(QMainWindow):
             USER_LLM_API_KEY_KEY: self.config.get(USER_LLM_API_KEY_KEY, DEFAULT_LLM_API_KEY),
             USER_LLM_REMEMBER_API_KEY_KEY: self.config.get(USER_LLM_REMEMBER_API_KEY_KEY, DEFAULT_LLM_REMEMBER_API_KEY),
             USER_LLM_TEMPERATURE_KEY: self.config.get(USER_LLM_TEMPERATURE_KEY, DEFAULT_LLM_TEMPERATURE),
+            **{key: self.config.get(key, default) for key, default in LLM_JOB_OPTION_DEFAULTS.items()},
         }
 
         if not self.llm_advanced_settings_dialog_instance:
@@ -786,6 +797,8 @@ class HealJimakuApp(QMainWindow):
             self.config[USER_LLM_MODEL_NAME_KEY] = updated_settings_from_dialog.get(USER_LLM_MODEL_NAME_KEY)
             self.config[USER_LLM_TEMPERATURE_KEY] = updated_settings_from_dialog.get(USER_LLM_TEMPERATURE_KEY)
             self.config[USER_LLM_REMEMBER_API_KEY_KEY] = updated_settings_from_dialog.get(USER_LLM_REMEMBER_API_KEY_KEY)
+            for key, default in LLM_JOB_OPTION_DEFAULTS.items():
+                self.config[key] = updated_settings_from_dialog.get(key, self.config.get(key, default))
             
             api_key_from_dialog = updated_settings_from_dialog.get(USER_LLM_API_KEY_KEY, "")
             if self.config[USER_LLM_REMEMBER_API_KEY_KEY]:
@@ -892,7 +905,8 @@ class HealJimakuApp(QMainWindow):
         
         output_dir = self.output_path_entry.text().strip()
 
-        if not effective_api_key:
+        uses_llm = self.config.get(app_config.USER_SEGMENTATION_MODE_KEY, app_config.DEFAULT_SEGMENTATION_MODE) != "rules"
+        if not effective_api_key and uses_llm:
             QMessageBox.warning(self, "缺少信息", "请在API设置或LLM高级设置中配置 API Key。"); return
         if not output_dir:
             QMessageBox.warning(self, "缺少信息", "请选择导出目录。"); return
@@ -916,8 +930,8 @@ class HealJimakuApp(QMainWindow):
                 QMessageBox.critical(self, "错误", f"JSON 文件不存在: {json_path_for_worker}"); return
             
             selected_format_text = self.json_format_combo.currentText()
-            source_format_map = {"ElevenLabs(推荐)":"elevenlabs", "Whisper(推荐)":"whisper", "Deepgram":"deepgram", "AssemblyAI":"assemblyai"}
-            source_format_key = source_format_map.get(selected_format_text, "elevenlabs")
+            source_format_map = {"自动检测":"auto", "ElevenLabs(推荐)":"elevenlabs", "Whisper(推荐)":"whisper", "Deepgram":"deepgram", "AssemblyAI":"assemblyai"}
+            source_format_key = source_format_map.get(selected_format_text, "auto")
         else:
             QMessageBox.critical(self, "内部错误", "未知的输入模式。"); return
 
@@ -928,6 +942,11 @@ class HealJimakuApp(QMainWindow):
             app_config.USER_LLM_API_BASE_URL_KEY: llm_base_url,
             app_config.USER_LLM_MODEL_NAME_KEY: llm_model_name,
             app_config.USER_LLM_TEMPERATURE_KEY: llm_temperature,
+            **{key: self.config.get(key, default) for key, default in LLM_JOB_OPTION_DEFAULTS.items()},
+        }
+        parser_options_for_worker = {
+            USER_PARSER_STRICT_MODE_KEY: self.config.get(USER_PARSER_STRICT_MODE_KEY, DEFAULT_PARSER_STRICT_MODE),
+            USER_PARSER_MAX_ERROR_RATE_KEY: self.config.get(USER_PARSER_MAX_ERROR_RATE_KEY, DEFAULT_PARSER_MAX_ERROR_RATE),
         }
 
         self.save_config()
@@ -949,6 +968,7 @@ class HealJimakuApp(QMainWindow):
         if self._current_input_mode == "free_transcription":
             free_transcription_params_for_worker = {
                 "audio_file_path": self._temp_audio_file_for_free_transcription,
+                "pretty_json": self.config.get(USER_FREE_TRANSCRIPTION_PRETTY_JSON_KEY, DEFAULT_FREE_TRANSCRIPTION_PRETTY_JSON),
                 **self.free_transcription_settings
             }
 
@@ -961,7 +981,8 @@ class HealJimakuApp(QMainWindow):
             input_mode=self._current_input_mode, 
             free_transcription_params=free_transcription_params_for_worker, 
             elevenlabs_stt_client=self.elevenlabs_stt_client,
-            llm_config=current_llm_config_for_worker
+            llm_config=current_llm_config_for_worker,
+            parser_options=parser_options_for_worker
         )
         self.worker.moveToThread(self.conversion_thread)
         
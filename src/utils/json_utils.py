@@ -0,0 +1,69 @@
+import json
+from typing import Any
+
+# --- JSON 读写门面 ---
+# 安装了 orjson 时使用其编译实现加速解析与序列化，否则回退到标准库 json。
+try:
+    import orjson # type: ignore
+    _ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None # type: ignore
+    _ORJSON_AVAILABLE = False
+
+# 统一对外暴露的解析异常类型 (orjson.JSONDecodeError 是 json.JSONDecodeError 的子类)
+JSONDecodeError = json.JSONDecodeError
+
+PRETTY_INDENT = 2
+
+
+def backend_name() -> str:
+    """返回当前使用的 JSON 后端名称。"""
+    return "orjson" if _ORJSON_AVAILABLE else "json"
+
+
+def loads(data: Any) -> Any:
+    """解析 JSON 字符串或字节串。"""
+    if _ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = bytes(data).decode("utf-8-sig")
+        except UnicodeDecodeError as e: # 与 orjson 一致，非法 UTF-8 同样以 JSONDecodeError 报告
+            raise JSONDecodeError(f"无效的 UTF-8 字节 ({e.reason})", bytes(data).decode("utf-8", "replace"), e.start) from e
+    return json.loads(data)
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """序列化为 JSON 字符串 (保留非 ASCII 字符)。默认紧凑格式，pretty=True 时缩进输出。"""
+    return dumps_bytes(obj, pretty=pretty).decode("utf-8")
+
+
+def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+    """序列化为 UTF-8 编码的 JSON 字节串。"""
+    if _ORJSON_AVAILABLE:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass # orjson 不支持的类型 (如超大整数、非字符串键) 交给标准库处理
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=PRETTY_INDENT)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return text.encode("utf-8")
+
+
+def load_file(file_path: str) -> Any:
+    """读取并解析 JSON 文件 (兼容带 BOM 的 UTF-8 文件)。"""
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    if raw.startswith(b"\xef\xbb\xbf"):
+        raw = raw[3:]
+    return loads(raw)
+
+
+def dump_file(obj: Any, file_path: str, pretty: bool = False) -> None:
+    """将对象写入 JSON 文件。默认紧凑格式，pretty=True 时缩进输出。"""
+    payload = dumps_bytes(obj, pretty=pretty)
+    with open(file_path, "wb") as f:
+        f.write(payload)
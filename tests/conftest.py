@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与程序入口一致，以 src 为导入根目录
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,40 @@
+import glob
+import os
+
+import pytest
+
+from core.transcription_parser import TranscriptionParser
+from utils import json_utils
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+
+def _faster_whisper_sample() -> dict:
+    """faster-whisper 的输出: 顶层带 language_probability，词在 segments[].words 中。"""
+    return {
+        "language": "en",
+        "language_probability": 0.98,
+        "segments": [{
+            "id": 0, "seek": 0, "start": 0.0, "end": 1.0, "text": " Hello world.",
+            "avg_logprob": -0.2, "compression_ratio": 1.1, "no_speech_prob": 0.01,
+            "words": [{"start": 0.0, "end": 0.5, "word": " Hello", "probability": 0.9},
+                      {"start": 0.5, "end": 1.0, "word": " world.", "probability": 0.9}],
+        }],
+    }
+
+
+def test_faster_whisper_is_detected_as_whisper():
+    parser = TranscriptionParser()
+    data = _faster_whisper_sample()
+    assert parser.detect_format(data) == "whisper"
+    assert parser.sniff_text_format(json_utils.dumps(data)) == "whisper"
+    assert len(parser.parse(data, "auto").words) == 2
+
+
+@pytest.mark.parametrize("sample_path", sorted(glob.glob(os.path.join(SAMPLES_DIR, "*", "*.json"))))
+def test_bundled_samples_keep_their_format(sample_path):
+    parser = TranscriptionParser()
+    name = os.path.basename(sample_path).lower()
+    expected = next(fmt for fmt in ("elevenlabs", "deepgram", "assemblyai", "whisper") if fmt in name)
+    assert parser.detect_format(json_utils.load_file(sample_path)) == expected
+    assert parser.sniff_file_format(sample_path) == expected
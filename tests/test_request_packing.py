@@ -0,0 +1,92 @@
+import re
+
+import pytest
+
+import config as app_config
+from core import llm_api, llm_cache
+from core.request_packing import format_packed_texts, pack_texts, split_packed_response
+from core.token_estimator import estimate_text_tokens
+
+
+def test_pack_texts_respects_token_and_count_limits():
+    texts = [f"Sentence number {i} is here." for i in range(10)]
+    per_text = estimate_text_tokens(texts[0], "en") + 6 # 含标记行开销
+    packs, unpacked = pack_texts(texts, max_tokens=per_text * 3, language="en", max_texts=20, max_text_ratio=1.0)
+    assert unpacked == []
+    assert [index for pack in packs for index in pack] == list(range(10)) # 保持原顺序
+    assert all(len(pack) <= 3 for pack in packs)
+
+    packs, _ = pack_texts(texts, max_tokens=10_000, language="en", max_texts=4)
+    assert [len(pack) for pack in packs] == [4, 4, 2]
+
+
+def test_pack_texts_leaves_oversize_and_blank_texts_unpacked():
+    texts = ["short one.", "", "word " * 400, "   ", "short two."]
+    packs, unpacked = pack_texts(texts, max_tokens=200, language="en", max_text_ratio=0.5)
+    assert packs == [[0, 4]]
+    assert unpacked == [1, 2, 3]
+
+
+def test_split_packed_response_drops_missing_duplicate_and_unrequested_markers():
+    content = "\n".join([
+        "<<<0>>>", "First a.", "First b.",
+        "<<< 7 >>>", "Not requested.", # 未请求的编号
+        "<<<2>>>", "Third.",
+        "<<<0>>>", "Duplicate of zero.", # 重复的编号
+    ])
+    result = split_packed_response(content, [0, 1, 2])
+    assert result == {0: ["First a.", "First b."], 2: ["Third."]} # 1 缺失，由调用方单独重新请求
+    assert split_packed_response(None, [0]) == {}
+
+
+def test_format_packed_texts_round_trips():
+    body = format_packed_texts([(3, " Hello there. "), (5, "Bye.")])
+    assert split_packed_response(body, [3, 5]) == {3: ["Hello there."], 5: ["Bye."]}
+
+
+@pytest.fixture
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_shared_cache", llm_cache.LlmResponseCache(db_path=str(tmp_path / "cache.sqlite3")))
+
+
+def _completion(content: str) -> dict:
+    return {"choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+
+def _split_sentences(text: str) -> list:
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+
+def test_batch_segmentation_end_to_end(isolated_cache, monkeypatch):
+    texts = ["Alpha one. Alpha two.", "Beta one. Beta two.", "", "Gamma one. Gamma two.", "Delta one."]
+    dropped_index = 3 # 打包响应中故意遗漏该文本的标记
+    requests_seen = {"packed": 0, "single": []}
+
+    def fake_post(target_url, headers, payload, timeout, is_running=lambda: True, on_line=None):
+        system_prompt = payload["messages"][0]["content"]
+        body = payload["messages"][-1]["content"].split("【当前文本块】:\n", 1)[1]
+        if system_prompt.endswith(app_config.LLM_PACKED_PROMPT_SUFFIX):
+            requests_seen["packed"] += 1
+            lines = []
+            for index, segments in split_packed_response(body, range(len(texts))).items():
+                if index == dropped_index: continue
+                lines.append(f"<<<{index}>>>")
+                lines.extend(_split_sentences(" ".join(segments)))
+            return _completion("\n".join(lines))
+        requests_seen["single"].append(body)
+        return _completion("\n".join(_split_sentences(body)))
+
+    monkeypatch.setattr(llm_api, "_post_chat_completion", fake_post)
+    job_options = llm_api.LlmJobOptions.from_config({app_config.USER_LLM_BYPASS_CACHE_KEY: True})
+    results = llm_api.call_llm_api_for_batch_segmentation(
+        "key", texts, "http://127.0.0.1:9/v1/chat/completions#", "m", None, target_language="en", job_options=job_options)
+
+    assert results == [
+        ["Alpha one.", "Alpha two."],
+        ["Beta one.", "Beta two."],
+        [],
+        ["Gamma one.", "Gamma two."], # 经单独分割补回
+        ["Delta one."],
+    ]
+    assert requests_seen["packed"] == 1
+    assert requests_seen["single"] == [texts[dropped_index]]
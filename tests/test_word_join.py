@@ -0,0 +1,37 @@
+import pytest
+
+from core.data_models import TimestampedWord, join_word_texts
+from core.transcription_parser import TranscriptionParser
+
+
+def _deepgram_english_sample() -> dict:
+    """Deepgram 英文转录: 词条之间没有空格词条，标点附在 punctuated_word 上。"""
+    words = [("how", "How", 0.0, 0.2), ("are", "are", 0.2, 0.4), ("you", "you?", 0.4, 0.8),
+             ("i'm", "I'm", 1.2, 1.4), ("fine", "fine,", 1.4, 1.7), ("thanks", "thanks.", 1.7, 2.2)]
+    return {"results": {"channels": [{"alternatives": [{
+        "transcript": "How are you? I'm fine, thanks.",
+        "words": [{"word": punctuated, "punctuated_word": punctuated, "start": start, "end": end} for _, punctuated, start, end in words],
+    }]}]}}
+
+
+def test_deepgram_english_words_are_joined_with_spaces():
+    parsed = TranscriptionParser().parse(_deepgram_english_sample(), "deepgram")
+    assert join_word_texts(parsed.words) == "How are you? I'm fine, thanks."
+
+
+def test_spacing_tokens_and_cjk_are_not_padded():
+    elevenlabs = [TimestampedWord("Hello", 0.0, 0.3), TimestampedWord(" ", 0.3, 0.3), TimestampedWord("world.", 0.3, 0.6)]
+    assert join_word_texts(elevenlabs) == "Hello world."
+    japanese = [TimestampedWord(text, i * 0.1, i * 0.1 + 0.1) for i, text in enumerate(["今日", "は", "晴れ", "。"])]
+    assert join_word_texts(japanese) == "今日は晴れ。"
+    mixed = [TimestampedWord("这是", 0.0, 0.2), TimestampedWord("DeepSeek", 0.2, 0.5), TimestampedWord("模型", 0.5, 0.7)]
+    assert join_word_texts(mixed) == "这是DeepSeek模型"
+
+
+def test_word_ranges_keep_spaces_in_english_subtitles():
+    pytest.importorskip("PyQt6")
+    from core.srt_processor import SrtProcessor
+    parsed = TranscriptionParser().parse(_deepgram_english_sample(), "deepgram")
+    srt = SrtProcessor().process_word_ranges_to_srt(parsed, [(0, 3), (3, 6)])
+    assert "How are you?" in srt
+    assert "I'm fine, thanks." in srt